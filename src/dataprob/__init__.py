@@ -4,7 +4,27 @@ Key public functions and methods for dataprob library.
 """
 
 from .fitters.setup import setup
-from .plot.plot_corner import plot_corner
-from .plot.plot_summary import plot_summary
+from .fitters.batch import batch_fit
+from .model_wrapper.global_model_wrapper import GlobalModelWrapper
 
-from .__version__ import __version__
\ No newline at end of file
+from .__version__ import __version__
+
+# The plotting functions pull in matplotlib and corner, which are slow to 
+# import. Load them the first time they are accessed rather than on import. 
+_LAZY_ATTRIBUTES = {"plot_corner":"dataprob.plot.plot_corner",
+                    "plot_summary":"dataprob.plot.plot_summary"}
+
+def __getattr__(name):
+
+    if name in _LAZY_ATTRIBUTES:
+        import importlib
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name])
+        value = getattr(module,name)
+        globals()[name] = value
+        return value
+
+    err = f"module '{__name__}' has no attribute '{name}'"
+    raise AttributeError(err)
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_ATTRIBUTES.keys()))
@@ -0,0 +1,353 @@
+"""
+Optional numba-compiled model, residual, and log likelihood kernels. numba is
+not a dependency of dataprob; these kernels are only built when a fitter is
+created with engine="numba".
+"""
+
+from dataprob.model_wrapper.vector_model_wrapper import VectorModelWrapper
+from dataprob.model_wrapper._function_processing import get_positional_args
+
+import numpy as np
+
+import sys
+import warnings
+
+def is_numba_function(fcn):
+    """
+    Check whether fcn was compiled by numba (e.g. decorated with @njit).
+
+    Parameters
+    ----------
+    fcn : callable
+        function to check
+
+    Returns
+    -------
+    is_numba : bool
+        True if fcn is a numba dispatcher
+    """
+
+    # A numba function can only exist if numba has already been imported, so
+    # do not import numba just to check.
+    if "numba" not in sys.modules:
+        return False
+
+    from numba.core.dispatcher import Dispatcher
+
+    return isinstance(fcn,Dispatcher)
+
+
+def get_call_spec(model):
+    """
+    Describe how to call the wrapped model by position from a vector of 
+    unfixed parameter values. 
+
+    Parameters
+    ----------
+    model : ModelWrapper or VectorModelWrapper
+        finalized model wrapper
+
+    Returns
+    -------
+    call_spec : list or None
+        one entry per model argument: ("param",i) for unfixed parameter i, 
+        ("const",value) for a fixed parameter or non-fit argument, or 
+        ("vector",all_params,unfixed_index) for the parameter vector of a 
+        VectorModelWrapper. None if the model has arguments that cannot be
+        passed by position. 
+    """
+
+    positional = get_positional_args(model._model_to_fit)
+
+    if issubclass(type(model),VectorModelWrapper):
+        values = model._non_fit_kwargs
+        unfixed = {}
+        call_spec = [("vector",
+                      np.array(model._all_param_vector,dtype=float),
+                      np.flatnonzero(model._unfixed_mask))]
+        positional = positional[1:]
+    else:
+        values = model._mw_kwargs
+        unfixed = {p:i for i, p in enumerate(model._unfixed_param_names)}
+        call_spec = []
+
+    num_used = 0
+    for p in positional:
+        if p not in values:
+            break
+        if p in unfixed:
+            call_spec.append(("param",unfixed[p]))
+        else:
+            call_spec.append(("const",values[p]))
+        num_used += 1
+
+    # Every argument must go by position
+    if num_used != len(values):
+        return None
+
+    return call_spec
+
+
+def _call_specs_match(spec_a,spec_b):
+    """
+    Whether two call specs (from get_call_spec) describe the same call.
+    """
+
+    if spec_a is None or spec_b is None or len(spec_a) != len(spec_b):
+        return False
+
+    for a, b in zip(spec_a,spec_b):
+        if len(a) != len(b) or a[0] != b[0]:
+            return False
+        for x, y in zip(a[1:],b[1:]):
+            if x is y:
+                continue
+            try:
+                if not np.array_equal(x,y):
+                    return False
+            except Exception:
+                return False
+
+    return True
+
+
+def _compile_model_call(fcn,call_spec):
+    """
+    Compile model_call(params), which calls the numba model fcn with the 
+    arguments described by call_spec. Constant arguments are baked into the
+    compiled function. 
+    """
+
+    import numba
+
+    namespace = {"model":fcn}
+    lines = ["def model_call(params):"]
+    args = []
+    for k, entry in enumerate(call_spec):
+
+        if entry[0] == "param":
+            args.append(f"params[{entry[1]}]")
+
+        elif entry[0] == "const":
+            namespace[f"c{k}"] = entry[1]
+            args.append(f"c{k}")
+
+        else:
+            namespace[f"base{k}"] = entry[1]
+            namespace[f"index{k}"] = entry[2]
+            lines.append(f"    v{k} = base{k}.copy()")
+            lines.append(f"    for j in range(index{k}.shape[0]):")
+            lines.append(f"        v{k}[index{k}[j]] = params[j]")
+            args.append(f"v{k}")
+
+    lines.append(f"    return model({', '.join(args)})")
+
+    exec("\n".join(lines),namespace)
+
+    return numba.njit(namespace["model_call"])
+
+
+class NumbaLikelihood:
+    """
+    Model, residual, and log likelihood calculations fused into functions
+    compiled by numba. Each kernel takes the vector of unfixed parameter 
+    values, calls the numba model, and reduces its output to residuals or a
+    log likelihood without returning to python. y_obs, 1/y_std, 1/y_std**2,
+    the normalization constant of the log likelihood, fixed parameter values,
+    and non-fit arguments are baked into the kernels as compile-time 
+    constants. unweighted_residuals_obs takes the observations as an 
+    argument instead (e.g. for bootstrap replicates, which perturb y_obs).
+    Instances can be pickled; the kernels are recompiled when unpickled.
+    """
+
+    def __init__(self,y_obs,y_std,model):
+        """
+        Parameters
+        ----------
+        y_obs : numpy.ndarray
+            observations
+        y_std : numpy.ndarray
+            standard deviation on each observation
+        model : ModelWrapper or VectorModelWrapper
+            finalized model wrapper holding a numba model. every argument to
+            the model must be passable by position (see get_call_spec). 
+        """
+
+        self._y_obs = np.array(y_obs,dtype=float)
+        self._y_std = np.array(y_std,dtype=float)
+        self._model = model
+        self._call_spec = get_call_spec(model)
+        if self._call_spec is None:
+            err = "every argument to the model must be passable by position\n"
+            raise ValueError(err)
+
+        self._compile()
+
+    def _compile(self):
+        """
+        Compile the kernels for the current y_obs, y_std, and model.
+        """
+
+        import numba
+
+        # Closure variables are frozen into the compiled kernels as constants
+        y_obs = self._y_obs.copy()
+        inv_std = 1/self._y_std
+        inv_sigma2 = inv_std**2
+        ln_norm = float(np.sum(np.log(2*np.pi*self._y_std**2)))
+        num_obs = len(y_obs)
+
+        model_call = _compile_model_call(self._model._model_to_fit,
+                                         self._call_spec)
+
+        @numba.njit
+        def calc_unweighted_residuals(y_calc):
+            if y_calc.shape[0] != num_obs:
+                raise ValueError("model output does not match y_obs length")
+            out = np.empty(num_obs)
+            for i in range(num_obs):
+                out[i] = y_calc[i] - y_obs[i]
+            return out
+
+        @numba.njit
+        def calc_weighted_residuals(y_calc):
+            if y_calc.shape[0] != num_obs:
+                raise ValueError("model output does not match y_obs length")
+            out = np.empty(num_obs)
+            for i in range(num_obs):
+                out[i] = (y_calc[i] - y_obs[i])*inv_std[i]
+            return out
+
+        @numba.njit
+        def calc_residuals_obs(y_calc,obs):
+            if y_calc.shape[0] != obs.shape[0]:
+                raise ValueError("model output does not match y_obs length")
+            out = np.empty(obs.shape[0])
+            for i in range(obs.shape[0]):
+                out[i] = y_calc[i] - obs[i]
+            return out
+
+        @numba.njit
+        def calc_ln_like(y_calc):
+            if y_calc.shape[0] != num_obs:
+                raise ValueError("model output does not match y_obs length")
+            total = 0.0
+            for i in range(num_obs):
+                r = y_calc[i] - y_obs[i]
+                total += r*r*inv_sigma2[i]
+            return -0.5*(total + ln_norm)
+
+        @numba.njit
+        def unweighted_residuals(params):
+            return calc_unweighted_residuals(model_call(params))
+
+        @numba.njit
+        def unweighted_residuals_obs(params,obs):
+            return calc_residuals_obs(model_call(params),obs)
+
+        @numba.njit
+        def weighted_residuals(params):
+            return calc_weighted_residuals(model_call(params))
+
+        @numba.njit
+        def ln_like(params):
+            return calc_ln_like(model_call(params))
+
+        @numba.njit
+        def ln_like_batch(params):
+            num_samples = params.shape[0]
+            out = np.empty(num_samples)
+            for j in range(num_samples):
+                out[j] = calc_ln_like(model_call(params[j]))
+            return out
+
+        self.model_call = model_call
+        self.calc_ln_like = calc_ln_like
+        self.unweighted_residuals = unweighted_residuals
+        self.unweighted_residuals_obs = unweighted_residuals_obs
+        self.weighted_residuals = weighted_residuals
+        self.ln_like = ln_like
+        self.ln_like_batch = ln_like_batch
+
+    def matches(self,y_obs,y_std,model):
+        """
+        Whether these kernels were compiled for y_obs, y_std, and the current
+        state of model.
+        """
+
+        if model._model_to_fit is not self._model._model_to_fit:
+            return False
+
+        return (np.array_equal(self._y_obs,y_obs) and
+                np.array_equal(self._y_std,y_std) and
+                _call_specs_match(self._call_spec,get_call_spec(model)))
+
+    def __getstate__(self):
+        return {"_y_obs":self._y_obs,
+                "_y_std":self._y_std,
+                "_model":self._model,
+                "_call_spec":self._call_spec}
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._compile()
+
+
+def build_numba_likelihood(model,y_obs,y_std):
+    """
+    Build fused numba kernels for a fit. If numba is not installed, the
+    wrapped model is not a numba function, or the model cannot be called 
+    from compiled code, warn and return None so the fitter uses numpy.
+
+    Parameters
+    ----------
+    model : ModelWrapper or VectorModelWrapper
+        finalized model wrapper for the fit
+    y_obs : numpy.ndarray
+        observations
+    y_std : numpy.ndarray
+        standard deviation on each observation
+
+    Returns
+    -------
+    likelihood : NumbaLikelihood or None
+        compiled kernels or None if falling back to numpy
+    """
+
+    try:
+        import numba
+    except ImportError:
+        w = "\n\nengine='numba' was requested but numba is not installed.\n"
+        w += "Falling back to engine='numpy'.\n\n"
+        warnings.warn(w)
+        return None
+
+    model_to_fit = getattr(model,"_model_to_fit",None)
+    if not is_numba_function(model_to_fit):
+        w = "\n\nengine='numba' requires a model compiled by numba (e.g. a\n"
+        w += "function decorated with @numba.njit). Falling back to\n"
+        w += "engine='numpy'.\n\n"
+        warnings.warn(w)
+        return None
+
+    if get_call_spec(model) is None:
+        w = "\n\nengine='numba' requires that every argument to the model can\n"
+        w += "be passed by position. Falling back to engine='numpy'.\n\n"
+        warnings.warn(w)
+        return None
+
+    # Compile now, calling the kernel with the parameter guesses, so a model
+    # that cannot be called from compiled code (e.g. a non-fit argument numba
+    # cannot handle) falls back here rather than failing mid-fit. 
+    likelihood = NumbaLikelihood(y_obs=y_obs,y_std=y_std,model=model)
+    guesses = np.array(model.param_df.loc[model.unfixed_mask,"guess"],
+                       dtype=float)
+    try:
+        likelihood.ln_like(guesses)
+    except Exception as e:
+        w = "\n\nengine='numba' could not compile the model call:\n\n"
+        w += f"{e}\n\nFalling back to engine='numpy'.\n\n"
+        warnings.warn(w)
+        return None
+
+    return likelihood
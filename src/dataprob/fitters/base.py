@@ -4,20 +4,31 @@ Fitter base class allowing different classes of fits.
 
 from dataprob.util.check import check_array
 from dataprob.util.check import check_int
+from dataprob.util.check import check_float
+from dataprob.util.check import check_bool
 
 from dataprob.model_wrapper.model_wrapper import ModelWrapper
 from dataprob.model_wrapper.wrap_function import wrap_function
 from dataprob.util.read_spreadsheet import read_spreadsheet
 
 from dataprob.util.get_fit_quality import get_fit_quality
+from dataprob.util.stats import get_sample_intervals
+from dataprob.fitters._numba_engine import build_numba_likelihood
+from dataprob.util.sample_store import SampleStore
+from dataprob.util.sample_store import check_sample_dtype
+from dataprob.util.sample_file import write_sample_file
+from dataprob.util.sample_file import read_sample_file
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
-import pickle
 import os
 import copy
 
+# Allowed ways to calculate residuals and log likelihoods
+_ENGINES = ["numpy","numba"]
+
 def _pretty_zeropad_str(N):
     """
     Make a string zero-pad based on the number of digits in a number.
@@ -27,6 +38,57 @@ def _pretty_zeropad_str(N):
     fmt_string = "s{:0" + f"{num_digits}" + "d}"
     return fmt_string
 
+def _get_least_squares_kwargs(model,least_squares_kwargs,inv_std=None):
+    """
+    Build the keyword arguments for a scipy.optimize.least_squares fit of 
+    model, where the function being minimized is (y_obs - model)*inv_std. If
+    the model has an analytic Jacobian, use it rather than finite 
+    differences. Otherwise, if the model declares which parameters each 
+    observation depends on, use this for finite differences and solve the 
+    trust region problem with the sparse lsmr solver. Anything the user set
+    in least_squares_kwargs takes precedence. 
+
+    Parameters
+    ----------
+    model : ModelWrapper
+        finalized model wrapper being fit
+    least_squares_kwargs : dict
+        keyword arguments passed in by the user. This is not modified. 
+    inv_std : numpy.ndarray, optional
+        1/y_std for each observation. If None, the residuals are unweighted.
+
+    Returns
+    -------
+    least_squares_kwargs : dict
+        copy of least_squares_kwargs with jac or jac_sparsity/tr_solver 
+        added as appropriate
+    """
+
+    least_squares_kwargs = dict(least_squares_kwargs)
+    if "jac" in least_squares_kwargs:
+        return least_squares_kwargs
+
+    # d/dparam of (y_obs - model)*inv_std is -J*inv_std. The Jacobian may
+    # be sparse.
+    if model.jacobian is not None:
+        if inv_std is None:
+            def jac(param): return -model.fast_jacobian(param)
+        else:
+            def jac(param):
+                J = model.fast_jacobian(param)
+                if sparse.issparse(J):
+                    return -sparse.diags(inv_std) @ J
+                return -J*inv_std[:,None]
+        least_squares_kwargs["jac"] = jac
+        return least_squares_kwargs
+
+    if model.jac_sparsity is not None:
+        least_squares_kwargs.setdefault("jac_sparsity",model.jac_sparsity)
+        if least_squares_kwargs["jac_sparsity"] is not None:
+            least_squares_kwargs.setdefault("tr_solver","lsmr")
+
+    return least_squares_kwargs
+
 
 class Fitter:
     """
@@ -37,7 +99,11 @@ class Fitter:
                  some_function,
                  fit_parameters=None,
                  non_fit_kwargs=None,
-                 vector_first_arg=False):
+                 vector_first_arg=False,
+                 vectorized=False,
+                 jacobian_function=None,
+                 jac_sparsity=None,
+                 engine="numpy"):
         """
         Initialize the fitter.
 
@@ -58,8 +124,38 @@ class Fitter:
             parameters to fit. All other arguments to some_function are treated as 
             non-fittable parameters. fit_parameters must then specify the names of
             each vector element. 
+        vectorized : bool, default=False
+            If True, some_function can evaluate many parameter sets in a 
+            single call. See ModelWrapper.vectorized for details. Ignored if
+            some_function is already a ModelWrapper instance. 
+        jacobian_function : callable, optional
+            Function that takes the same arguments as some_function and 
+            returns the derivative of its output with respect to each fit 
+            parameter as a (num_obs,num_params) array. See 
+            ModelWrapper.jacobian for details. Ignored if some_function is 
+            already a ModelWrapper instance. 
+        jac_sparsity : array-like or scipy.sparse matrix, optional
+            (num_obs,num_params) array whose nonzero entries mark which fit 
+            parameters each observation depends on. See 
+            ModelWrapper.jac_sparsity for details. Ignored if some_function 
+            is already a ModelWrapper instance. 
+        engine : str, default="numpy"
+            how to calculate residuals and log likelihoods. "numpy" or 
+            "numba". See the ``engine`` property for details. 
         """
 
+        # Compiled likelihood kernels (engine="numba"). Built by fit(). 
+        self._numba_likelihood = None
+
+        # Constants calculated from y_obs and y_std. Set with data_df. 
+        self._obs_constants = None
+
+        # How samples are stored. See set_sample_storage. 
+        self._sample_store = None
+        self._sample_file = None
+        self._sample_dtype = np.dtype(np.float64)
+        self.engine = engine
+
         # Load the model. Copy in ModelWrapper if passed in; otherwise, create
         # from arguments. 
         if issubclass(type(some_function),ModelWrapper):
@@ -68,7 +164,10 @@ class Fitter:
             self._model = wrap_function(some_function=some_function,
                                         fit_parameters=fit_parameters,
                                         non_fit_kwargs=non_fit_kwargs,
-                                        vector_first_arg=vector_first_arg)
+                                        vector_first_arg=vector_first_arg,
+                                        vectorized=vectorized,
+                                        jacobian_function=jacobian_function,
+                                        jac_sparsity=jac_sparsity)
         
         # Initialize the fit df now that we have a model
         self._initialize_fit_df()
@@ -78,6 +177,9 @@ class Fitter:
         # fit results.
         self._fit_has_been_run = False
 
+        # Cache for results (data_df, fit_quality) calculated from the fit
+        self._clear_result_cache()
+
     def _sanity_check(self,call_string,attributes_to_check):
         """
         Do a sanity check before doing model calculations.
@@ -169,10 +271,78 @@ class Fitter:
         # Finalize model
         self._model.finalize_params()
 
+        # Build compiled likelihood kernels if requested
+        self._setup_engine()
+
         # Run the fit
         self._fit(**kwargs)
 
         self._fit_has_been_run = True
+        self._clear_result_cache()
+
+    def _setup_engine(self):
+        """
+        Build the numba likelihood kernels for the current y_obs, y_std, and
+        model if engine is "numba". Existing kernels are reused if none of 
+        these have changed. Falls back to numpy (with a warning) if numba or a
+        numba-compiled model is not available. 
+        """
+
+        if self._engine != "numba":
+            self._numba_likelihood = None
+            return
+
+        if self._numba_likelihood is not None:
+            if self._numba_likelihood.matches(self._y_obs,
+                                              self._y_std,
+                                              self._model):
+                return
+
+        self._numba_likelihood = build_numba_likelihood(model=self._model,
+                                                        y_obs=self._y_obs,
+                                                        y_std=self._y_std)
+
+    def _set_obs_constants(self):
+        """
+        Calculate 1/y_std, 1/y_std**2, and the normalization term of the log
+        likelihood, sum(ln(2*pi*y_std**2)). These do not change during a fit,
+        so they are calculated once rather than on every likelihood call. 
+        """
+
+        # Raises an error if y_std is not set, like a direct calculation would
+        inv_std = 1/self._y_std
+
+        # Make sure constants have one entry per observation, even if y_std
+        # is a single value
+        inv_std = np.array(np.broadcast_to(inv_std,np.shape(self._y_obs)),
+                           dtype=float)
+        inv_sigma2 = inv_std**2
+        ln_norm = np.sum(np.log(2*np.pi/inv_sigma2))
+
+        self._obs_constants = (self._y_obs,self._y_std,
+                               inv_std,inv_sigma2,ln_norm)
+
+    def _get_obs_constants(self):
+        """
+        Get the constants calculated by _set_obs_constants. These are only
+        recalculated if y_obs or y_std have been replaced. 
+
+        Returns
+        -------
+        inv_std : numpy.ndarray
+            1/y_std
+        inv_sigma2 : numpy.ndarray
+            1/y_std**2
+        ln_norm : float
+            sum(ln(2*pi*y_std**2))
+        """
+
+        c = self._obs_constants
+        if c is None or c[0] is not self._y_obs or c[1] is not self._y_std:
+            self._set_obs_constants()
+            c = self._obs_constants
+
+        return c[2], c[3], c[4]
 
     def _fit(self,**kwargs):
         """
@@ -201,6 +371,9 @@ class Fitter:
             difference between observed and calculated values
         """
 
+        if self._numba_likelihood is not None:
+            return self._numba_likelihood.unweighted_residuals(param)
+
         y_calc = self._model.fast_model(param)
         return y_calc - self._y_obs
 
@@ -244,8 +417,12 @@ class Fitter:
             standard deviation
         """
 
+        if self._numba_likelihood is not None:
+            return self._numba_likelihood.weighted_residuals(param)
+
         y_calc = self._model.fast_model(param)
-        return (y_calc - self._y_obs)/self._y_std
+        inv_std, _, _ = self._get_obs_constants()
+        return (y_calc - self._y_obs)*inv_std
 
     def weighted_residuals(self,param):
         """
@@ -287,9 +464,36 @@ class Fitter:
             log likelihood 
         """
 
+        if self._numba_likelihood is not None:
+            return self._numba_likelihood.ln_like(param)
+
         y_calc = self._model.fast_model(param)
-        sigma2 = self._y_std**2
-        return -0.5*(np.sum((y_calc - self._y_obs)**2/sigma2 + np.log(2*np.pi*sigma2)))
+        inv_std, _, ln_norm = self._get_obs_constants()
+        weighted = (y_calc - self._y_obs)*inv_std
+        return -0.5*(np.dot(weighted,weighted) + ln_norm)
+
+    def _ln_like_batch(self,params):
+        """
+        Private log likelihood for many parameter sets, no error checking.
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            float array of parameters with shape (num_samples,num_params)
+
+        Returns
+        -------
+        ln_like : numpy.ndarray
+            log likelihood for each parameter set (shape (num_samples,))
+        """
+
+        if self._numba_likelihood is not None:
+            return self._numba_likelihood.ln_like_batch(params)
+
+        y_calc = self._model.fast_model_batch(params)
+        _, inv_sigma2, ln_norm = self._get_obs_constants()
+        diff = y_calc - self._y_obs
+        return -0.5*((diff*diff) @ inv_sigma2 + ln_norm)
 
     def ln_like(self,param):
         """
@@ -324,6 +528,15 @@ class Fitter:
 
         return self._model.model
 
+    @property
+    def model_batch(self):
+        """
+        Model to use for calculating y_calc for many parameter sets at once. 
+        Takes a (num_samples,num_params) array and returns a 
+        (num_samples,num_obs) array. 
+        """
+
+        return self._model.model_batch
              
     @property
     def y_obs(self):
@@ -359,10 +572,16 @@ class Fitter:
     @param_df.setter
     def param_df(self,param_df):
         self._model.param_df = param_df
+        self._clear_result_cache()
     
     @property
     def data_df(self):
 
+        # Return cached result if nothing has changed since it was calculated
+        out_df, cache_key = self._get_cached_result("data_df")
+        if out_df is not None:
+            return out_df.copy()
+
         out = {}
         
         y_obs = self.y_obs
@@ -404,7 +623,10 @@ class Fitter:
             except Exception as e:
                 pass
         
-        return pd.DataFrame(out)
+        out_df = pd.DataFrame(out)
+        self._set_cached_result("data_df",cache_key,out_df)
+
+        return out_df.copy()
 
     @data_df.setter
     def data_df(self,data_df):
@@ -447,9 +669,12 @@ class Fitter:
         # Store y_obs and y_std
         self._y_obs = np.array(data_df["y_obs"],dtype=float)
         self._y_std = np.array(data_df["y_std"],dtype=float)
+        self._set_obs_constants()
 
         # new y_obs, fit has not been run yet
+        self._numba_likelihood = None
         self._fit_has_been_run = False
+        self._clear_result_cache()
 
     @property
     def non_fit_kwargs(self):
@@ -460,6 +685,103 @@ class Fitter:
         
         return self._model.non_fit_kwargs
 
+    @property
+    def engine(self):
+        """
+        How residuals and log likelihoods are calculated. "numpy" (default)
+        uses numpy array operations. "numba" compiles kernels with numba that
+        call the model and reduce its output to residuals or a log likelihood
+        in one compiled function, with y_obs, y_std, fixed parameters, and 
+        non-fit arguments baked in as constants. The numba engine requires
+        numba and a model compiled by numba (e.g. decorated with
+        ``@numba.njit``) whose arguments can all be passed by position; 
+        otherwise, the fitter warns and uses numpy.
+        """
+
+        return self._engine
+
+    @engine.setter
+    def engine(self,engine):
+
+        if not issubclass(type(engine),str) or engine not in _ENGINES:
+            err = f"engine should be one of {_ENGINES}\n"
+            raise ValueError(err)
+
+        self._engine = engine
+        self._numba_likelihood = None
+
+    def _clear_result_cache(self):
+        """
+        Forget any cached data_df and fit_quality results. 
+        """
+
+        self._result_cache = {}
+
+    def _get_result_cache_key(self):
+        """
+        Get the objects the cached results depend on: the validated parameters
+        recorded by the model, y_obs, y_std, and fit success. The model records
+        a new copy of its parameters whenever param_df or non_fit_kwargs 
+        change (including in-place edits), so these can be compared by 
+        identity. 
+
+        Returns
+        -------
+        cache_key : tuple or None
+            objects describing the current state, or None if the state 
+            cannot be determined (e.g. param_df is not valid)
+        """
+
+        try:
+            self._model.finalize_params()
+        except Exception:
+            return None
+        
+        return (self._model._finalized_param_df,
+                self.y_obs,
+                self.y_std,
+                self.success)
+
+    def _get_cached_result(self,name):
+        """
+        Get a cached result if it was calculated with the current state. 
+
+        Parameters
+        ----------
+        name : str
+            name of cached result
+
+        Returns
+        -------
+        result : object or None
+            cached result (None if not cached or out of date)
+        cache_key : tuple or None
+            current cache key. pass to _set_cached_result after calculating
+            a new result. 
+        """
+
+        cache_key = self._get_result_cache_key()
+        if cache_key is None or name not in self._result_cache:
+            return None, cache_key
+        
+        cached_key, result = self._result_cache[name]
+        for a, b in zip(cached_key,cache_key):
+            if a is not b:
+                return None, cache_key
+        
+        return result, cache_key
+
+    def _set_cached_result(self,name,cache_key,result):
+        """
+        Cache a result calculated with the state described by cache_key. 
+        Does nothing if cache_key is None. 
+        """
+
+        if cache_key is None:
+            return
+        
+        self._result_cache[name] = (cache_key,result)
+
     def _initialize_fit_df(self):
 
         df = pd.DataFrame({"name":self.param_df["name"]})
@@ -477,6 +799,69 @@ class Fitter:
 
         self._fit_df = df
 
+    def _set_extra_intervals(self,extra_intervals):
+        """
+        Validate and store the credibility interval levels to report in 
+        fit_df in addition to the 95% interval.
+
+        Parameters
+        ----------
+        extra_intervals : list-like or None
+            interval levels as percentages (0 < level < 100)
+        """
+
+        if extra_intervals is None:
+            extra_intervals = []
+
+        if not hasattr(extra_intervals,"__iter__") or issubclass(type(extra_intervals),str):
+            err = "extra_intervals should be a list of interval levels (percent)\n"
+            raise ValueError(err)
+
+        levels = []
+        for level in extra_intervals:
+            level = check_float(value=level,
+                                variable_name="extra_intervals entries",
+                                minimum_allowed=0,
+                                maximum_allowed=100,
+                                minimum_inclusive=False,
+                                maximum_inclusive=False)
+            if level != 95 and level not in levels:
+                levels.append(level)
+
+        self._extra_intervals = levels
+
+    def _update_fit_df_intervals(self,samples,unfixed):
+        """
+        Write credibility intervals calculated from samples into fit_df. This
+        writes low_95 and high_95, as well as low_{level} and high_{level} 
+        columns for any extra interval levels set when fit was called.
+
+        Parameters
+        ----------
+        samples : numpy.ndarray
+            samples array with dimensions (num_samples,num_unfixed_params)
+        unfixed : numpy.ndarray
+            boolean mask selecting the unfixed parameters in fit_df
+        """
+
+        levels = [95] + list(getattr(self,"_extra_intervals",[]))
+        intervals = get_sample_intervals(samples,levels=levels)
+
+        # Drop interval columns from earlier fits that are no longer requested
+        for col in list(self._fit_df.columns):
+            if col.startswith("low_") or col.startswith("high_"):
+                if col not in intervals:
+                    self._fit_df.drop(columns=col,inplace=True)
+
+        # Put new interval columns after high_95
+        position = list(self._fit_df.columns).index("high_95") + 1
+        for col in intervals:
+            if col not in self._fit_df.columns:
+                self._fit_df.insert(position,col,np.nan)
+                position += 1
+
+            self._fit_df.loc[unfixed,col] = intervals[col]
+
     def _update_fit_df(self):
         """
         Should be redefined in subclass. This function should update 
@@ -501,6 +886,11 @@ class Fitter:
         if not self.success:
             return None
 
+        # Return cached result if nothing has changed since it was calculated
+        out_df, cache_key = self._get_cached_result("fit_quality")
+        if out_df is not None:
+            return out_df.copy()
+
         estimate = np.array(self.fit_df.loc[self._model.unfixed_mask,
                                             "estimate"],dtype=float).copy()
 
@@ -508,8 +898,9 @@ class Fitter:
                                  num_param=estimate.shape[0],
                                  lnL=self.ln_like(estimate),
                                  success=self.success)
+        self._set_cached_result("fit_quality",cache_key,out_df)
 
-        return out_df
+        return out_df.copy()
 
 
 
@@ -518,7 +909,8 @@ class Fitter:
         """
         Samples of fit parameters. If fit has been run and generated samples, 
         this will be a float numpy array with a shape (num_samples,num_param). 
-        Otherwise, is None. 
+        If samples are stored on disk (see set_sample_storage), this is a 
+        read-only numpy.memmap of the sample file. Otherwise, is None. 
         """
 
         try:
@@ -526,14 +918,92 @@ class Fitter:
         except AttributeError:
             return None
 
+    def set_sample_storage(self,sample_file=None,dtype=np.float64):
+        """
+        Set how samples generated by the fit are stored. By default, samples
+        are held in memory as float64. Any existing samples are copied into
+        the new storage. 
+
+        Parameters
+        ----------
+        sample_file : str, optional
+            .npy file to write samples to as they are generated. The samples
+            property is then a read-only memory map of this file, so the 
+            samples do not need to fit in memory. The file must not already
+            exist. If None, samples are held in memory. 
+        dtype : numpy.dtype, default=numpy.float64
+            dtype used to store samples (float64 or float32). float32 halves
+            the memory or disk space used by the samples. 
+
+        Notes
+        -----
+        This applies to bootstrap and Bayesian samples and to samples added
+        with append_samples. MLFitter draws its samples from the parameter 
+        covariance matrix when they are requested and does not use this 
+        storage. 
+        """
+
+        dtype = check_sample_dtype(dtype)
+
+        if sample_file is not None:
+            sample_file = str(sample_file)
+            if os.path.exists(sample_file):
+                err = f"{sample_file} exists.\n"
+                raise FileExistsError(err)
+
+        self._sample_file = sample_file
+        self._sample_dtype = dtype
+        self._sample_store = None
+
+        # Move existing samples into the new storage
+        samples = getattr(self,"_samples",None)
+        if samples is not None:
+            self._samples = None
+            self._add_samples(np.asarray(samples))
+            self._clear_result_cache()
+
+    def _add_samples(self,new_samples):
+        """
+        Add new samples to the fit, growing the sample storage set by 
+        set_sample_storage. This does not update fit_df. 
+
+        Parameters
+        ----------
+        new_samples : numpy.ndarray
+            float array with shape (num_new_samples,num_params)
+        """
+
+        if self._sample_store is None:
+            self._sample_store = SampleStore(num_params=new_samples.shape[1],
+                                             dtype=self._sample_dtype,
+                                             filename=self._sample_file)
+        store = self._sample_store
+
+        # Start over if there are no samples yet. If the samples were set 
+        # directly rather than through the store, copy them in first. 
+        samples = getattr(self,"_samples",None)
+        if samples is None:
+            store.clear(num_params=new_samples.shape[1])
+        elif not store.holds(samples):
+            samples = np.asarray(samples)
+            store.clear(num_params=samples.shape[1])
+            store.append(samples)
+
+        self._samples = store.append(new_samples)
+
     def write_samples(self,output_file):
         """
-        Write the samples from the fit out to a pickle file.
+        Write the samples from the fit out to a .npy sample file. The file
+        holds a structured array with one field per unfixed parameter (named
+        by the parameter) and, if the fit recorded them, an "lnprob" field 
+        with the log probability of each sample. It can be read without 
+        copying using ``np.load(output_file,mmap_mode="r")`` and grown with
+        ``dataprob.util.sample_file.append_sample_file``.
 
         Parameters
         ----------
         output_file : str
-            output pickle file to write to
+            output .npy file to write to
         """
 
         # See if the file exists already.
@@ -542,20 +1012,31 @@ class Fitter:
             raise FileExistsError(err)
 
         # If there are samples, write them out.
-        if self.samples is not None:
-            with open(output_file,"wb") as p:
-                pickle.dump(self.samples,p)
+        samples = self.samples
+        if samples is not None:
+
+            lnprob = getattr(self,"_lnprob",None)
+            if lnprob is not None and len(lnprob) != len(samples):
+                lnprob = None
+
+            write_sample_file(output_file,
+                              samples=samples,
+                              param_names=self._unfixed_param_names,
+                              lnprob=lnprob)
 
     def append_samples(self,sample_file=None,sample_array=None):
         """
         Append samples to the fit.  The new samples must be a float array
         with the shape: num_samples, num_parameters. This can come from a
-        pickle file (sample_file) or array.  Only one of these can be specified.
+        .npy file (sample_file) or array.  Only one of these can be specified.
 
         Parameters
         ----------
         sample_file : str
-            Pickle file of the numpy array
+            .npy file written by write_samples, or a .npy file holding a 
+            (num_samples,num_parameters) float array. If the file records 
+            parameter names, they must match the unfixed parameters of the
+            fit. Log probabilities recorded in the file are kept. 
         sample_array : numpy.ndarray
             array of samples
         """
@@ -576,20 +1057,24 @@ class Fitter:
             raise ValueError(err)
 
         # Read sample file
+        new_lnprob = None
         if sample_file is not None:
 
-            try:
-                sample_array = pickle.load(open(sample_file,"rb"))
-            except FileNotFoundError:
-                err = f"'{sample_file}'  does not exist.\n"
-                raise FileNotFoundError(err)
-            except pickle.UnpicklingError:
-                err = f"'{sample_file}' does not appear to be a pickle file.\n"
-                raise pickle.UnpicklingError(err)
-
-        # Check sanity of sample_array;
+            sample_array, param_names, new_lnprob = read_sample_file(sample_file,
+                                                                     mmap_mode="r")
+
+            if param_names is not None and param_names != self._unfixed_param_names:
+                err = f"parameters in '{sample_file}' ({param_names}) do not\n"
+                err += f"match the unfixed parameters in the fit ({self._unfixed_param_names})\n"
+                raise ValueError(err)
+
+        # Check sanity of sample_array. A float array (e.g. a memory-mapped
+        # view of sample_file) is not copied here; _add_samples copies it 
+        # once into the sample storage. 
         try:
-            sample_array = np.array(sample_array,dtype=float)
+            sample_array = np.asarray(sample_array)
+            if sample_array.dtype.kind != "f":
+                sample_array = sample_array.astype(float)
         except Exception as e:
             err = "sample_array should be a float numpy array\n"
             raise ValueError(err) from e
@@ -602,12 +1087,20 @@ class Fitter:
             err = "sample_array should have dimensions (num_samples,num_params)\n"
             raise ValueError(err)
 
-        # Concatenate the new samples to the existing samples
-        self._samples = np.concatenate((self.samples,sample_array))
+        # Add the new samples to the existing samples
+        self._add_samples(sample_array)
+
+        # Keep the log probability array (if any) aligned with the samples. 
+        # Appended samples without a recorded log probability get nan. 
+        if getattr(self,"_lnprob",None) is not None:
+            if new_lnprob is None:
+                new_lnprob = np.full(sample_array.shape[0],np.nan)
+            self._lnprob = np.concatenate((self._lnprob,new_lnprob))
 
         self._update_fit_df()
+        self._clear_result_cache()
 
-    def get_sample_df(self,num_samples=100):
+    def get_sample_df(self,num_samples=100,as_array=False):
         """
         Create a dataframe with y_calc for samples from parameter uncertainty as
         columns. The output dataframe will have the columns 'y_obs', 'y_std',
@@ -621,17 +1114,52 @@ class Fitter:
         ----------
         num_samples : int
             number of samples to take. 
+        as_array : bool, default=False
+            if True, return only the sampled model outputs as a float numpy
+            array with shape (num_obs,num_taken) rather than a dataframe. This
+            array is the s0-sn columns of the dataframe, in the same order. If
+            no samples have been generated, the array has zero columns. 
 
         Returns
         -------
-        sample_df : pandas.DataFrame
+        sample_df : pandas.DataFrame or numpy.ndarray
             dataframe with y_obs, y_calc, and values sampled from likelihood
-            surface. 
+            surface (or numpy array of sampled values if as_array is True). 
         """
 
         num_samples = check_int(value=num_samples,
                                 variable_name="num_samples",
                                 minimum_allowed=0)
+        as_array = check_bool(value=as_array,
+                              variable_name="as_array")
+
+        # Select which samples to use
+        samples = self.samples
+        if samples is None or num_samples == 0:
+            i_values = np.zeros(0,dtype=int)
+        else:
+            N = samples.shape[0]
+            if num_samples >= N:
+                i_values = np.arange(N)
+            elif num_samples == 1:
+                i_values = np.zeros(1,dtype=int)
+            else:
+                i_values = np.arange(0,N,N//(num_samples-1))
+
+        # Calculate the model for all selected samples in a single batch.
+        # sample_values has shape (num_obs,num_taken).
+        if len(i_values) > 0:
+            sample_values = self.model_batch(samples[i_values]).T
+        else:
+            sample_values = None
+
+        if as_array:
+            if sample_values is None:
+                num_obs = self.num_obs
+                if num_obs is None:
+                    num_obs = 0
+                sample_values = np.zeros((num_obs,0),dtype=float)
+            return sample_values
 
         # Out dictionary
         out = {}
@@ -654,22 +1182,28 @@ class Fitter:
             estimate = np.array(self.fit_df["guess"],dtype=float).copy()
             out["y_calc"] = self.model(estimate)
 
-        samples = self.samples
-        if samples is not None:
-            
-            N = samples.shape[0]
-            fmt_string = _pretty_zeropad_str(N)
+        out_df = pd.DataFrame(out)
+        if sample_values is None:
+            return out_df
 
-            if num_samples >= N:
-                i_values = np.arange(N)
-            else:
-                i_values = range(0,N,N//(num_samples-1))
+        # Build all sample columns at once and stick on the end
+        fmt_string = _pretty_zeropad_str(samples.shape[0])
+        keys = [fmt_string.format(i) for i in i_values]
+        sample_df = pd.DataFrame(sample_values,
+                                 columns=keys,
+                                 index=out_df.index)
 
-            for i in i_values:
-                key = fmt_string.format(i)
-                out[key] = self.model(self.samples[i])
-    
-        return pd.DataFrame(out)
+        return pd.concat([out_df,sample_df],axis=1)
+
+    @property
+    def _unfixed_param_names(self):
+        """
+        Names of the unfixed parameters, in the order of the columns of 
+        samples. 
+        """
+
+        return [str(p) for p in
+                self._model.param_df.index[self._model.unfixed_mask]]
 
     @property
     def num_params(self):
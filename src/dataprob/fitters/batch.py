@@ -0,0 +1,333 @@
+"""
+Function for fitting one model to many independent datasets by maximum
+likelihood.
+"""
+
+from dataprob.fitters.base import _get_least_squares_kwargs
+from dataprob.fitters.ml import _get_covariance_from_jac
+from dataprob.model_wrapper.model_wrapper import ModelWrapper
+from dataprob.model_wrapper.wrap_function import wrap_function
+from dataprob.util.worker_pool import get_num_workers
+from dataprob.util.worker_pool import map_in_pool
+
+import numpy as np
+import pandas as pd
+import scipy.optimize as optimize
+from scipy import special
+
+import copy
+import warnings
+
+def _fit_dataset(y_obs,
+                 y_std,
+                 model,
+                 guesses,
+                 bounds,
+                 least_squares_kwargs):
+    """
+    Fit the model to a single dataset by maximum likelihood.
+
+    Parameters
+    ----------
+    y_obs : numpy.ndarray
+        observations for this dataset
+    y_std : numpy.ndarray
+        standard deviation on each observation
+    model : ModelWrapper
+        finalized model wrapper to fit
+    guesses : numpy.ndarray
+        starting values for the unfixed parameters
+    bounds : numpy.ndarray
+        (2,num_unfixed) array of lower and upper bounds
+    least_squares_kwargs : dict
+        keyword arguments passed to scipy.optimize.least_squares
+
+    Returns
+    -------
+    estimate : numpy.ndarray
+        fit parameters. all nan if least_squares threw an error.
+    std : numpy.ndarray
+        standard error on each fit parameter. all nan if the Jacobian was
+        singular.
+    success : bool
+        whether the fit succeeded
+    problem : str or None
+        description of any problem with the fit
+    """
+
+    inv_std = 1/y_std
+    def fn(param): return (y_obs - model.fast_model(param))*inv_std
+
+    # Use an analytic Jacobian or the declared sparsity structure if the
+    # model has them
+    least_squares_kwargs = _get_least_squares_kwargs(model,
+                                                     least_squares_kwargs,
+                                                     inv_std=inv_std)
+
+    nan_params = np.nan*np.ones(len(guesses),dtype=float)
+
+    try:
+        fit = optimize.least_squares(fn,
+                                     x0=guesses,
+                                     bounds=bounds,
+                                     **least_squares_kwargs)
+    except Exception as e:
+        return nan_params, nan_params, False, str(e)
+
+    try:
+        cov = _get_covariance_from_jac(fit.jac)
+        std = np.sqrt(np.diagonal(cov))
+        problem = None
+    except np.linalg.LinAlgError:
+        std = nan_params
+        problem = "singular Jacobian"
+
+    return fit.x, std, bool(fit.success), problem
+
+
+def _process_batch_obs(y_obs,y_std,dataset_column):
+    """
+    Convert the batch observations into (num_datasets,num_obs) y_obs and y_std
+    arrays.
+
+    Parameters
+    ----------
+    y_obs : numpy.ndarray or pandas.DataFrame
+        (num_datasets,num_obs) array of observations or a long-format
+        dataframe with dataset_column, y_obs, and y_std columns
+    y_std : numpy.ndarray or float or None
+        standard deviation on the observations. must be None if y_obs is a
+        dataframe
+    dataset_column : str
+        name of the dataset id column if y_obs is a dataframe
+
+    Returns
+    -------
+    dataset_ids : numpy.ndarray
+        id of each dataset
+    y_obs : numpy.ndarray
+        float array with shape (num_datasets,num_obs)
+    y_std : numpy.ndarray
+        float array with shape (num_datasets,num_obs)
+    """
+
+    if issubclass(type(y_obs),pd.DataFrame):
+
+        if y_std is not None:
+            err = "y_std must be a column in the y_obs dataframe, not a\n"
+            err += "separate argument\n"
+            raise ValueError(err)
+
+        df = y_obs
+        for c in [dataset_column,"y_obs","y_std"]:
+            if c not in df.columns:
+                err = f"y_obs dataframe must have a '{c}' column\n"
+                raise ValueError(err)
+
+        # Datasets in order of first appearance
+        dataset_ids = pd.unique(df[dataset_column])
+        groups = df.groupby(dataset_column,sort=False)
+
+        num_obs = groups.size()
+        if len(np.unique(num_obs)) != 1:
+            err = "all datasets must have the same number of observations\n"
+            raise ValueError(err)
+
+        y_obs = np.array([groups.get_group(d)["y_obs"] for d in dataset_ids],
+                         dtype=float)
+        y_std = np.array([groups.get_group(d)["y_std"] for d in dataset_ids],
+                         dtype=float)
+
+    else:
+
+        try:
+            y_obs = np.array(y_obs,dtype=float)
+        except Exception as e:
+            err = "y_obs must be a float array with shape (num_datasets,num_obs)\n"
+            raise ValueError(err) from e
+
+        if len(y_obs.shape) != 2:
+            err = "y_obs must be a float array with shape (num_datasets,num_obs)\n"
+            raise ValueError(err)
+
+        if y_std is None:
+            err = "y_std must be specified\n"
+            raise ValueError(err)
+
+        try:
+            y_std = np.broadcast_to(np.array(y_std,dtype=float),y_obs.shape).copy()
+        except Exception as e:
+            err = "y_std must be a float or a float array that can be broadcast\n"
+            err += "to the shape of y_obs (num_datasets,num_obs)\n"
+            raise ValueError(err) from e
+
+        dataset_ids = np.arange(y_obs.shape[0])
+
+    for name, value in [("y_obs",y_obs),("y_std",y_std)]:
+        if not np.all(np.isfinite(value)):
+            err = f"{name} must not contain nan or infinite values\n"
+            raise ValueError(err)
+
+    if np.sum(y_std <= 0) > 0:
+        err = "all y_std values must be > 0\n"
+        raise ValueError(err)
+
+    return dataset_ids, y_obs, y_std
+
+
+def batch_fit(some_function,
+              y_obs,
+              y_std=None,
+              fit_parameters=None,
+              non_fit_kwargs=None,
+              vector_first_arg=False,
+              vectorized=False,
+              jacobian_function=None,
+              jac_sparsity=None,
+              dataset_column="dataset",
+              num_workers=1,
+              **least_squares_kwargs):
+    """
+    Fit one model to many independent datasets by maximum likelihood. The
+    model is wrapped and validated once and then fit to each dataset in turn
+    (or in a pool of worker processes).
+
+    Parameters
+    ----------
+    some_function : callable or ModelWrapper
+        A function that takes at least one argument and returns a float numpy
+        array with num_obs entries.
+    y_obs : numpy.ndarray or pandas.DataFrame
+        float array with shape (num_datasets,num_obs) holding the observations
+        for each dataset. Alternatively, a long-format dataframe with
+        ``dataset_column``, 'y_obs', and 'y_std' columns. Rows for each
+        dataset must be in the order of the model output.
+    y_std : numpy.ndarray or float, optional
+        standard deviation of each observation. This can be a float or any
+        array that can be broadcast to the shape of y_obs (e.g. one value per
+        observation with shape (num_obs,)). Must be None if y_obs is a
+        dataframe.
+    fit_parameters : list, dict, str, pandas.DataFrame; optional
+        fit_parameters lets the user specify information about the parameters
+        in the fit. See dataprob.setup for details.
+    non_fit_kwargs : dict
+        non_fit_kwargs are keyword arguments for some_function that should not
+        be fit but need to be specified to non-default values.
+    vector_first_arg : bool, default=False
+        If True, the first argument of the function is taken as a vector of
+        parameters to fit. See dataprob.setup for details.
+    vectorized : bool, default=False
+        If True, some_function can evaluate many parameter sets in a single
+        call. See dataprob.setup for details.
+    jacobian_function : callable, optional
+        Function that returns the derivative of the model output with respect
+        to each fit parameter. See dataprob.setup for details.
+    jac_sparsity : array-like or scipy.sparse matrix, optional
+        (num_obs,num_params) array whose nonzero entries mark which fit
+        parameters each observation depends on. See dataprob.setup for
+        details.
+    dataset_column : str, default="dataset"
+        name of the dataset id column if y_obs is a dataframe
+    num_workers : int, default=1
+        Number of processes to use to fit the datasets. If `0`, use the total
+        number of cpus.
+    **least_squares_kwargs :
+        any remaining keyword arguments are passed as **kwargs to
+        scipy.optimize.least_squares
+
+    Returns
+    -------
+    fit_df : pandas.DataFrame
+        tidy dataframe with one row per dataset and parameter. It has the
+        columns in Fitter.fit_df, plus ``dataset_column`` (the dataset id) and
+        'success' (whether the fit to that dataset succeeded).
+    """
+
+    num_workers = get_num_workers(num_workers)
+
+    if not issubclass(type(dataset_column),str):
+        err = "dataset_column should be a string\n"
+        raise ValueError(err)
+
+    dataset_ids, y_obs, y_std = _process_batch_obs(y_obs=y_obs,
+                                                   y_std=y_std,
+                                                   dataset_column=dataset_column)
+
+    # Wrap the model once for all datasets
+    if issubclass(type(some_function),ModelWrapper):
+        model = copy.deepcopy(some_function)
+    else:
+        model = wrap_function(some_function=some_function,
+                              fit_parameters=fit_parameters,
+                              non_fit_kwargs=non_fit_kwargs,
+                              vector_first_arg=vector_first_arg,
+                              vectorized=vectorized,
+                              jacobian_function=jacobian_function,
+                              jac_sparsity=jac_sparsity)
+    model.finalize_params()
+
+    param_df = model.param_df
+    unfixed = np.array(model.unfixed_mask,dtype=bool)
+    guesses = np.array(param_df.loc[unfixed,"guess"],dtype=float).copy()
+    bounds = np.array([param_df.loc[unfixed,"lower_bound"],
+                       param_df.loc[unfixed,"upper_bound"]],dtype=float).copy()
+
+    fit_kwargs = {"model":model,
+                  "guesses":guesses,
+                  "bounds":bounds,
+                  "least_squares_kwargs":least_squares_kwargs}
+
+    # Fit the datasets, either in this process or in a pool of worker
+    # processes. Results come back in the order of the datasets.
+    num_datasets = y_obs.shape[0]
+    results = map_in_pool(_fit_dataset,
+                          zip(y_obs,y_std),
+                          num_workers=num_workers,
+                          shared_kwargs=fit_kwargs,
+                          star=True)
+
+    # Gather results into (num_datasets,num_params) arrays
+    num_params = len(param_df)
+    estimate = np.tile(np.array(param_df["guess"],dtype=float),(num_datasets,1))
+    std = np.nan*np.ones((num_datasets,num_params),dtype=float)
+    success = np.zeros(num_datasets,dtype=bool)
+    num_singular = 0
+    num_errors = 0
+    for i, (x, s, ok, problem) in enumerate(results):
+        estimate[i,unfixed] = x
+        std[i,unfixed] = s
+        success[i] = ok
+        if problem == "singular Jacobian":
+            num_singular += 1
+        elif problem is not None:
+            num_errors += 1
+
+    if num_errors > 0:
+        w = f"\n\nleast_squares threw an error for {num_errors} of {num_datasets}\n"
+        w += "datasets. Their estimates are set to nan.\n\n"
+        warnings.warn(w)
+
+    if num_singular > 0:
+        w = f"\n\nJacobian matrix was singular for {num_singular} of {num_datasets}\n"
+        w += "datasets. Could not find parameter uncertainty for these fits.\n\n"
+        warnings.warn(w)
+
+    # 95% confidence intervals from standard error
+    num_obs = y_obs.shape[1]
+    z = special.stdtrit(num_obs - len(guesses) - 1,0.975)
+    low_95 = estimate - z*std
+    high_95 = estimate + z*std
+
+    # Build tidy output dataframe
+    out = {dataset_column:np.repeat(dataset_ids,num_params),
+           "name":np.tile(np.array(param_df["name"]),num_datasets),
+           "estimate":estimate.ravel(),
+           "std":std.ravel(),
+           "low_95":low_95.ravel(),
+           "high_95":high_95.ravel()}
+    for col in ["guess","fixed","lower_bound","upper_bound","prior_mean",
+                "prior_std"]:
+        out[col] = np.tile(np.array(param_df[col]),num_datasets)
+    out["success"] = np.repeat(success,num_params)
+
+    return pd.DataFrame(out)
@@ -0,0 +1,216 @@
+"""
+Functions for estimating MCMC autocorrelation times while a sampler runs.
+"""
+
+import numpy as np
+
+def get_autocorr_time(chain,c=5):
+    """
+    Estimate the integrated autocorrelation time of each parameter in an
+    MCMC chain. The autocorrelation function is calculated for every walker
+    and parameter in a single FFT, averaged over walkers, and then summed
+    using the automated windowing procedure of Sokal (1989). This is the same
+    estimator emcee uses, but it never raises an error for a short chain.
+
+    Parameters
+    ----------
+    chain : numpy.ndarray
+        float array with shape (num_steps,num_walkers,num_params)
+    c : float, default=5
+        window size scale factor. the window is the smallest lag M where
+        M >= c*tau(M)
+
+    Returns
+    -------
+    tau : numpy.ndarray
+        float array with shape (num_params,) holding the estimated
+        autocorrelation time of each parameter (in steps)
+    """
+
+    chain = np.asarray(chain,dtype=float)
+    n = chain.shape[0]
+
+    # Zero-pad to a power of two at least 2n long to avoid circular
+    # correlation in the FFT.
+    fft_size = 1 << int(2*n - 1).bit_length()
+
+    # Autocorrelation function of each walker/parameter
+    centered = chain - np.mean(chain,axis=0)
+    f = np.fft.rfft(centered,n=fft_size,axis=0)
+    acf = np.fft.irfft(f*np.conjugate(f),n=fft_size,axis=0)[:n]
+
+    # Normalize. A walker that has not moved has no autocorrelation
+    # information; give it acf = 1 at lag 0 and 0 elsewhere.
+    var = acf[0]
+    stuck = var <= 0
+    var[stuck] = 1.0
+    acf = acf/var
+    acf[0,stuck] = 1.0
+
+    # Average over walkers, then estimate tau as a function of window
+    acf = np.mean(acf,axis=1)
+    taus = 2.0*np.cumsum(acf,axis=0) - 1.0
+
+    # Smallest window M where M >= c*tau(M). If no window satisfies this, the
+    # chain is too short; use the last lag.
+    m = np.arange(n)[:,None] < c*taus
+    window = np.argmin(m,axis=0)
+    window[np.all(m,axis=0)] = n - 1
+
+    return taus[window,np.arange(taus.shape[1])]
+
+
+def check_autocorr_convergence(tau,
+                               previous_tau,
+                               num_steps,
+                               tau_multiplier=50,
+                               tau_rtol=0.01):
+    """
+    Decide whether a chain has converged based on its autocorrelation time.
+
+    Parameters
+    ----------
+    tau : numpy.ndarray
+        current estimate of the autocorrelation time of each parameter
+    previous_tau : numpy.ndarray or None
+        autocorrelation times from the last check. if None, the chain cannot
+        be declared converged.
+    num_steps : int
+        number of steps in the chain
+    tau_multiplier : float, default=50
+        the chain must be longer than tau_multiplier times the longest
+        autocorrelation time
+    tau_rtol : float, default=0.01
+        the relative change in every autocorrelation time since the last
+        check must be less than tau_rtol
+
+    Returns
+    -------
+    converged : bool
+        whether or not the chain is converged
+    """
+
+    tau = np.asarray(tau)
+    if previous_tau is None or not np.all(np.isfinite(tau)):
+        return False
+
+    if num_steps <= tau_multiplier*np.max(tau):
+        return False
+
+    change = np.abs(np.asarray(previous_tau) - tau)/tau
+
+    return bool(np.all(change < tau_rtol))
+
+
+class AutocorrMonitor:
+    """
+    Track the autocorrelation time of an MCMC chain while it is sampled.
+    Walker positions are fed in one step at a time and kept in a fixed-size
+    in-memory buffer, so the chain is never re-read from the sampler (or a
+    chain file on disk). When the buffer fills, every other step is dropped
+    and only every second step is kept from then on; the autocorrelation
+    time is estimated from the thinned chain and scaled by the thinning
+    factor. Checks are spaced geometrically (each at least ``growth`` times
+    the chain length of the last), so the total cost of all checks grows as
+    N log(N) in the chain length rather than N^2.
+    """
+
+    def __init__(self,
+                 check_interval=100,
+                 growth=1.25,
+                 max_length=4096):
+        """
+        Parameters
+        ----------
+        check_interval : int, default=100
+            minimum number of steps between checks
+        growth : float, default=1.25
+            minimum factor by which the chain grows between checks
+        max_length : int, default=4096
+            maximum number of (thinned) steps to hold in memory. must be even.
+        """
+
+        self._check_interval = int(check_interval)
+        self._growth = float(growth)
+        self._max_length = 2*(int(max_length)//2)
+
+        self._buffer = None
+        self._length = 0
+        self._thin = 1
+        self._num_steps = 0
+        self._next_check = self._check_interval
+
+    def add(self,coords):
+        """
+        Add one step of the chain.
+
+        Parameters
+        ----------
+        coords : numpy.ndarray
+            walker positions with shape (num_walkers,num_params)
+        """
+
+        self._num_steps += 1
+        if self._num_steps % self._thin != 0:
+            return
+
+        if self._buffer is None:
+            self._buffer = np.empty((self._max_length,) + np.shape(coords),
+                                    dtype=float)
+
+        # Buffer full: keep every other step and double the thinning. The 
+        # kept steps are those at multiples of the new thinning factor.
+        if self._length == self._max_length:
+            half = self._max_length//2
+            self._buffer[:half] = self._buffer[1::2]
+            self._length = half
+            self._thin *= 2
+            if self._num_steps % self._thin != 0:
+                return
+
+        self._buffer[self._length] = coords
+        self._length += 1
+
+    def add_chain(self,chain):
+        """
+        Add every step of a chain with shape (num_steps,num_walkers,num_params).
+        """
+
+        for coords in chain:
+            self.add(coords)
+
+    @property
+    def check_due(self):
+        """
+        Whether enough steps have been added since the last estimate to check
+        again.
+        """
+
+        return self._num_steps >= self._next_check
+
+    @property
+    def num_steps(self):
+        """
+        Number of steps added.
+        """
+
+        return self._num_steps
+
+    def estimate(self):
+        """
+        Estimate the autocorrelation time of each parameter and schedule the
+        next check.
+
+        Returns
+        -------
+        tau : numpy.ndarray
+            float array with shape (num_params,) holding the estimated
+            autocorrelation time of each parameter (in steps)
+        """
+
+        self._next_check = max(self._num_steps + self._check_interval,
+                               int(np.ceil(self._num_steps*self._growth)))
+
+        tau = get_autocorr_time(self._buffer[:self._length])
+
+        return tau*self._thin
@@ -0,0 +1,134 @@
+"""
+emcee backend that streams the MCMC chain to a .npy file on disk.
+"""
+
+from dataprob.util.npy_file import create_npy
+from dataprob.util.npy_file import append_npy
+from dataprob.util.npy_file import read_npy_shape
+
+import emcee
+import numpy as np
+
+import os
+
+class NpyBackend(emcee.backends.Backend):
+    """
+    Store the MCMC chain in a .npy file, writing each step to disk as it is
+    taken. The file holds a float array with shape
+    (num_steps,num_walkers,num_params + 2). For each walker, the first
+    num_params columns are the parameter values, the next column is the log
+    probability, and the last column is 1.0 if the step was accepted and 0.0
+    otherwise. The file can be read with ``np.load(chain_file,mmap_mode="r")``.
+
+    If the file already exists, the backend is initialized from it so a
+    sampler can resume from the last walker positions. The state of the
+    random number generator is not saved. Blobs are not supported.
+    """
+
+    def __init__(self,filename):
+        """
+        Parameters
+        ----------
+        filename : str
+            .npy file to write the chain to (or read an existing chain from)
+        """
+
+        super().__init__(dtype=np.float64)
+        self.filename = filename
+
+        if os.path.isfile(self.filename):
+
+            shape, dtype = read_npy_shape(self.filename)
+            if len(shape) != 3 or shape[2] < 3 or dtype != np.float64:
+                err = f"'{self.filename}' does not appear to be an MCMC chain file\n"
+                raise ValueError(err)
+
+            self.nwalkers = int(shape[1])
+            self.ndim = int(shape[2]) - 2
+            self.iteration = int(shape[0])
+            self.blobs = None
+            self.random_state = None
+            self.initialized = True
+
+            if self.iteration > 0:
+                self.accepted = np.sum(self._load()[:,:,-1],axis=0)
+            else:
+                self.accepted = np.zeros(self.nwalkers,dtype=self.dtype)
+
+    def _load(self):
+        """
+        Memory-map the chain file.
+        """
+
+        return np.load(self.filename,mmap_mode="r")
+
+    @property
+    def chain(self):
+        if self.iteration == 0:
+            return np.empty((0,self.nwalkers,self.ndim),dtype=self.dtype)
+        return self._load()[:,:,:self.ndim]
+
+    @property
+    def log_prob(self):
+        if self.iteration == 0:
+            return np.empty((0,self.nwalkers),dtype=self.dtype)
+        return self._load()[:,:,self.ndim]
+
+    def reset(self,nwalkers,ndim):
+        """
+        Clear the chain, creating an empty chain file.
+
+        Parameters
+        ----------
+        nwalkers : int
+            number of walkers
+        ndim : int
+            number of parameters
+        """
+
+        self.nwalkers = int(nwalkers)
+        self.ndim = int(ndim)
+        self.iteration = 0
+        self.accepted = np.zeros(self.nwalkers,dtype=self.dtype)
+        self.blobs = None
+        self.random_state = None
+
+        create_npy(self.filename,
+                   row_shape=(self.nwalkers,self.ndim + 2),
+                   dtype=self.dtype)
+
+        self.initialized = True
+
+    def grow(self,ngrow,blobs):
+        """
+        Nothing to allocate; the file grows as steps are saved.
+        """
+
+        if blobs is not None:
+            err = "NpyBackend does not support blobs\n"
+            raise ValueError(err)
+
+    def save_step(self,state,accepted):
+        """
+        Append a step to the chain file.
+
+        Parameters
+        ----------
+        state : emcee.State
+            state of the ensemble
+        accepted : numpy.ndarray
+            whether the proposal for each walker was accepted
+        """
+
+        self._check(state,accepted)
+
+        row = np.empty((1,self.nwalkers,self.ndim + 2),dtype=self.dtype)
+        row[0,:,:self.ndim] = state.coords
+        row[0,:,self.ndim] = state.log_prob
+        row[0,:,-1] = accepted
+
+        append_npy(self.filename,row)
+
+        self.accepted += accepted
+        self.random_state = state.random_state
+        self.iteration += 1
@@ -9,6 +9,8 @@ from dataprob.fitters.bayesian._prior_processing import find_normalization
 from dataprob.fitters.bayesian._prior_processing import find_uniform_value
 from dataprob.fitters.bayesian._prior_processing import reconcile_bounds_and_priors
 from dataprob.fitters.bayesian._prior_processing import create_walkers
+from dataprob.fitters.bayesian._autocorr import check_autocorr_convergence
+from dataprob.fitters.bayesian._autocorr import AutocorrMonitor
 
 from dataprob.util.check import check_int
 from dataprob.util.check import check_float
@@ -16,17 +18,102 @@ from dataprob.util.check import check_bool
 from dataprob.util.check import check_array
 
 from dataprob.util.stats import get_kde_max
-
-import emcee
+from dataprob.util.worker_pool import get_num_workers
+from dataprob.util.worker_pool import create_pool
+from dataprob.util.worker_pool import call_in_worker
 
 import numpy as np
 from scipy import stats
 
-import multiprocessing
 import sys
 import warnings
 
 
+# Allowed ways to calculate parameter estimates from the samples
+_ESTIMATORS = ["kde","max_lnprob","median","mean"]
+
+def _calc_ln_prior(param,
+                   lower_bounds,
+                   upper_bounds,
+                   gauss_prior_mask,
+                   gauss_prior_means,
+                   gauss_prior_inv_stds,
+                   ln_prior_offset):
+    """
+    Log prior without error checking. param can be a single parameter set 
+    (shape (num_params,)) or many parameter sets (shape 
+    (num_walkers,num_params)). Returns a float or an array with shape 
+    (num_walkers,), respectively. The remaining arguments are the prior
+    constants calculated by BayesianSampler._setup_priors. 
+    """
+
+    # If any parameter falls outside of the bounds, make the prior -infinity
+    out_of_bounds = np.any((param < lower_bounds) | (param > upper_bounds),
+                           axis=-1)
+
+    # Closed-form gaussian log density for parameters we're treating with 
+    # gaussian priors. All constant terms are in ln_prior_offset. 
+    z = (param[...,gauss_prior_mask] - gauss_prior_means)*gauss_prior_inv_stds
+    ln_prior = ln_prior_offset - 0.5*np.sum(z*z,axis=-1)
+
+    if np.ndim(ln_prior) == 0:
+        if out_of_bounds:
+            return -np.inf
+        return float(ln_prior)
+
+    ln_prior[out_of_bounds] = -np.inf
+
+    return ln_prior
+
+
+class _WorkerLnProb:
+    """
+    Log posterior calculation sent to the worker processes of a pool. This 
+    holds only what the calculation needs (the model wrapper, y_obs, the 
+    observation and prior constants, and the numba kernels if any) rather
+    than the whole fitter with its samples and previous fit results. 
+    """
+
+    def __init__(self,fitter):
+        """
+        Parameters
+        ----------
+        fitter : BayesianSampler
+            fitter with priors and observation constants set up
+        """
+
+        self._model = fitter._model
+        self._y_obs = fitter._y_obs
+        self._inv_std, _, self._ln_norm = fitter._get_obs_constants()
+        self._numba_likelihood = fitter._numba_likelihood
+        self._prior_constants = (fitter._lower_bounds,
+                                 fitter._upper_bounds,
+                                 fitter._gauss_prior_mask,
+                                 fitter._gauss_prior_means,
+                                 fitter._gauss_prior_inv_stds,
+                                 fitter._ln_prior_offset)
+
+    def __call__(self,param):
+        """
+        Log posterior probability of param (same as BayesianSampler._ln_prob).
+        """
+
+        if self._numba_likelihood is not None:
+            ln_like = self._numba_likelihood.ln_like(param)
+        else:
+            y_calc = self._model.fast_model(param)
+            weighted = (y_calc - self._y_obs)*self._inv_std
+            ln_like = -0.5*(np.dot(weighted,weighted) + self._ln_norm)
+
+        ln_prob = _calc_ln_prior(param,*self._prior_constants) + ln_like
+
+        # If result is not finite, this solution has an -infinity log
+        # probability
+        if not np.isfinite(ln_prob):
+            return -np.inf
+
+        return ln_prob
+
 
 class BayesianSampler(Fitter):
     """
@@ -102,6 +189,14 @@ class BayesianSampler(Fitter):
         self._gauss_prior_stds = np.array(gauss_prior_stds,dtype=float)
         self._gauss_prior_offsets = np.array(gauss_prior_offsets,dtype=float)
         self._gauss_prior_mask = np.array(gauss_prior_mask,dtype=bool)
+        self._gauss_prior_inv_stds = 1/self._gauss_prior_stds
+
+        # Sum all terms in the log prior that do not depend on the parameter
+        # values: the uniform priors, the normalization offsets, and the 
+        # -ln(sqrt(2*pi)) term of each standard normal log density. 
+        self._ln_prior_offset = float(self._uniform_priors
+                                      + np.sum(self._gauss_prior_offsets)
+                                      - 0.5*np.log(2*np.pi)*len(gauss_prior_means))
 
         # Grab lower and upper bounds. We pull them out of the dataframe so we
         # can use in prior calculations without any dictionary lookups. 
@@ -114,21 +209,18 @@ class BayesianSampler(Fitter):
     def _ln_prior(self,param):
         """
         Private function that gets the log prior without error checking. 
+        param can be a single parameter set (shape (num_params,)) or many 
+        parameter sets (shape (num_walkers,num_params)). Returns a float or 
+        an array with shape (num_walkers,), respectively. 
         """
 
-        # If any parameter falls outside of the bounds, make the prior -infinity
-        if np.sum(param < self._lower_bounds) > 0:
-            return -np.inf
-        
-        if np.sum(param > self._upper_bounds) > 0:
-            return -np.inf
-
-        # Get priors for parameters we're treating with gaussian priors
-        z = (param[self._gauss_prior_mask] - self._gauss_prior_means)/self._gauss_prior_stds
-        gauss = np.sum(self._prior_frozen_rv.logpdf(z) + self._gauss_prior_offsets)
-
-        # Return total priors
-        return self._uniform_priors + gauss
+        return _calc_ln_prior(param,
+                              self._lower_bounds,
+                              self._upper_bounds,
+                              self._gauss_prior_mask,
+                              self._gauss_prior_means,
+                              self._gauss_prior_inv_stds,
+                              self._ln_prior_offset)
 
     def ln_prior(self,param):
         """
@@ -174,6 +266,23 @@ class BayesianSampler(Fitter):
 
         return ln_prob
 
+    def _ln_prob_batch(self,params):
+        """
+        Private function that gets the log probability for many parameter sets
+        (shape (num_samples,num_params)) without error checking. This is 
+        used by emcee to evaluate all walkers in a single call if the model
+        is vectorized. 
+        """
+
+        # log posterior is log prior plus log likelihood
+        ln_prob = self._ln_prior(params) + self._ln_like_batch(params)
+
+        # If result is not finite, this solution has an -infinity log
+        # probability
+        ln_prob[np.logical_not(np.isfinite(ln_prob))] = -np.inf
+
+        return ln_prob
+
     def ln_prob(self,param):
         """
         Posterior probability of model parameters.
@@ -202,76 +311,96 @@ class BayesianSampler(Fitter):
     def _sample_to_convergence(self):
         """
         Run the sampler up to _max_convergence_cycles times in an effort go 
-        get converged parameter estimates. This is based on emcee's estimated
-        autocorrelation time for the parameters. The convergence criterion is
-        50x the longest autocorrelation time. 
+        get converged parameter estimates. This is based on the estimated
+        autocorrelation time for the parameters, which an AutocorrMonitor 
+        updates while the sampler runs (first after 
+        _convergence_check_interval steps, then at geometrically spaced 
+        intervals). The chain is converged when it is longer than 50x the 
+        longest autocorrelation time and the autocorrelation times have 
+        stopped changing. Sampling stops as soon as the chain converges, 
+        provided at least _num_steps steps have been taken. 
         """
 
-        # Print status to standard error (like the progress bars)
-        print(f"Running 1 of up to {self._max_convergence_cycles} sampler iterations",
-            flush=True,
-            file=sys.stderr)
+        sampler = self._fit_result
 
-        # Run initial sampler pass
-        self._fit_result.run_mcmc(initial_state=self._initial_state,
-                                  nsteps=self._num_steps,
-                                  progress=True)
+        # Start from the initial walker positions or, if resuming a chain, 
+        # from the last walker positions in the chain. 
+        state = self._initial_state
+        if state is None:
+            state = sampler.backend.get_last_sample()
 
         # Initialize control variables
         success = False
         counter = 1
+        block_steps = self._num_steps
+        start_iteration = sampler.iteration
+        min_steps = start_iteration + self._num_steps
+        previous_tau = None
+        max_corr = None
+
+        # Feed the monitor the walker positions as they are sampled. If 
+        # resuming, load the existing chain into it once. 
+        monitor = AutocorrMonitor(check_interval=self._convergence_check_interval)
+        if sampler.iteration > 0:
+            monitor.add_chain(sampler.get_chain())
+
+        while True:
+
+            # Print status to standard error (like the progress bars)
+            print(f"Running {counter} of up to {self._max_convergence_cycles} sampler iterations",
+                  flush=True,
+                  file=sys.stderr)
 
-        # Loop until we reach max_convergence_cycles
-        while counter < self._max_convergence_cycles:
-            
-            # Get the parameter correlation time. 
-            try:
-
-                # Get largest correlation time--this limits our final sampling. If 
-                # this runs without error, break out of the loop and declare 
-                # success. 
-                max_corr = np.max(self._fit_result.get_autocorr_time())
-                print(f"   Converged correlation time: {max_corr:.2f} iterations\n",
-                      flush=True,
-                      file=sys.stderr)
-                success = True
-                break
+            # Run the sampler, checking convergence when the monitor says a 
+            # check is due and at the end of the block. 
+            stop_at = sampler.iteration + block_steps
+            for state in sampler.sample(state,
+                                        iterations=block_steps,
+                                        progress=True):
 
-            except emcee.autocorr.AutocorrError as e:
+                monitor.add(state.coords)
+                if not monitor.check_due and sampler.iteration != stop_at:
+                    continue
 
-                # emcee throws an AutocorrError if it is not converged yet. Get the
-                # maximum of its current (unreliable) guess. 
-                max_corr = np.max(e.__dict__["tau"])
+                tau = monitor.estimate()
+                max_corr = np.max(tau)
 
-                # Figure out how many steps to add to get to the target correlation time
-                # (max_corr * 50). This number is hard-coded into the acorr estimator. 
-                need_at_least = int(np.ceil(max_corr)*50)
+                if sampler.iteration >= min_steps:
+                    success = check_autocorr_convergence(tau=tau,
+                                                         previous_tau=previous_tau,
+                                                         num_steps=sampler.iteration)
+                    if success:
+                        break
 
-                msg = f"   Rough estimate of correlation time: {max_corr:.2f} iterations. "
-                msg +=f"We need at least {need_at_least} samples.\n"
-                print(msg,flush=True,file=sys.stderr)
-                
-            # Run next sampling, starting from previous state
-            print(f"Running {counter + 1} of up to {self._max_convergence_cycles} sampler iterations",
-                  flush=True,
-                  file=sys.stderr)
+                previous_tau = tau
             
-            # Current number of steps
-            current_num_steps = self._fit_result.get_chain().shape[0]
-            next_iteration = need_at_least - current_num_steps
+            if success or counter >= self._max_convergence_cycles:
+                break
 
-            self._fit_result.run_mcmc(initial_state=None,
-                                      nsteps=next_iteration,
-                                      progress=True)
+            # Figure out how many steps to add to get to the target 
+            # correlation time (max_corr * 50), at least doubling the chain
+            # so the cycle cap is rarely what ends sampling. We will stop 
+            # early if the chain converges before then. 
+            need_at_least = int(np.ceil(max_corr*50))
+            block_steps = max(need_at_least - sampler.iteration,
+                              sampler.iteration - start_iteration,
+                              self._convergence_check_interval)
+
+            msg = f"   Rough estimate of correlation time: {max_corr:.2f} iterations. "
+            msg +=f"We need at least {need_at_least} samples.\n"
+            print(msg,flush=True,file=sys.stderr)
 
             # Update the counter
             counter += 1
 
         # Final number of steps taken
-        num_steps = self._fit_result.get_chain().shape[0]
+        num_steps = sampler.iteration
 
         # If we converged, write this message out
         if success:
+            print(f"   Converged correlation time: {max_corr:.2f} iterations\n",
+                  flush=True,
+                  file=sys.stderr)
             print(f"\nTook {num_steps} steps ({num_steps/max_corr:.1f}x the correlation time)\n",
                 flush=True,
                 file=sys.stderr)
@@ -295,7 +424,11 @@ class BayesianSampler(Fitter):
             num_steps=100,
             burn_in=0.1,
             num_threads=1,
-            max_convergence_cycles=1,
+            max_convergence_cycles=10,
+            convergence_check_interval=100,
+            chain_file=None,
+            estimator="kde",
+            extra_intervals=None,
             **emcee_kwargs):
         """
         Perform Bayesian MCMC sampling of parameter values. 
@@ -320,13 +453,43 @@ class BayesianSampler(Fitter):
         burn_in : float, default = 0.1
             fraction of samples to discard from the start of the run
         num_threads : int, default=1
-            number of threads to use.  if `0`, use the total number of cpus. 
-            [NOT YET IMPLEMENTED]
-        max_convergence_cycles : int, default=1
-            run this number of cycles in an attempt to get the parameter 
+            number of processes to use to calculate walker log probabilities.
+            if `0`, use the total number of cpus. 1 runs the calculation in 
+            the current process without a worker pool. with more than one
+            process, the model must be picklable (e.g. a function defined at
+            the top level of an importable module).
+        max_convergence_cycles : int, default=10
+            maximum number of cycles to run in an attempt to get the parameter
             estimates to converge. Must be >= 1. convergence is detected by 
-            estimating the parameter autocorrelation time (in units of steps),
-            then aiming for 50 times more steps than the autocorrelation time. 
+            estimating the parameter autocorrelation time (in units of steps)
+            while the sampler runs. the first cycle runs num_steps steps; each
+            later cycle aims for 50 times more steps than the autocorrelation
+            time. sampling stops as soon as the chain is converged, but always
+            runs at least num_steps steps. 
+        convergence_check_interval : int, default=100
+            first re-estimate the autocorrelation time and check for 
+            convergence after this many steps. later checks are spaced so the
+            chain grows by at least this many steps and by at least 25% 
+            between checks.
+        chain_file : str, optional
+            .npy file in which to store the MCMC chain. Each step is written
+            to the file as it is taken. If the file already holds a chain, 
+            sampling resumes from the last walker positions in the file 
+            rather than starting new walkers. The file can be read with 
+            ``np.load(chain_file,mmap_mode="r")`` and has the shape
+            (num_steps,num_walkers,num_params + 2); the last two columns are
+            the log probability and whether the step was accepted.
+        estimator : str, default="kde"
+            how to get the parameter estimates from the samples. "kde" finds
+            the maximum of a kernel density estimate built from the samples.
+            "max_lnprob" takes the sample with the highest posterior 
+            probability. "median" and "mean" take the median and mean of each
+            parameter. "max_lnprob", "median", and "mean" scale linearly with
+            the number of samples and do not call the model. 
+        extra_intervals : list-like, optional
+            credibility interval levels (as percentages) to report in fit_df
+            in addition to the 95% interval. For example, ``[68,99]`` adds
+            low_68, high_68, low_99, and high_99 columns. 
         **emcee_kwargs : 
             all remaining keyword arguments are passed to the initialization 
             function of emcee.EnsembleSampler
@@ -349,22 +512,36 @@ class BayesianSampler(Fitter):
                                     maximum_inclusive=False)
 
         # Deal with number of threads
-        num_threads = check_int(value=num_threads,
-                                variable_name="num_threads",
-                                minimum_allowed=0)                
-        if num_threads == 0:
-            num_threads = multiprocessing.cpu_count()
-
-        if num_threads != 1:
-            err = "multithreading has not yet been implemented (yet!).\n"
-            raise NotImplementedError(err)
-        
+        num_threads = get_num_workers(num_threads,
+                                      variable_name="num_threads")
+
+        if num_threads != 1 and self._model.vectorized:
+            err = "num_threads must be 1 for a vectorized model. All walkers\n"
+            err += "are evaluated in a single call to the model.\n"
+            raise ValueError(err)
+
         self._num_threads = num_threads
 
         # max convergence time
         self._max_convergence_cycles = check_int(value=max_convergence_cycles,
                                                  variable_name="max_convergence_cycles",
                                                  minimum_allowed=1)
+        self._convergence_check_interval = check_int(value=convergence_check_interval,
+                                                     variable_name="convergence_check_interval",
+                                                     minimum_allowed=1)
+
+        if estimator not in _ESTIMATORS:
+            err = "estimator should be one of:\n"
+            for e in _ESTIMATORS:
+                err += f"    {e}\n"
+            raise ValueError(err)
+        self._estimator = estimator
+
+        self._set_extra_intervals(extra_intervals)
+
+        if chain_file is not None:
+            chain_file = str(chain_file)
+        self._chain_file = chain_file
 
         super().fit(y_obs=y_obs,
                     y_std=y_std,
@@ -380,14 +557,42 @@ class BayesianSampler(Fitter):
             keyword arguments to pass to emcee.EnsembleSampler
         """
 
+        # emcee is only loaded when a sampler is actually run
+        import emcee
+        from dataprob.fitters.bayesian._npy_backend import NpyBackend
+
         # Set up the priors
         self._setup_priors()
 
-        # Construct initial walker positions. If use_ml_guess is specified, do a
-        # maximum likelihood fit, then sample from the fit parameter covariance
+        num_params = int(self.num_params)
+
+        # Open the chain file, if requested. If it already holds steps, we 
+        # resume from the last walker positions. 
+        backend = None
+        resume = False
+        if self._chain_file is not None:
+
+            backend = NpyBackend(self._chain_file)
+            if backend.initialized:
+                if backend.shape != (self._num_walkers,num_params):
+                    err = f"chain_file '{self._chain_file}' has (num_walkers,num_params)\n"
+                    err += f"{backend.shape}, but this fit has {(self._num_walkers,num_params)}\n"
+                    raise ValueError(err)
+                
+                if backend.iteration > 0:
+                    resume = True
+                else:
+                    backend.reset(self._num_walkers,num_params)
+
+        # Construct initial walker positions. If resuming, emcee takes these
+        # from the chain file. If use_ml_guess is specified, do a maximum
+        # likelihood fit, then sample from the fit parameter covariance
         # matrix to generate initial guesses. This will sample only unfixed
         # parameters. 
-        if self._use_ml_guess:
+        if resume:
+            self._initial_state = None
+
+        elif self._use_ml_guess:
 
             ml_fit = MLFitter(some_function=self._model)
             ml_fit.param_df = self.param_df.copy()
@@ -420,58 +625,124 @@ class BayesianSampler(Fitter):
             self._initial_state = create_walkers(param_df=self.param_df,
                                                  num_walkers=self._num_walkers)
         
-        # Build sampler object
-        self._fit_result = emcee.EnsembleSampler(nwalkers=self._num_walkers,
-                                                 ndim=self._initial_state.shape[1],
-                                                 log_prob_fn=self._ln_prob,
-                                                 **kwargs)
-
-        # Run sampler
-        self._sample_to_convergence()
+        # If we are using more than one process, create a pool of workers. 
+        # Each worker gets the model and the constants needed to calculate 
+        # the log posterior once when it starts; emcee then only sends 
+        # parameter arrays to the workers on each step. If the model is 
+        # vectorized, evaluate all walkers in one call instead. 
+        pool = None
+        vectorize = False
+        if self._num_threads > 1:
+            pool = create_pool(num_workers=self._num_threads,
+                               function=_WorkerLnProb(self))
+            log_prob_fn = call_in_worker
+        elif self._model.vectorized:
+            log_prob_fn = self._ln_prob_batch
+            vectorize = True
+        else:
+            log_prob_fn = self._ln_prob
+
+        try:
+
+            # Build sampler object
+            self._fit_result = emcee.EnsembleSampler(nwalkers=self._num_walkers,
+                                                     ndim=num_params,
+                                                     log_prob_fn=log_prob_fn,
+                                                     pool=pool,
+                                                     vectorize=vectorize,
+                                                     backend=backend,
+                                                     **kwargs)
+
+            # Run sampler
+            self._sample_to_convergence()
+
+        finally:
+
+            # Shut down the worker pool and remove it from the sampler so the
+            # fit result does not hold onto a dead pool. 
+            if pool is not None:
+                pool.close()
+                pool.join()
+                if hasattr(self,"_fit_result"):
+                    self._fit_result.pool = None
     
-        # Create numpy array of samples
-        to_discard = int(round(self._burn_in*self._num_steps,0))
-        chains = self._fit_result.get_chain()[to_discard:,:,:]
-        new_samples = chains.reshape((-1,self._initial_state.shape[1]))
+        # Figure out which steps to add to the samples. If we resumed a chain
+        # whose earlier steps are already in the samples, take only the new
+        # steps. If we resumed a chain from a file we have not loaded, take 
+        # the whole chain and discard burn_in of it. Otherwise, discard 
+        # burn_in based on num_steps. 
+        if resume and self._chain_file == getattr(self,"_loaded_chain_file",None):
+            first_step = self._loaded_chain_steps
+        elif resume:
+            first_step = int(round(self._burn_in*self._fit_result.iteration,0))
+        else:
+            first_step = int(round(self._burn_in*self._num_steps,0))
+        
+        # Create numpy arrays of samples and lnprob for each sample
+        chains = self._fit_result.get_chain()[first_step:,:,:]
+        new_samples = np.array(chains).reshape((-1,num_params))
+        new_lnprob = np.array(self._fit_result.get_log_prob()[first_step:,:]).reshape(-1)
 
-        # Create numpy array of lnprob for each sample
-        new_lnprob = self._fit_result.get_log_prob()[:,:].reshape(-1)
-        new_lnprob = new_lnprob[-new_samples.shape[0]:]
+        # Record how much of the chain file is now in the samples
+        if self._chain_file is not None:
+            self._loaded_chain_file = self._chain_file
+            self._loaded_chain_steps = self._fit_result.iteration
 
         if self.samples is None:
-            self._samples = new_samples
             self._lnprob = new_lnprob
         else:
-            self._samples = np.concatenate((self._samples,new_samples))
             self._lnprob = np.concatenate((self._lnprob,new_lnprob))
+        self._add_samples(new_samples)
 
         self._update_fit_df()
 
-    def _update_fit_df(self):
+    def _get_estimate(self):
         """
-        Update samples based on the samples array.
+        Get the parameter estimates from the samples using the estimator 
+        selected when calling fit ("kde" by default).
+
+        Returns
+        -------
+        estimate : numpy.ndarray
+            float array with the estimate for each unfixed parameter
         """
 
-        # Get mean and standard deviation
-        estimate = get_kde_max(self._samples)
-        std = np.std(self._samples,axis=0)
+        estimator = getattr(self,"_estimator","kde")
+
+        # Log probabilities recorded for the samples. Samples appended with
+        # append_samples have a log probability of nan.
+        lnprob = getattr(self,"_lnprob",None)
+        if lnprob is not None and len(lnprob) != len(self._samples):
+            lnprob = None
+
+        if estimator == "max_lnprob":
+
+            if lnprob is not None and np.any(np.isfinite(lnprob)):
+                lnprob = np.where(np.isfinite(lnprob),lnprob,-np.inf)
+                return self._samples[np.argmax(lnprob),:].copy()
+
+            w = "\nNo log probabilities are recorded for the samples. Using\n"
+            w += "the 'kde' estimator rather than 'max_lnprob'.\n\n"
+            warnings.warn(w)
+            estimator = "kde"
 
-        # Calculate 95% confidence intervals
-        lower = int(round(0.025*self._samples.shape[0],0))
-        upper = int(round(0.975*self._samples.shape[0],0))
+        if estimator == "median":
+            return np.nanmedian(self._samples,axis=0)
 
-        # For samples less than ~100, the rounding above will make the
-        # the upper cutoff the number of samples, and thus lead to an index 
-        # error below. 
-        if upper >= self._samples.shape[0]:
-            upper = self._samples.shape[0] - 1
+        if estimator == "mean":
+            return np.nanmean(self._samples,axis=0)
 
-        low_95 = []
-        high_95 = []
-        for i in range(self._samples.shape[1]):
-            sorted_samples = np.sort(self._samples[:,i])
-            low_95.append(sorted_samples[lower])
-            high_95.append(sorted_samples[upper])
+        # Start the search for the kde maximum from the most probable sample
+        return get_kde_max(self._samples,lnprob=lnprob)
+
+    def _update_fit_df(self):
+        """
+        Update samples based on the samples array.
+        """
+
+        # Get estimate and standard deviation
+        estimate = self._get_estimate()
+        std = np.std(self._samples,axis=0)
 
         # Get finalized parameters from param_df in case they were updated 
         # after the model was set and the fit_df created. 
@@ -485,8 +756,9 @@ class BayesianSampler(Fitter):
         self._fit_df.loc[unfixed,"estimate"] = estimate
         self._fit_df.loc[fixed,"estimate"] = self._fit_df.loc[fixed,"guess"]
         self._fit_df.loc[unfixed,"std"] = std
-        self._fit_df.loc[unfixed,"low_95"] = low_95
-        self._fit_df.loc[unfixed,"high_95"] = high_95
+
+        # Calculate 95% (and any extra) credibility intervals
+        self._update_fit_df_intervals(self._samples,unfixed)
 
     
     @property
@@ -512,6 +784,18 @@ class BayesianSampler(Fitter):
         if hasattr(self,"_max_convergence_cycles"):
             output["Max convergence cycles"] = self._max_convergence_cycles
 
+        if hasattr(self,"_convergence_check_interval"):
+            output["Convergence check interval"] = self._convergence_check_interval
+
+        if hasattr(self,"_estimator"):
+            output["Estimator"] = self._estimator
+
+        if getattr(self,"_extra_intervals",None):
+            output["Extra intervals"] = self._extra_intervals
+
+        if getattr(self,"_chain_file",None) is not None:
+            output["Chain file"] = self._chain_file
+
 
         if self.samples is not None:
             num_samples = self.samples.shape[0]
@@ -3,15 +3,95 @@ Fitter subclass for performing bootstrap analyses.
 """
 
 from dataprob.fitters.base import Fitter
+from dataprob.fitters.base import _get_least_squares_kwargs
 from dataprob.util.check import check_int
+from dataprob.util.check import check_bool
 from dataprob.util.stats import get_kde_max
+from dataprob.util.worker_pool import get_num_workers
+from dataprob.util.worker_pool import map_in_pool
 
 import numpy as np
 import scipy
-from tqdm.auto import tqdm
+from scipy import sparse
 
 import warnings
 
+
+def _bootstrap_replicate(seed,
+                         model,
+                         y_obs,
+                         y_std,
+                         guesses,
+                         bounds,
+                         least_squares_kwargs,
+                         numba_likelihood=None):
+    """
+    Run a single bootstrap replicate: perturb y_obs by y_std and fit the 
+    model to the perturbed observations. The fit minimizes unweighted 
+    residuals (y_std enters only through the perturbation), so none of the
+    fitter's cached observation constants (1/y_std, 1/y_std**2, the 
+    likelihood normalization) are needed here.
+
+    Parameters
+    ----------
+    seed : numpy.random.SeedSequence
+        seed for the random number generator used to perturb y_obs
+    model : ModelWrapper
+        finalized model wrapper to fit
+    y_obs : numpy.ndarray
+        original (unperturbed) observations
+    y_std : numpy.ndarray
+        standard deviation on each observation
+    guesses : numpy.ndarray
+        starting values for the unfixed parameters
+    bounds : numpy.ndarray
+        (2,num_unfixed) array of lower and upper bounds
+    least_squares_kwargs : dict
+        keyword arguments passed to scipy.optimize.least_squares
+    numba_likelihood : NumbaLikelihood, optional
+        numba kernels for model. if specified, residuals are calculated with
+        its unweighted_residuals_obs kernel rather than model.fast_model.
+
+    Returns
+    -------
+    param : numpy.ndarray
+        fit parameters. all nan if the fit failed.
+    problem : str or None
+        error thrown by least_squares, if any
+    """
+
+    # Create updated version of y_obs sampled from y_std
+    rng = np.random.default_rng(seed)
+    this_y_obs = y_obs + rng.normal(0.0,y_std)
+
+    # Define function to regress against. The residuals are unweighted: the
+    # uncertainty in y_obs is carried by the perturbation above. 
+    if numba_likelihood is None:
+        def fn(param): return this_y_obs - model.fast_model(param)
+    else:
+        residuals_obs = numba_likelihood.unweighted_residuals_obs
+        def fn(param): return -residuals_obs(param,this_y_obs)
+
+    # Use an analytic Jacobian or the declared sparsity structure if the
+    # model has them
+    least_squares_kwargs = _get_least_squares_kwargs(model,least_squares_kwargs)
+
+    # Do regression
+    try:
+        fit = scipy.optimize.least_squares(fn,
+                                           x0=guesses,
+                                           bounds=bounds,
+                                           **least_squares_kwargs)
+    except Exception as e:
+        return np.nan*np.ones(len(guesses),dtype=float), str(e)
+
+    # Record the fit results. If the fit fails, record np.nan
+    if fit.success:
+        return fit.x, None
+
+    return np.nan*np.ones(len(guesses),dtype=float), None
+
+
 class BootstrapFitter(Fitter):
     """
     Perform the fit many times, sampling from uncertainty in each measurement.
@@ -21,6 +101,9 @@ class BootstrapFitter(Fitter):
             y_obs=None,
             y_std=None,
             num_bootstrap=100,
+            num_workers=1,
+            warm_start=False,
+            extra_intervals=None,
             **least_squares_kwargs):
         """
         Fit the model parameters to the data by maximum likelihood, sampling 
@@ -38,6 +121,20 @@ class BootstrapFitter(Fitter):
             y_std must either be specified here or in the data_df dataframe. 
         num_bootstrap : int
             Number of bootstrap samples to run
+        num_workers : int, default=1
+            Number of processes to use to run the bootstrap replicates. If 
+            `0`, use the total number of cpus. Each replicate gets its own 
+            random number stream, so results do not depend on num_workers.
+        warm_start : bool, default=False
+            If True, first fit the model to the unperturbed data. Start every
+            bootstrap replicate from this solution, using the column norms of
+            its Jacobian as the parameter scaling (x_scale) for 
+            least_squares. This usually cuts the number of iterations per 
+            replicate. 
+        extra_intervals : list-like, optional
+            confidence interval levels (as percentages) to report in fit_df
+            in addition to the 95% interval. For example, ``[68,99]`` adds
+            low_68, high_68, low_99, and high_99 columns. 
         **least_squares_kwargs : 
             any remaining keyword arguments are passed as **kwargs to
             scipy.optimize.least_squares
@@ -46,6 +143,13 @@ class BootstrapFitter(Fitter):
         self._num_bootstrap = check_int(value=num_bootstrap,
                                         variable_name="num_bootstrap",
                                         minimum_allowed=2)
+        
+        self._num_workers = get_num_workers(num_workers)
+
+        self._warm_start = check_bool(value=warm_start,
+                                      variable_name="warm_start")
+
+        self._set_extra_intervals(extra_intervals)
 
         super().fit(y_obs=y_obs,
                     y_std=y_std,
@@ -68,48 +172,46 @@ class BootstrapFitter(Fitter):
         bounds = np.array([self._model.param_df.loc[to_fit,"lower_bound"],
                            self._model.param_df.loc[to_fit,"upper_bound"]]).copy()
 
+        # Start replicates from the fit to the unperturbed data
+        if self._warm_start:
+            guesses, kwargs = self._warm_start_fit(guesses=guesses,
+                                                   bounds=bounds,
+                                                   least_squares_kwargs=kwargs)
+
         # Create array to store bootstrap replicates
         samples = np.zeros((self._num_bootstrap,len(guesses)),dtype=float)
 
-        # Record y_obs
-        original_y_obs = np.copy(self._y_obs)
-
-        # Define function to regress against
-        def fn(*args): return -self._unweighted_residuals(*args)
-        
-        # Go through bootstrap reps
+        # Independent random number streams for each replicate. The root seed
+        # is drawn from numpy's global generator, so np.random.seed makes the
+        # whole set of replicates reproducible. 
+        root_seed = np.random.randint(0,np.iinfo(np.int32).max)
+        seeds = np.random.SeedSequence(root_seed).spawn(self._num_bootstrap)
+
+        replicate_kwargs = {"model":self._model,
+                            "y_obs":np.copy(self._y_obs),
+                            "y_std":np.copy(self._y_std),
+                            "guesses":guesses,
+                            "bounds":bounds,
+                            "least_squares_kwargs":kwargs,
+                            "numba_likelihood":self._numba_likelihood}
+
+        # Run the replicates, either in this process or in a pool of worker
+        # processes. Results come back in the order of seeds. 
+        results = map_in_pool(_bootstrap_replicate,
+                              seeds,
+                              num_workers=self._num_workers,
+                              shared_kwargs=replicate_kwargs,
+                              progress=True)
+
+        # Gather results 
         problems = []
-        for i in tqdm(range(self._num_bootstrap)):
-        
-            # Create updated version of y_obs sampled from y_std
-            self._y_obs = original_y_obs + np.random.normal(0.0,self._y_std)
-
-            # Do regression
-            try:
-                fit = scipy.optimize.least_squares(fn,
-                                                   x0=guesses,
-                                                   bounds=bounds,
-                                                   **kwargs)
-            except Exception as e:
-                problems.append(str(e))
-                samples[i,:] = np.nan
-                continue
-
-            # Record the fit results. If the fit fails, record np.nan
-            if fit.success:
-                samples[i,:] = fit.x
-            else:
-                samples[i,:] = np.nan
+        for i, (param, problem) in enumerate(results):
+            samples[i,:] = param
+            if problem is not None:
+                problems.append(problem)
 
-        # Restore y_obs from our stored copy
-        self._y_obs = np.copy(original_y_obs)
-
-        # If no samples yet, store them. Otherwise, append them to the existing
-        # samples. 
-        if self.samples is None:
-            self._samples = samples
-        else:
-            self.append_samples(sample_array=samples)
+        # Add to any existing samples
+        self._add_samples(samples)
 
         # Record the current stats on the number of samples and number that 
         # failed and place in _fit_result. 
@@ -142,6 +244,66 @@ class BootstrapFitter(Fitter):
         if self._success:
             self._update_fit_df()
 
+    def _warm_start_fit(self,guesses,bounds,least_squares_kwargs):
+        """
+        Fit the model to the unperturbed data to get starting values for the
+        bootstrap replicates. 
+
+        Parameters
+        ----------
+        guesses : numpy.ndarray
+            starting values for the unfixed parameters
+        bounds : numpy.ndarray
+            (2,num_unfixed) array of lower and upper bounds
+        least_squares_kwargs : dict
+            keyword arguments passed to scipy.optimize.least_squares
+
+        Returns
+        -------
+        guesses : numpy.ndarray
+            starting values for the replicates. If the fit fails, these are
+            the input guesses. 
+        least_squares_kwargs : dict
+            keyword arguments for the replicates. If the fit succeeds and the
+            user did not set x_scale, x_scale is set from the Jacobian.
+        """
+
+        def fn(*args): return -self._unweighted_residuals(*args)
+
+        central_kwargs = _get_least_squares_kwargs(self._model,
+                                                   least_squares_kwargs)
+
+        try:
+            fit = scipy.optimize.least_squares(fn,
+                                               x0=guesses,
+                                               bounds=bounds,
+                                               **central_kwargs)
+            success = fit.success
+        except Exception:
+            success = False
+        
+        if not success:
+            w = "\n\nwarm_start fit to the unperturbed data failed. Starting\n"
+            w += "bootstrap replicates from the parameter guesses.\n\n"
+            warnings.warn(w)
+            return guesses, least_squares_kwargs
+        
+        # Parameter scale from the Jacobian column norms (the same scaling
+        # least_squares uses for x_scale='jac'). Parameters that do not change
+        # the residuals get a scale of 1. 
+        least_squares_kwargs = dict(least_squares_kwargs)
+        if "x_scale" not in least_squares_kwargs:
+            if sparse.issparse(fit.jac):
+                col_norm = np.sqrt(np.asarray(fit.jac.multiply(fit.jac).sum(axis=0))).ravel()
+            else:
+                col_norm = np.linalg.norm(fit.jac,axis=0)
+            bad_mask = np.logical_or(col_norm == 0,
+                                     np.logical_not(np.isfinite(col_norm)))
+            col_norm[bad_mask] = 1.0
+            least_squares_kwargs["x_scale"] = 1/col_norm
+
+        return fit.x.copy(), least_squares_kwargs
+
     def _update_fit_df(self):
         """
         Recalculate the parameter estimates from any new samples.
@@ -159,23 +321,6 @@ class BootstrapFitter(Fitter):
         estimate = get_kde_max(self._samples)
         std = np.std(samples,axis=0)
 
-        # Calculate 95% confidence intervals
-        lower = int(round(0.025*samples.shape[0],0))
-        upper = int(round(0.975*samples.shape[0],0))
-
-        # For samples less than ~100, the rounding above will make the
-        # the upper cutoff the number of samples, and thus lead to an index 
-        # error below. 
-        if upper >= samples.shape[0]:
-            upper = samples.shape[0] - 1
-
-        low_95 = []
-        high_95 = []
-        for i in range(samples.shape[1]):
-            sorted_samples = np.sort(samples[:,i])
-            low_95.append(sorted_samples[lower])
-            high_95.append(sorted_samples[upper])
-
         # Get finalized parameters from param_df in case they were updated 
         # after the model was set and the fit_df created. 
         for col in ["guess","fixed","lower_bound","upper_bound","prior_mean",
@@ -188,8 +333,9 @@ class BootstrapFitter(Fitter):
         self._fit_df.loc[unfixed,"estimate"] = estimate
         self._fit_df.loc[fixed,"estimate"] = self._fit_df.loc[fixed,"guess"]
         self._fit_df.loc[unfixed,"std"] = std
-        self._fit_df.loc[unfixed,"low_95"] = low_95
-        self._fit_df.loc[unfixed,"high_95"] = high_95
+
+        # Calculate 95% (and any extra) confidence intervals
+        self._update_fit_df_intervals(samples,unfixed)
 
     
     @property
@@ -203,6 +349,15 @@ class BootstrapFitter(Fitter):
         if hasattr(self,"_num_bootstrap"):
             output["Num bootstrap"] = self._num_bootstrap
 
+        if hasattr(self,"_num_workers"):
+            output["Num workers"] = self._num_workers
+
+        if hasattr(self,"_warm_start"):
+            output["Warm start"] = self._warm_start
+
+        if getattr(self,"_extra_intervals",None):
+            output["Extra intervals"] = self._extra_intervals
+
         return output
     
     def __repr__(self):
@@ -3,14 +3,62 @@ Fitter subclass for performing maximum likelihood fits.
 """
 
 from dataprob.fitters.base import Fitter
+from dataprob.fitters.base import _get_least_squares_kwargs
 from dataprob.util.check import check_int
 
 import numpy as np
-import scipy.stats
 import scipy.optimize as optimize
+from scipy import special
+from scipy import sparse
+from scipy import linalg
+from scipy.sparse import linalg as sparse_linalg
 
 import warnings
 
+def _get_covariance_from_jac(J):
+    """
+    Get the parameter covariance matrix, inv(2*J.T@J), from the Jacobian of
+    the weighted residuals. This is found by factorizing 2*J.T@J rather than
+    inverting it: a sparse LU factorization if J is sparse, a Cholesky
+    factorization otherwise. 
+
+    Parameters
+    ----------
+    J : numpy.ndarray or scipy.sparse matrix
+        Jacobian with shape (num_obs,num_unfixed_params)
+
+    Returns
+    -------
+    cov : numpy.ndarray
+        covariance matrix with shape (num_unfixed_params,num_unfixed_params)
+
+    Raises
+    ------
+    np.linalg.LinAlgError
+        if 2*J.T@J is singular
+    """
+
+    identity = np.eye(J.shape[1])
+
+    if sparse.issparse(J):
+        J = sparse.csc_matrix(J)
+        try:
+            lu = sparse_linalg.splu(sparse.csc_matrix(2*(J.T @ J)))
+        except RuntimeError as e:
+            raise np.linalg.LinAlgError(str(e)) from e
+        cov = lu.solve(identity)
+        if not np.all(np.isfinite(cov)):
+            err = "singular matrix"
+            raise np.linalg.LinAlgError(err)
+        return cov
+
+    try:
+        factor = linalg.cho_factor(2*np.dot(J.T,J))
+    except ValueError as e:
+        raise np.linalg.LinAlgError(str(e)) from e
+
+    return linalg.cho_solve(factor,identity)
+
 class MLFitter(Fitter):
     """
     Fit the model to the data using nonlinear least squares.
@@ -68,6 +116,11 @@ class MLFitter(Fitter):
         guesses = np.array(self._model.param_df.loc[to_fit,"guess"]).copy()
         bounds = np.array([self._model.param_df.loc[to_fit,"lower_bound"],
                            self._model.param_df.loc[to_fit,"upper_bound"]]).copy()
+        # Use an analytic Jacobian or the declared sparsity structure if the
+        # model has them
+        inv_std, _, _ = self._get_obs_constants()
+        kwargs = _get_least_squares_kwargs(self._model,kwargs,inv_std=inv_std)
+
         # Do the actual fit
         def fn(*args): return -self._weighted_residuals(*args)
         self._fit_result = optimize.least_squares(fn,
@@ -83,6 +136,14 @@ class MLFitter(Fitter):
     
         self._update_fit_df()
 
+    def _get_covariance(self):
+        """
+        Get the parameter covariance matrix from the Jacobian at the fit 
+        estimate. Raises np.linalg.LinAlgError if the matrix is singular. 
+        """
+
+        return _get_covariance_from_jac(self._fit_result.jac)
+
     def _update_fit_df(self):
         """
         Recalculate the parameter estimates from any new samples.
@@ -95,13 +156,12 @@ class MLFitter(Fitter):
         P = len(self._fit_result.x)
 
         try:
-            J = self._fit_result.jac
-            cov = np.linalg.inv(2*np.dot(J.T,J))
+            cov = self._get_covariance()
 
             std = np.sqrt(np.diagonal(cov)) #variance
 
             # 95% confidence intervals from standard error
-            z = scipy.stats.t(N-P-1).ppf(0.975)
+            z = special.stdtrit(N-P-1,0.975)
             c1 = estimate - z*std
             c2 = estimate + z*std
 
@@ -160,8 +220,7 @@ class MLFitter(Fitter):
             return None
                 
         try:
-            J = self._fit_result.jac
-            cov = np.linalg.inv(2*np.dot(J.T,J))
+            cov = self._get_covariance()
             chol_cov = np.linalg.cholesky(cov).T
         except np.linalg.LinAlgError:
             w = "\n\nJacobian matrix was singular. Could not generate parameter samples.\n\n"
@@ -4,13 +4,16 @@ Public constructor used to set up analyses.
 
 from dataprob.fitters.ml import MLFitter
 from dataprob.fitters.bootstrap import BootstrapFitter
-from dataprob.fitters.bayesian.bayesian_sampler import BayesianSampler
 
 def setup(some_function,
           method="ml",
           fit_parameters=None,
           non_fit_kwargs=None,
-          vector_first_arg=False):
+          vector_first_arg=False,
+          vectorized=False,
+          jacobian_function=None,
+          jac_sparsity=None,
+          engine="numpy"):
     """
     Set up a dataprob analysis. 
 
@@ -35,6 +38,28 @@ def setup(some_function,
         parameters to fit. All other arguments to some_function are treated as 
         non-fittable parameters. Fit_parameters must then specify the names of
         each vector element. 
+    vectorized : bool, default=False
+        If True, some_function can evaluate many parameter sets in a single 
+        call. Each fit parameter is passed in as a (num_samples,1) column 
+        array and the function returns a (num_samples,num_obs) array. The
+        Bayesian sampler uses this to evaluate all walkers at once.
+    jacobian_function : callable, optional
+        Function that takes the same arguments as some_function and returns 
+        the derivative of its output with respect to each fit parameter as a
+        (num_obs,num_params) array. Column order matches the fit parameters 
+        in param_df. If set, the ML and bootstrap fitters pass it to 
+        scipy.optimize.least_squares instead of using finite differences. 
+    jac_sparsity : array-like or scipy.sparse matrix, optional
+        (num_obs,num_params) array whose nonzero entries mark which fit 
+        parameters each observation depends on. Column order matches the fit
+        parameters in param_df. If set, the ML and bootstrap fitters use 
+        sparse finite differences and a sparse trust-region solver. 
+    engine : str, default="numpy"
+        how to calculate residuals and log likelihoods. "numpy" or "numba". 
+        "numba" compiles the model call together with the residual and log
+        likelihood calculations; it requires numba and a model decorated with
+        ``@numba.njit``. If either is missing, the fitter warns and uses 
+        numpy. 
 
     Returns
     -------
@@ -177,9 +202,11 @@ def setup(some_function,
     """
 
     
+    # BayesianSampler is looked up only when requested because it pulls in
+    # emcee
     method_map = {"ml":MLFitter,
                   "bootstrap":BootstrapFitter,
-                  "mcmc":BayesianSampler}
+                  "mcmc":None}
     
     if method not in method_map:
         err = "method should be one of:\n"
@@ -187,7 +214,15 @@ def setup(some_function,
             err += f"    {k}\n"
         raise ValueError(err)
     
+    if method == "mcmc":
+        from dataprob.fitters.bayesian.bayesian_sampler import BayesianSampler
+        method_map["mcmc"] = BayesianSampler
+
     return method_map[method](some_function=some_function,
                               fit_parameters=fit_parameters,
                               non_fit_kwargs=non_fit_kwargs,
-                              vector_first_arg=vector_first_arg)
\ No newline at end of file
+                              vector_first_arg=vector_first_arg,
+                              vectorized=vectorized,
+                              jacobian_function=jacobian_function,
+                              jac_sparsity=jac_sparsity,
+                              engine=engine)
\ No newline at end of file
@@ -8,6 +8,8 @@ import inspect
 KWARGS_KIND = inspect.Parameter.VAR_KEYWORD
 ARGS_KIND = inspect.Parameter.VAR_POSITIONAL
 EMPTY_DEFAULT = inspect.Parameter.empty
+POSITIONAL_KINDS = (inspect.Parameter.POSITIONAL_ONLY,
+                    inspect.Parameter.POSITIONAL_OR_KEYWORD)
 
 def analyze_fcn_sig(fcn):
     """
@@ -82,6 +84,34 @@ def analyze_fcn_sig(fcn):
     return all_args, can_be_fit, cannot_be_fit, has_kwargs
 
 
+def get_positional_args(fcn):
+    """
+    Get the arguments of a function that can be passed by position.
+
+    Parameters
+    ----------
+    fcn : callable
+        function or method used for fitting
+
+    Returns
+    -------
+    positional_args : list
+        list of string names for the leading arguments that can be passed by
+        position, in signature order. This stops at *args or the first
+        keyword-only argument. 
+    """
+
+    sig = inspect.signature(fcn)
+
+    positional_args = []
+    for p in sig.parameters:
+        if sig.parameters[p].kind not in POSITIONAL_KINDS:
+            break
+        positional_args.append(p)
+
+    return positional_args
+
+
 def reconcile_fittable(fit_parameters,
                        non_fit_kwargs,
                        all_args,
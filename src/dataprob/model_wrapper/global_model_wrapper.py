@@ -0,0 +1,428 @@
+"""
+Class for fitting several models and datasets at once, with some parameters
+shared between datasets and others local to each dataset.
+"""
+
+from dataprob.model_wrapper.model_wrapper import ModelWrapper
+from dataprob.model_wrapper.wrap_function import wrap_function
+from dataprob.model_wrapper._dataframe_processing import validate_dataframe
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import copy
+
+class GlobalModelWrapper(ModelWrapper):
+    """
+    Wrap several models for a global fit. The output of the global model is
+    the outputs of the component models concatenated in order, so y_obs and
+    y_std for the fit are the per-dataset observations concatenated in the
+    same order.
+
+    Parameters named in ``shared_parameters`` become a single global parameter
+    used by every component model that has a parameter with that name. All
+    other parameters are local to their component and are renamed
+    ``{name}_{i}``, where i is the index of the component in ``models``.
+
+    Each observation depends only on the parameters of its own component, so
+    the Jacobian is block-sparse. This structure is exposed by
+    ``jac_sparsity`` and, if every component has an analytic Jacobian,
+    ``fast_jacobian`` returns a sparse matrix.
+    """
+
+    def __init__(self,
+                 models,
+                 shared_parameters=None):
+        """
+        Parameters
+        ----------
+        models : list-like
+            list of ModelWrapper instances or callables. Callables are wrapped
+            with default settings (see dataprob.wrap_function). The wrappers
+            are copied, so later changes to the inputs do not affect the
+            global model.
+        shared_parameters : list-like, optional
+            names of parameters shared between models. Every shared parameter
+            must be a parameter in at least one model.
+        """
+
+        if not hasattr(models,"__iter__") or issubclass(type(models),str):
+            err = "models should be a list of ModelWrapper instances or callables\n"
+            raise ValueError(err)
+
+        models = list(models)
+        if len(models) == 0:
+            err = "models must have at least one model\n"
+            raise ValueError(err)
+
+        if shared_parameters is None:
+            shared_parameters = []
+        if not hasattr(shared_parameters,"__iter__") or issubclass(type(shared_parameters),str):
+            err = "shared_parameters should be a list of parameter names\n"
+            raise ValueError(err)
+        shared_parameters = list(shared_parameters)
+
+        self._default_guess = 0.0
+        self._non_fit_kwargs = {}
+        self._non_fit_kwargs_keys = set()
+
+        self._load_models(models=models,
+                          shared_parameters=shared_parameters)
+
+    def _load_models(self,models,shared_parameters):
+        """
+        Copy the component models and build the global param_df and the map
+        between global parameters and the parameters of each component.
+
+        Parameters
+        ----------
+        models : list
+            list of ModelWrapper instances or callables
+        shared_parameters : list
+            names of parameters shared between models
+        """
+
+        # Wrap or copy the component models
+        self._models = []
+        for m in models:
+            if issubclass(type(m),ModelWrapper):
+                self._models.append(copy.deepcopy(m))
+            elif hasattr(m,"__call__"):
+                self._models.append(wrap_function(m))
+            else:
+                err = f"model '{m}' should be a ModelWrapper instance or callable\n"
+                raise ValueError(err)
+
+        # Make sure each shared parameter is in at least one model
+        all_names = set()
+        for m in self._models:
+            all_names.update(m._fit_params_in_order)
+        missing = [p for p in shared_parameters if p not in all_names]
+        if len(missing) > 0:
+            err = f"shared_parameters {missing} are not parameters in any model\n"
+            raise ValueError(err)
+        shared_parameters = set(shared_parameters)
+
+        # Build the global parameter rows. The first model with a shared
+        # parameter sets its guess, bounds, and priors.
+        global_names = []
+        global_rows = []
+        global_index = {}
+        local_names = set()
+        self._param_indexes = []
+        for i, m in enumerate(self._models):
+
+            m.finalize_params()
+
+            idx = []
+            for p in m._fit_params_in_order:
+
+                # Shared parameters keep their name; local parameters get the
+                # model index. Names cannot collide between the two. 
+                if p in shared_parameters:
+                    name = p
+                    collision = name in local_names
+                else:
+                    name = f"{p}_{i}"
+                    collision = name in global_index
+                    local_names.add(name)
+
+                if collision:
+                    err = f"parameter '{p}' in model {i} has the same global\n"
+                    err += f"name ('{name}') as another parameter. Please rename\n"
+                    err += "the parameter.\n"
+                    raise ValueError(err)
+
+                if name not in global_index:
+                    global_index[name] = len(global_names)
+                    global_names.append(name)
+                    row = m.param_df.loc[p,:].copy()
+                    row["name"] = name
+                    global_rows.append(row)
+
+                idx.append(global_index[name])
+
+            self._param_indexes.append(np.array(idx,dtype=int))
+
+        # Component models are always called with all of their parameters.
+        # Which parameters are fixed is controlled by the global param_df.
+        for m in self._models:
+            param_df = m.param_df.copy()
+            param_df["fixed"] = False
+            m.param_df = param_df
+            m.finalize_params()
+
+        self._fit_params_in_order = global_names[:]
+        param_df = pd.DataFrame(global_rows).reset_index(drop=True)
+        self._param_df = validate_dataframe(param_df,
+                                            param_in_order=self._fit_params_in_order,
+                                            default_guess=self._default_guess)
+
+        self.finalize_params()
+
+    def finalize_params(self):
+        """
+        Validate current state of param_df and build map between parameters
+        and the model arguments. This will be called by a Fitter instance
+        before doing a fit. This does nothing if param_df has not changed since
+        the last call.
+        """
+
+        if self._params_unchanged():
+            return
+
+        self._param_df = validate_dataframe(param_df=self._param_df,
+                                            param_in_order=self._fit_params_in_order,
+                                            default_guess=self._default_guess)
+
+        # Get currently un-fixed parameters
+        self._unfixed_mask = np.array(np.logical_not(self._param_df["fixed"]),dtype=bool)
+        self._unfixed_param_names = np.array(self._param_df.loc[self._unfixed_mask,"name"]).copy()
+
+        # Create all param vector
+        self._all_param_vector = np.array(self._param_df["guess"],dtype=float).copy()
+
+        # Number of observations from each model. Found when first needed.
+        self._model_num_obs = None
+
+        self._record_finalized_params()
+
+    def model(self,params=None):
+        """
+        Model observable. This function takes a numpy array either the number of
+        unfixed parameters long OR the total number of parameters long. If
+        parameters are fixed, their values in a params array with all fit
+        parameters are *ignored* and the fixed parameter guesses are used
+        instead.
+
+        Parameters
+        ----------
+        params : numpy.ndarray, optional
+            float numpy array with parameter values. If this is not specified,
+            the model is run using the parameter guess values.
+        """
+
+        self.finalize_params()
+
+        all_params = np.array(self._param_df["guess"],dtype=float).copy()
+
+        if params is None:
+            params = all_params
+
+        params = np.array(params,dtype=float)
+
+        if len(params) == len(all_params):
+            params = params[self._unfixed_mask]
+
+        if len(params) != np.sum(self._unfixed_mask):
+            err = f"params length ({len(params)}) must either correspond to\n"
+            err += f"the total number of parameters ({len(self._param_df)})\n"
+            err += f"or the number of unfixed parameters ({np.sum(self._unfixed_mask)}).\n"
+            raise ValueError(err)
+
+        try:
+            return self.fast_model(params)
+        except Exception as e:
+            err = "\n\nThe wrapped model threw an error (see trace).\n\n"
+            raise RuntimeError(err) from e
+
+    def fast_model(self,params):
+        """
+        Calculate model result with minimal error checking.
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            vector of unfixed parameter values
+
+        Returns
+        -------
+        out : numpy.ndarray
+            outputs of all component models, concatenated
+        """
+
+        self._all_param_vector[self._unfixed_mask] = params
+
+        out = []
+        for m, idx in zip(self._models,self._param_indexes):
+            out.append(np.asarray(m.fast_model(self._all_param_vector[idx]),
+                                  dtype=float))
+
+        return np.concatenate(out)
+
+    def fast_model_batch(self,params):
+        """
+        Calculate model results for many parameter sets with minimal error
+        checking. Each component model is evaluated with its own
+        fast_model_batch.
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            float numpy array with shape (num_samples,num_unfixed_params)
+
+        Returns
+        -------
+        out : numpy.ndarray
+            float numpy array with shape (num_samples,num_obs)
+        """
+
+        all_params = np.repeat(self._all_param_vector[None,:],
+                               params.shape[0],
+                               axis=0)
+        all_params[:,self._unfixed_mask] = params
+
+        out = []
+        for m, idx in zip(self._models,self._param_indexes):
+            out.append(m.fast_model_batch(all_params[:,idx]))
+
+        return np.concatenate(out,axis=1)
+
+    def fast_jacobian(self,params):
+        """
+        Calculate the Jacobian of the global model from the Jacobians of the
+        component models. Every component model must have a jacobian
+        function.
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            vector of unfixed parameter values
+
+        Returns
+        -------
+        out : scipy.sparse.csr_matrix
+            sparse float matrix with shape (num_obs,num_unfixed_params)
+        """
+
+        self._all_param_vector[self._unfixed_mask] = params
+
+        rows = []
+        cols = []
+        values = []
+        offset = 0
+        for m, idx in zip(self._models,self._param_indexes):
+
+            jac = m.fast_jacobian(self._all_param_vector[idx])
+            r, c = np.indices(jac.shape)
+
+            rows.append(r.ravel() + offset)
+            cols.append(idx[c.ravel()])
+            values.append(jac.ravel())
+
+            offset += jac.shape[0]
+
+        jac = sparse.csr_matrix((np.concatenate(values),
+                                 (np.concatenate(rows),np.concatenate(cols))),
+                                shape=(offset,len(self._all_param_vector)))
+
+        return jac[:,self._unfixed_mask]
+
+    def _get_model_num_obs(self):
+        """
+        Get the number of observations from each component model, running
+        each model at the current parameter guesses if this is not yet known.
+        """
+
+        self.finalize_params()
+
+        if self._model_num_obs is None:
+            num_obs = []
+            for m, idx in zip(self._models,self._param_indexes):
+                y = m.fast_model(self._all_param_vector[idx])
+                num_obs.append(len(np.atleast_1d(y)))
+            self._model_num_obs = np.array(num_obs,dtype=int)
+
+        return self._model_num_obs
+
+    @property
+    def models(self):
+        """
+        List of the component ModelWrapper instances. These should not be
+        modified; set parameter features with the global param_df.
+        """
+
+        return self._models
+
+    @property
+    def obs_slices(self):
+        """
+        List of slices that pull the observations for each component model
+        out of the concatenated global observable (e.g.
+        ``y_calc[gmw.obs_slices[2]]``).
+        """
+
+        num_obs = self._get_model_num_obs()
+        edges = np.concatenate([[0],np.cumsum(num_obs)])
+
+        return [slice(int(edges[i]),int(edges[i+1]))
+                for i in range(len(num_obs))]
+
+    @property
+    def jac_sparsity(self):
+        """
+        Sparsity structure of the Jacobian as a scipy.sparse.csr_matrix with
+        shape (num_obs,num_unfixed_params). Entry (i,j) is 1 if observation i
+        can depend on unfixed parameter j and 0 otherwise.
+        """
+
+        num_obs = self._get_model_num_obs()
+
+        rows = []
+        cols = []
+        offset = 0
+        for n, idx in zip(num_obs,self._param_indexes):
+            r, c = np.indices((n,len(idx)))
+            rows.append(r.ravel() + offset)
+            cols.append(idx[c.ravel()])
+            offset += n
+
+        rows = np.concatenate(rows)
+        structure = sparse.csr_matrix((np.ones(len(rows),dtype=int),
+                                       (rows,np.concatenate(cols))),
+                                      shape=(offset,len(self._all_param_vector)))
+
+        return structure[:,self._unfixed_mask]
+
+    @property
+    def vectorized(self):
+        """
+        Whether every component model is vectorized (see
+        ModelWrapper.vectorized).
+        """
+
+        return all([m.vectorized for m in self._models])
+
+    @property
+    def jacobian(self):
+        """
+        If every component model has a jacobian function, this is
+        fast_jacobian; otherwise, it is None.
+        """
+
+        if all([m.jacobian is not None for m in self._models]):
+            return self.fast_jacobian
+
+        return None
+
+    def __repr__(self):
+        """
+        Useful summary of current model wrapper state.
+        """
+
+        self.finalize_params()
+
+        out = ["GlobalModelWrapper\n------------------\n"]
+
+        out.append(f"  component models:\n")
+        for i, m in enumerate(self._models):
+            out.append(f"    {i}: {m._model_to_fit.__name__}")
+        out.append("\n")
+
+        out.append(f"  fittable parameters:\n")
+        for dataframe_line in repr(self.param_df).split("\n"):
+            out.append(f"    {dataframe_line}")
+        out.append("\n")
+
+        return "\n".join(out)
@@ -4,15 +4,20 @@ Class for wrapping functions for use in likelihood calculations.
 
 from dataprob.model_wrapper._function_processing import analyze_fcn_sig
 from dataprob.model_wrapper._function_processing import reconcile_fittable
+from dataprob.model_wrapper._function_processing import get_positional_args
 
 from dataprob.util.read_spreadsheet import read_spreadsheet
 from dataprob.model_wrapper._dataframe_processing import validate_dataframe
 from dataprob.model_wrapper._dataframe_processing import param_into_existing
 
 from dataprob.util.check import check_float
+from dataprob.util.check import check_bool
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
+
+import operator
 
 class ModelWrapper:
     """
@@ -36,7 +41,10 @@ class ModelWrapper:
                  model_to_fit,
                  fit_parameters=None,
                  non_fit_kwargs=None,
-                 default_guess=0.0):
+                 default_guess=0.0,
+                 vectorized=False,
+                 jacobian=None,
+                 jac_sparsity=None):
         """
         Parameters
         ----------
@@ -49,6 +57,15 @@ class ModelWrapper:
             be fit but need to be specified to non-default values. 
         default_guess : float, default=0
             assign parameters with no default value this value
+        vectorized : bool, default=False
+            whether model_to_fit can evaluate many parameter sets in a single
+            call. See the ``vectorized`` property for details. 
+        jacobian : callable, optional
+            function returning the derivative of model_to_fit with respect to
+            each fit parameter. See the ``jacobian`` property for details. 
+        jac_sparsity : array-like or scipy.sparse matrix, optional
+            which fit parameters each observation depends on. See the 
+            ``jac_sparsity`` property for details. 
         """
 
         # Make sure input model is callable
@@ -71,6 +88,9 @@ class ModelWrapper:
 
         self._default_guess = check_float(value=default_guess,
                                           variable_name="default_guess")
+        
+        self.vectorized = vectorized
+        self.jacobian = jacobian
 
         # Re-define these here so __setattr__ and __getattr__ end up looking at
         # instance-level (__dict__) attributes rather than class-level
@@ -81,6 +101,9 @@ class ModelWrapper:
         self._load_model(model_to_fit=model_to_fit,
                          fit_parameters=fit_parameters,
                          non_fit_kwargs=non_fit_kwargs)
+
+        # Set after the model is loaded so we know the number of parameters
+        self.jac_sparsity = jac_sparsity
         
 
     def _load_model(self,model_to_fit,fit_parameters,non_fit_kwargs):
@@ -141,6 +164,9 @@ class ModelWrapper:
 
         # Fix the order of the fit parameters
         self._fit_params_in_order = fit_param_names[:]
+
+        # Arguments fast_model can pass to the model by position
+        self._positional_args = get_positional_args(self._model_to_fit)
         
         # Build a param_df dataframe
         param_df = pd.DataFrame({"name":fit_param_names,
@@ -204,12 +230,53 @@ class ModelWrapper:
             raise ValueError(err)
 
 
+    def _params_unchanged(self):
+        """
+        Check whether param_df and non_fit_kwargs are unchanged since the last
+        call to finalize_params. param_df is compared by value (users can edit
+        it in place); non_fit_kwargs values are compared by identity.
+
+        Returns
+        -------
+        unchanged : bool
+            True if finalize_params does not need to do anything
+        """
+
+        finalized_param_df = getattr(self,"_finalized_param_df",None)
+        if finalized_param_df is None:
+            return False
+
+        finalized_non_fit_kwargs = self._finalized_non_fit_kwargs
+        if len(self._non_fit_kwargs) != len(finalized_non_fit_kwargs):
+            return False
+
+        for k in self._non_fit_kwargs:
+            if k not in finalized_non_fit_kwargs:
+                return False
+            if self._non_fit_kwargs[k] is not finalized_non_fit_kwargs[k]:
+                return False
+
+        return self._param_df.equals(finalized_param_df)
+
+    def _record_finalized_params(self):
+        """
+        Record the param_df and non_fit_kwargs used by finalize_params so
+        later calls can skip validation if nothing has changed. 
+        """
+
+        self._finalized_param_df = self._param_df.copy()
+        self._finalized_non_fit_kwargs = dict(self._non_fit_kwargs)
+
     def finalize_params(self):
         """
         Validate current state of param_df and build map between parameters
         and the model arguments. This will be called by a Fitter instance 
-        before doing a fit. 
+        before doing a fit. This does nothing if param_df and non_fit_kwargs
+        have not changed since the last call. 
         """
+
+        if self._params_unchanged():
+            return
     
         # Make sure the parameter dataframe is sane. It could have problems 
         # because we let the user edit it directly.
@@ -231,6 +298,93 @@ class ModelWrapper:
             
         self._mw_kwargs.update(self._non_fit_kwargs)
 
+        self._build_call_plan()
+
+        self._record_finalized_params()
+
+    def _build_call_plan(self):
+        """
+        Compile how fast_model passes arguments to the model. Arguments that
+        can be passed by position are held in a list template (_call_args);
+        any others go in a keyword dictionary (_call_kwargs). Unfixed
+        parameters are written into the template in one step: a slice
+        assignment if they occupy consecutive slots (the usual case), or an
+        operator.itemgetter gather otherwise. 
+        """
+
+        # Leading arguments that we have values for can go by position
+        positional = []
+        for p in self._positional_args:
+            if p not in self._mw_kwargs:
+                break
+            positional.append(p)
+        slot_lookup = {p:i for i, p in enumerate(positional)}
+
+        self._call_positional = positional
+        self._call_args = [self._mw_kwargs[p] for p in positional]
+        self._call_kwargs = {k:v for k, v in self._mw_kwargs.items()
+                             if k not in slot_lookup}
+
+        # Slot in the template for each unfixed parameter passed by position
+        slots = {}
+        self._call_kwarg_params = []
+        for i, p in enumerate(self._unfixed_param_names):
+            if p in slot_lookup:
+                slots[slot_lookup[p]] = i
+            else:
+                self._call_kwarg_params.append((i,p))
+
+        # If a run of unfixed parameters fills consecutive slots (the usual
+        # case), fast_model does a slice assignment into the template. 
+        # Otherwise, it gathers the positional arguments from the parameter
+        # values followed by the other template values. 
+        start = min(slots) if len(slots) > 0 else 0
+        first = slots.get(start,0)
+        consecutive = all([slots.get(start + i,None) == first + i
+                           for i in range(len(slots))])
+        if consecutive:
+            self._call_slice = slice(start,start + len(slots))
+            self._call_values_slice = slice(first,first + len(slots))
+            self._call_getter = None
+            self._call_constants = None
+        else:
+            self._call_slice = None
+            self._call_values_slice = None
+            self._call_constants = []
+            order = []
+            for i, v in enumerate(self._call_args):
+                if i in slots:
+                    order.append(slots[i])
+                else:
+                    order.append(len(self._unfixed_param_names) + len(self._call_constants))
+                    self._call_constants.append(v)
+            self._call_getter = operator.itemgetter(*order)
+
+        self._build_jacobian_call()
+
+    def _build_jacobian_call(self):
+        """
+        Decide whether fast_jacobian can pass the call plan's positional
+        arguments to the jacobian by position. This requires the jacobian's
+        leading arguments to have the same names, in the same order, as the
+        model arguments the plan passes by position. Otherwise fast_jacobian
+        passes every argument by keyword. 
+        """
+
+        self._jacobian_by_position = False
+        jacobian = getattr(self,"_jacobian",None)
+        if jacobian is None or not hasattr(self,"_call_positional"):
+            return
+
+        try:
+            jacobian_positional = get_positional_args(jacobian)
+        except (TypeError,ValueError):
+            return
+
+        num_positional = len(self._call_positional)
+        self._jacobian_by_position = (jacobian_positional[:num_positional]
+                                      == self._call_positional)
+
  
     def update_params(self,param_input):
         """
@@ -313,16 +467,96 @@ class ModelWrapper:
             err += f"or the number of unfixed parameters ({np.sum(self._unfixed_mask)}).\n"
             raise ValueError(err)
 
-        # Update kwargs
-        for i in range(len(params)):
-            self._mw_kwargs[self._unfixed_param_names[i]] = params[i]
+        # Copy so callers never hold an array the model may reuse or modify
+        try:
+            return self.fast_model(params).copy()
+        except Exception as e:
+            err = "\n\nThe wrapped model threw an error (see trace).\n\n"
+            raise RuntimeError(err) from e
+
+
+    def model_batch(self,params):
+        """
+        Model observable for many parameter sets. This function takes a 2D
+        numpy array with one row per parameter set. The number of columns must
+        either be the number of unfixed parameters OR the total number of 
+        parameters. If parameters are fixed, their values in a params array 
+        with all fit parameters are *ignored* and the fixed parameter guesses
+        are used instead. If the model is vectorized, it is called once for 
+        all parameter sets. 
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            float numpy array with shape (num_samples,num_params)
+
+        Returns
+        -------
+        out : numpy.ndarray
+            float numpy array with shape (num_samples,num_obs)
+        """
 
+        # Update mapping between parameters and model arguments in case
+        # user has fixed value or made a change that has not propagated properly
+        self.finalize_params()
+
+        unfixed_mask = np.array(self._unfixed_mask,dtype=bool)
+        num_unfixed = np.sum(unfixed_mask)
+
+        # make sure the params array is a 2D float array
+        params = np.array(params,dtype=float)
+        if len(params.shape) != 2:
+            err = "params must be a 2D array with shape (num_samples,num_params)\n"
+            raise ValueError(err)
+
+        # If this is as long as all_fit parameters, pull out only the fit 
+        # parameters we care about. 
+        if params.shape[1] == len(unfixed_mask):
+            params = params[:,unfixed_mask]
+
+        if params.shape[1] != num_unfixed:
+            err = f"params width ({params.shape[1]}) must either correspond to\n"
+            err += f"the total number of parameters ({len(unfixed_mask)})\n"
+            err += f"or the number of unfixed parameters ({num_unfixed}).\n"
+            raise ValueError(err)
+        
         try:
-            return np.array(self._model_to_fit(**self._mw_kwargs))
+            return self.fast_model_batch(params)
         except Exception as e:
             err = "\n\nThe wrapped model threw an error (see trace).\n\n"
             raise RuntimeError(err) from e
 
+    def _fill_call_args(self,params):
+        """
+        Fill the argument template compiled by finalize_params with the 
+        unfixed parameter values. Parameters passed by keyword are written 
+        into _call_kwargs. 
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            float numpy array the length of the number of unfixed parameters.
+
+        Returns
+        -------
+        args : list or tuple
+            positional arguments for the model
+        """
+
+        # Values stay numpy float64 scalars (not python floats) so the model 
+        # sees numpy arithmetic (e.g. 1/0 -> inf rather than 
+        # ZeroDivisionError). 
+        values = list(np.asarray(params,dtype=float))
+        if self._call_getter is None:
+            self._call_args[self._call_slice] = values[self._call_values_slice]
+            args = self._call_args
+        else:
+            args = self._call_getter(values + self._call_constants)
+
+        for i, p in self._call_kwarg_params:
+            self._call_kwargs[p] = values[i]
+
+        return args
 
     def fast_model(self,params):
         """
@@ -337,14 +571,78 @@ class ModelWrapper:
         Returns
         -------
         out : numpy.ndarray
-            result of model(params)
+            result of model(params). If the model returns a float64 numpy 
+            array, this is that array (not a copy). 
         """
 
-        # Update kwargs
-        for i in range(len(params)):
-            self._mw_kwargs[self._unfixed_param_names[i]] = params[i]
+        args = self._fill_call_args(params)
+        out = self._model_to_fit(*args,**self._call_kwargs)
+        if type(out) is np.ndarray and out.dtype == np.float64:
+            return out
         
-        return np.array(self._model_to_fit(**self._mw_kwargs))
+        return np.array(out)
+
+    def fast_jacobian(self,params):
+        """
+        Calculate the model Jacobian with minimal error checking. params 
+        *must* be an array the same length as the number of unfixed 
+        parameters. The jacobian function must be set. 
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            float numpy array the length of the number of unfixed parameters.
+
+        Returns
+        -------
+        out : numpy.ndarray
+            float numpy array with shape (num_obs,num_unfixed_params)
+        """
+
+        # Pass the same arguments fast_model passes to the model
+        args = self._fill_call_args(params)
+        if self._jacobian_by_position:
+            jac = self._jacobian(*args,**self._call_kwargs)
+        else:
+            kwargs = dict(zip(self._call_positional,args))
+            kwargs.update(self._call_kwargs)
+            jac = self._jacobian(**kwargs)
+
+        jac = np.array(jac,dtype=float)
+        return jac[:,self._unfixed_mask]
+
+    def fast_model_batch(self,params):
+        """
+        Calculate model results for many parameter sets with minimal error
+        checking. params *must* be a 2D array with one row per parameter set
+        and one column per unfixed parameter. If the model is vectorized, it
+        is called once for all parameter sets; otherwise, it is called once
+        for each row of params. 
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            float numpy array with shape (num_samples,num_unfixed_params)
+
+        Returns
+        -------
+        out : numpy.ndarray
+            float numpy array with shape (num_samples,num_obs)
+        """
+
+        # Copy each output; a model that reuses its output array would 
+        # otherwise give the same row for every parameter set
+        if not self._vectorized:
+            return np.array([self.fast_model(p).copy() for p in params],
+                            dtype=float)
+
+        # Pass each unfixed parameter in as a (num_samples,1) column so it
+        # broadcasts against the other arguments to the model
+        kwargs = self._mw_kwargs.copy()
+        for i in range(params.shape[1]):
+            kwargs[self._unfixed_param_names[i]] = params[:,i:i+1]
+
+        return np.array(self._model_to_fit(**kwargs),dtype=float)
 
 
     @property
@@ -409,6 +707,91 @@ class ModelWrapper:
 
         return self._non_fit_kwargs
     
+    @property
+    def vectorized(self):
+        """
+        Whether the wrapped model can evaluate many parameter sets in a single
+        call. If True, ``fast_model_batch`` passes each fit parameter into the
+        model as a column array with shape (num_samples,1) rather than as a 
+        single float. (For a model with a vector first argument, this vector
+        has shape (num_params,num_samples,1)). The model must then broadcast
+        these columns against its other arguments and return an array with
+        shape (num_samples,num_obs). A simple numpy model like 
+        ``def linear(m,b,x): return m*x + b`` already satisfies this contract.
+        """
+
+        return self._vectorized
+
+    @vectorized.setter
+    def vectorized(self,vectorized):
+        self._vectorized = check_bool(value=vectorized,
+                                      variable_name="vectorized")
+
+    @property
+    def jacobian(self):
+        """
+        Function returning the Jacobian of the wrapped model (or None if not
+        set). It takes the same arguments as the model and returns a float
+        array with shape (num_obs,num_params), where column j is the 
+        derivative of the model output with respect to the jth parameter in
+        param_df. Columns for fixed parameters are ignored. 
+        """
+
+        return self._jacobian
+    
+    @jacobian.setter
+    def jacobian(self,jacobian):
+        if jacobian is not None and not hasattr(jacobian,"__call__"):
+            err = f"jacobian '{jacobian}' should be callable\n"
+            raise ValueError(err)
+        self._jacobian = jacobian
+        self._build_jacobian_call()
+
+    @property
+    def jac_sparsity(self):
+        """
+        Sparsity structure of the model Jacobian as a scipy.sparse.csr_matrix
+        with shape (num_obs,num_unfixed_params), or None if the Jacobian is
+        treated as dense. Entry (i,j) is nonzero if observation i can depend
+        on unfixed parameter j. This is set with an array-like or sparse 
+        matrix with shape (num_obs,num_params), where column j corresponds to 
+        the jth parameter in param_df. Fitters pass it to 
+        scipy.optimize.least_squares so finite differences and the trust 
+        region solver can exploit the sparsity. 
+        """
+
+        if self._jac_sparsity is None:
+            return None
+
+        self.finalize_params()
+        return self._jac_sparsity[:,np.array(self._unfixed_mask,dtype=bool)]
+
+    @jac_sparsity.setter
+    def jac_sparsity(self,jac_sparsity):
+
+        if jac_sparsity is None:
+            self._jac_sparsity = None
+            return
+
+        err = "jac_sparsity should be a 2D array-like or scipy.sparse matrix\n"
+        if not sparse.issparse(jac_sparsity):
+            try:
+                jac_sparsity = np.array(jac_sparsity,dtype=float)
+            except Exception as e:
+                raise ValueError(err) from e
+        if len(jac_sparsity.shape) != 2:
+            raise ValueError(err)
+
+        jac_sparsity = sparse.csr_matrix(jac_sparsity != 0,dtype=int)
+
+        if jac_sparsity.shape[1] != len(self._fit_params_in_order):
+            err = f"jac_sparsity has {jac_sparsity.shape[1]} columns, but there\n"
+            err += f"are {len(self._fit_params_in_order)} fit parameters. It should\n"
+            err += "have shape (num_obs,num_params).\n"
+            raise ValueError(err)
+
+        self._jac_sparsity = jac_sparsity
+
     @property
     def unfixed_mask(self):
         """
@@ -153,8 +153,12 @@ class VectorModelWrapper(ModelWrapper):
         """
         Validate current state of param_df and build map between parameters
         and the model arguments. This will be called by a Fitter instance 
-        before doing a fit. 
+        before doing a fit. This does nothing if param_df and non_fit_kwargs
+        have not changed since the last call. 
         """
+
+        if self._params_unchanged():
+            return
     
         # Make sure the parameter dataframe is sane. It could have problems 
         # because we let the user edit it directly.
@@ -172,6 +176,8 @@ class VectorModelWrapper(ModelWrapper):
         # Make sure the user has not altered non_fit_kwargs keys
         self._validate_non_fit_kwargs()
 
+        self._record_finalized_params()
+
 
     def model(self,params=None):
         """
@@ -238,3 +244,59 @@ class VectorModelWrapper(ModelWrapper):
         self._all_param_vector[self._unfixed_mask] = params
         return self._model_to_fit(self._all_param_vector,
                                   **self._non_fit_kwargs)
+    
+    def fast_jacobian(self,params):
+        """
+        Calculate the model Jacobian with minimal error checking. The
+        jacobian function must be set. 
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            vector of unfixed parameter values
+
+        Returns
+        -------
+        out : numpy.ndarray
+            float numpy array with shape (num_obs,num_unfixed_params)
+        """
+
+        self._all_param_vector[self._unfixed_mask] = params
+        jac = np.array(self._jacobian(self._all_param_vector,
+                                      **self._non_fit_kwargs),dtype=float)
+        return jac[:,self._unfixed_mask]
+
+    def fast_model_batch(self,params):
+        """
+        Calculate model results for many parameter sets with minimal error
+        checking. If the model is vectorized, it is called once with a 
+        parameter array with shape (num_params,num_samples,1); otherwise, it
+        is called once for each row of params. 
+
+        Parameters
+        ----------
+        params : numpy.ndarray
+            float numpy array with shape (num_samples,num_unfixed_params)
+
+        Returns
+        -------
+        out : numpy.ndarray
+            float numpy array with shape (num_samples,num_obs)
+        """
+
+        # Copy each output; a model that reuses its output array would 
+        # otherwise give the same row for every parameter set
+        if not self._vectorized:
+            return np.array([np.array(self.fast_model(p),dtype=float)
+                             for p in params],dtype=float)
+
+        # Build a (num_params,num_samples,1) array. Fixed parameters take the
+        # values in _all_param_vector for all samples. 
+        all_params = np.repeat(self._all_param_vector[:,None,None],
+                               params.shape[0],
+                               axis=1)
+        all_params[self._unfixed_mask,:,0] = params.T
+
+        return np.array(self._model_to_fit(all_params,
+                                           **self._non_fit_kwargs),
+                        dtype=float)
@@ -14,7 +14,10 @@ import pandas as pd
 def wrap_function(some_function,
                   fit_parameters=None,
                   non_fit_kwargs=None,
-                  vector_first_arg=False):
+                  vector_first_arg=False,
+                  vectorized=False,
+                  jacobian_function=None,
+                  jac_sparsity=None):
     """
     Wrap a function for regression or Bayesian sampling. 
 
@@ -35,6 +38,20 @@ def wrap_function(some_function,
         parameters to fit. All other arguments to some_function are treated as 
         non-fittable parameters. fit_parameters must then specify the names of
         each vector element. 
+    vectorized : bool, default=False
+        If True, some_function can evaluate many parameter sets in a single 
+        call. Each fit parameter is passed in as a (num_samples,1) column 
+        array and the function returns a (num_samples,num_obs) array. See 
+        ModelWrapper.vectorized for details. 
+    jacobian_function : callable, optional
+        Function that takes the same arguments as some_function and returns 
+        the derivative of its output with respect to each fit parameter as a
+        (num_obs,num_params) array. See ModelWrapper.jacobian for details. If
+        set, fitters use it instead of finite differences. 
+    jac_sparsity : array-like or scipy.sparse matrix, optional
+        (num_obs,num_params) array whose nonzero entries mark which fit 
+        parameters each observation depends on. See ModelWrapper.jac_sparsity
+        for details. 
 
     Returns
     -------
@@ -90,7 +107,10 @@ def wrap_function(some_function,
     # Create class with appropriate parameters
     mw = mw_class(model_to_fit=some_function,
                   fit_parameters=fit_param_list,
-                  non_fit_kwargs=non_fit_kwargs)
+                  non_fit_kwargs=non_fit_kwargs,
+                  vectorized=vectorized,
+                  jacobian=jacobian_function,
+                  jac_sparsity=jac_sparsity)
     
     # Update fit parameters with values
     mw.update_params(fit_param_values)
@@ -104,22 +104,16 @@ def plot_fit(f,
     # Plot the samples
     if num_samples > 0:
 
-        # Get a sample dataframe
-        sample_df = f.get_sample_df(num_samples=num_samples)
+        # Get sampled model outputs as an (num_obs,num_taken) array
+        sample_array = f.get_sample_df(num_samples=num_samples,as_array=True)
+        sample_array = sample_array[good_mask,:]
 
         # Plot every sample column
         label = "samples"
-        for c in sample_df.columns:
-            
-            # Skip y_obs, y_std, y_calc
-            if c[0] == "y":
-                continue
-
-            # Grab sample
-            s = sample_df.loc[:,c]
+        for i in range(sample_array.shape[1]):
 
             # Plot sample    
-            ax.plot(x_axis,s,label=label,**sample_line_style)
+            ax.plot(x_axis,sample_array[:,i],label=label,**sample_line_style)
 
             # After the first loop, turn off sample label to keep legend sane
             if label == "samples":
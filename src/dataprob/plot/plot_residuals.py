@@ -117,16 +117,14 @@ def plot_residuals(f,
     # Get residual samples
     if num_samples > 0:
 
-        sample_df = f.get_sample_df(num_samples=num_samples)
+        sample_array = f.get_sample_df(num_samples=num_samples,as_array=True)
         
         if plot_unweighted:
             denominator = 1
         else:
-            denominator = y_std
+            denominator = y_std[:,None]
 
-        for c in sample_df.columns:
-            if c[0] == "y": continue # skip y_obs, etc. 
-            sample_df[c] = (sample_df[c] - y_obs)/denominator
+        sample_array = (sample_array - y_obs[:,None])/denominator
 
     x_left, x_right, y_bottom, y_top = get_plot_dimensions(x_axis,y_obs)
     mean_r = np.mean(residual)
@@ -165,11 +163,9 @@ def plot_residuals(f,
 
     if num_samples > 0:
         
-        for c in sample_df.columns:
+        for i in range(sample_array.shape[1]):
 
-            if c[0] == "y": continue # skip y_obs, etc. 
-
-            s = sample_df[c]
+            s = sample_array[:,i]
 
             # Skip nan values
             if np.sum(np.isnan(s)) > 0:
@@ -5,7 +5,6 @@ from dataprob.util.stats import durbin_watson
 from dataprob.util.stats import ljung_box
 
 import pandas as pd
-from scipy import stats
 
 def _get_success(success,out_dict):
     """
@@ -225,6 +224,9 @@ def _get_mean0_ttest(residuals,out_dict):
         out_dict updated with results of this quality test.
     """
 
+    # scipy.stats is slow to import; only load it when needed
+    from scipy import stats
+
     name = "mean0_resid"
     txt = "t-test for residual mean != 0"
     value = stats.ttest_1samp(residuals,popmean=0).pvalue
@@ -0,0 +1,157 @@
+"""
+Functions for creating and appending to numpy .npy files on disk without
+reading the existing contents into memory.
+"""
+
+import numpy as np
+
+import io
+import os
+
+def _read_header(fp):
+    """
+    Read the header of an open .npy file.
+
+    Parameters
+    ----------
+    fp : file
+        file object opened in binary mode, positioned at the start of the file
+
+    Returns
+    -------
+    version : tuple
+        .npy format version
+    shape : tuple
+        shape of the array stored in the file
+    dtype : numpy.dtype
+        dtype of the array stored in the file
+    """
+
+    version = np.lib.format.read_magic(fp)
+    if version == (1,0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+
+    if fortran_order:
+        err = "cannot append to a fortran-ordered .npy file\n"
+        raise ValueError(err)
+
+    return version, shape, dtype
+
+
+def create_npy(filename,row_shape,dtype=float):
+    """
+    Create an empty .npy file (zero rows) that can be grown with append_npy.
+    Any existing file is overwritten.
+
+    Parameters
+    ----------
+    filename : str
+        .npy file to create
+    row_shape : tuple
+        shape of each row in the file. the final array will have shape
+        (num_rows,) + row_shape
+    dtype : numpy.dtype, default=float
+        dtype of the array
+    """
+
+    header = {"descr":np.lib.format.dtype_to_descr(np.dtype(dtype)),
+              "fortran_order":False,
+              "shape":(0,) + tuple(row_shape)}
+
+    with open(filename,"wb") as fp:
+        np.lib.format.write_array_header_1_0(fp,header)
+
+
+def append_npy(filename,array):
+    """
+    Append rows to a .npy file without reading the existing data. The data
+    are written before the header is updated, so an interrupted append
+    leaves a valid file holding the rows present before the append. If the
+    header cannot be updated in place, nothing is written.
+
+    Parameters
+    ----------
+    filename : str
+        .npy file created by create_npy (or np.save with a C-ordered array)
+    array : numpy.ndarray
+        rows to append. must have shape (num_new_rows,) + row_shape
+
+    Returns
+    -------
+    num_rows : int
+        number of rows in the file after the append
+    """
+
+    with open(filename,"r+b") as fp:
+
+        version, shape, dtype = _read_header(fp)
+        data_offset = fp.tell()
+
+        array = np.ascontiguousarray(array,dtype=dtype)
+        if array.shape[1:] != tuple(shape[1:]):
+            err = f"array rows have shape {array.shape[1:]}, but rows in\n"
+            err += f"'{filename}' have shape {tuple(shape[1:])}\n"
+            raise ValueError(err)
+
+        # Build the header with the new number of rows. numpy pads the header
+        # so it can grow along the first axis without changing size; files
+        # written without this padding cannot be updated in place. Check
+        # before anything is written so the file is left untouched.
+        new_shape = (shape[0] + array.shape[0],) + tuple(shape[1:])
+        header = {"descr":np.lib.format.dtype_to_descr(dtype),
+                  "fortran_order":False,
+                  "shape":new_shape}
+        header_fp = io.BytesIO()
+        if version == (1,0):
+            np.lib.format.write_array_header_1_0(header_fp,header)
+        else:
+            np.lib.format.write_array_header_2_0(header_fp,header)
+        header_bytes = header_fp.getvalue()
+
+        if len(header_bytes) != data_offset:
+            err = f"could not update the header of '{filename}' in place\n"
+            raise RuntimeError(err)
+
+        # Write new data after the last complete row. (This overwrites any
+        # partial data left by an interrupted append.)
+        row_bytes = int(np.prod(shape[1:],dtype=int))*dtype.itemsize
+        fp.seek(data_offset + shape[0]*row_bytes)
+        fp.write(array.tobytes())
+        fp.truncate()
+        fp.flush()
+
+        # Rewrite the header with the new number of rows
+        fp.seek(0)
+        fp.write(header_bytes)
+
+    return new_shape[0]
+
+
+def read_npy_shape(filename):
+    """
+    Get the shape and dtype of the array in a .npy file without reading the
+    data.
+
+    Parameters
+    ----------
+    filename : str
+        .npy file
+
+    Returns
+    -------
+    shape : tuple
+        shape of the array stored in the file
+    dtype : numpy.dtype
+        dtype of the array stored in the file
+    """
+
+    if not os.path.isfile(filename):
+        err = f"'{filename}' does not exist.\n"
+        raise FileNotFoundError(err)
+
+    with open(filename,"rb") as fp:
+        _, shape, dtype = _read_header(fp)
+
+    return shape, dtype
@@ -0,0 +1,222 @@
+"""
+Functions for reading and writing parameter samples as self-describing .npy
+files.
+
+Samples are stored as a one-dimensional structured array with one float field
+per parameter (named by the parameter) and an optional final "lnprob" field
+holding the log probability of each sample. These are ordinary .npy files:
+they can be read without copying using np.load(filename,mmap_mode="r") and
+grown with append_sample_file without reading the existing samples.
+"""
+
+from dataprob.util.npy_file import create_npy
+from dataprob.util.npy_file import append_npy
+from dataprob.util.npy_file import read_npy_shape
+
+import numpy as np
+from numpy.lib import recfunctions
+
+import os
+
+# Name of the field holding the log probability of each sample
+LNPROB_FIELD = "lnprob"
+
+# Number of rows converted to the structured format at once when writing
+_WRITE_CHUNK = 65536
+
+def _check_samples(samples,num_params):
+    """
+    Make sure samples is a float array with shape (num_samples,num_params).
+    """
+
+    try:
+        samples = np.asarray(samples)
+        samples = samples.astype(float,copy=False)
+    except Exception as e:
+        err = "samples should be a float numpy array\n"
+        raise ValueError(err) from e
+
+    if len(samples.shape) != 2 or samples.shape[1] != num_params:
+        err = f"samples should have dimensions (num_samples,{num_params})\n"
+        raise ValueError(err)
+
+    return samples
+
+def _build_rows(samples,lnprob,dtype):
+    """
+    Convert a (num_samples,num_params) array and an optional lnprob vector
+    to a structured array with the given dtype.
+    """
+
+    rows = np.empty(samples.shape[0],dtype=dtype)
+    names = dtype.names
+    for i, name in enumerate(names[:samples.shape[1]]):
+        rows[name] = samples[:,i]
+
+    if LNPROB_FIELD in names:
+        if lnprob is None:
+            rows[LNPROB_FIELD] = np.nan
+        else:
+            rows[LNPROB_FIELD] = lnprob
+
+    return rows
+
+def write_sample_file(filename,samples,param_names,lnprob=None):
+    """
+    Write samples to a new .npy sample file.
+
+    Parameters
+    ----------
+    filename : str
+        .npy file to write. The file must not already exist.
+    samples : numpy.ndarray
+        float array with shape (num_samples,num_params). float32 samples are
+        stored as float32; anything else is stored as float64.
+    param_names : list-like
+        name of each parameter (column) in samples
+    lnprob : numpy.ndarray, optional
+        log probability of each sample. If specified, it is stored in a
+        final "lnprob" field.
+    """
+
+    if os.path.exists(filename):
+        err = f"{filename} exists.\n"
+        raise FileExistsError(err)
+
+    param_names = [str(p) for p in param_names]
+    if len(set(param_names)) != len(param_names):
+        err = "param_names must be unique\n"
+        raise ValueError(err)
+    if LNPROB_FIELD in param_names:
+        err = f"'{LNPROB_FIELD}' cannot be used as a parameter name\n"
+        raise ValueError(err)
+
+    # Keep float32 samples as float32
+    sample_dtype = np.float64
+    if np.asarray(samples).dtype == np.float32:
+        sample_dtype = np.float32
+
+    samples = _check_samples(samples,len(param_names))
+
+    fields = [(p,sample_dtype) for p in param_names]
+    if lnprob is not None:
+        fields.append((LNPROB_FIELD,np.float64))
+
+    create_npy(filename,row_shape=(),dtype=np.dtype(fields))
+    append_sample_file(filename,samples,lnprob=lnprob)
+
+def append_sample_file(filename,samples,lnprob=None):
+    """
+    Append samples to a sample file written by write_sample_file. The
+    existing samples are not read.
+
+    Parameters
+    ----------
+    filename : str
+        .npy sample file
+    samples : numpy.ndarray
+        float array with shape (num_samples,num_params)
+    lnprob : numpy.ndarray, optional
+        log probability of each sample. If the file has an lnprob field and
+        this is not specified, the new samples have an lnprob of nan.
+
+    Returns
+    -------
+    num_samples : int
+        number of samples in the file after the append
+    """
+
+    shape, dtype = read_npy_shape(filename)
+    if dtype.names is None or len(shape) != 1:
+        err = f"'{filename}' is not a sample file\n"
+        raise ValueError(err)
+
+    param_names = [n for n in dtype.names if n != LNPROB_FIELD]
+    samples = _check_samples(samples,len(param_names))
+
+    if lnprob is not None:
+        if LNPROB_FIELD not in dtype.names:
+            err = f"'{filename}' does not have an '{LNPROB_FIELD}' field\n"
+            raise ValueError(err)
+
+        lnprob = np.asarray(lnprob,dtype=float)
+        if lnprob.shape != (samples.shape[0],):
+            err = "lnprob should have one value per sample\n"
+            raise ValueError(err)
+
+    # Convert and write in chunks so a large (e.g. memory-mapped) samples
+    # array is not copied all at once
+    num_samples = shape[0]
+    for i in range(0,samples.shape[0],_WRITE_CHUNK):
+        chunk_lnprob = None
+        if lnprob is not None:
+            chunk_lnprob = lnprob[i:i+_WRITE_CHUNK]
+        rows = _build_rows(samples[i:i+_WRITE_CHUNK],chunk_lnprob,dtype)
+        num_samples = append_npy(filename,rows)
+
+    return num_samples
+
+def read_sample_file(filename,mmap_mode=None):
+    """
+    Read a sample file written by write_sample_file. A plain .npy file
+    holding a (num_samples,num_params) float array is also accepted.
+
+    Parameters
+    ----------
+    filename : str
+        .npy sample file
+    mmap_mode : str, optional
+        passed to np.load. If "r", the file is memory mapped and samples is
+        a read-only view of the file rather than a copy, if the layout of
+        the file allows it. 
+
+    Returns
+    -------
+    samples : numpy.ndarray
+        float array with shape (num_samples,num_params). float64 unless 
+        mmap_mode is set, in which case it has the dtype stored in the file.
+    param_names : list or None
+        parameter names stored in the file (None for a plain .npy file)
+    lnprob : numpy.ndarray or None
+        log probability of each sample (None if not stored in the file)
+    """
+
+    if not os.path.isfile(filename):
+        err = f"'{filename}' does not exist.\n"
+        raise FileNotFoundError(err)
+
+    try:
+        array = np.load(filename,mmap_mode=mmap_mode,allow_pickle=False)
+    except Exception as e:
+        err = f"'{filename}' does not appear to be a .npy sample file.\n"
+        raise ValueError(err) from e
+
+    if not isinstance(array,np.ndarray):
+        err = f"'{filename}' does not appear to be a .npy sample file.\n"
+        raise ValueError(err)
+
+    # Plain (num_samples,num_params) array
+    if array.dtype.names is None:
+        if len(array.shape) != 2:
+            err = f"'{filename}' should hold an array with dimensions (num_samples,num_params)\n"
+            raise ValueError(err)
+        if mmap_mode is not None and array.dtype.kind == "f":
+            return array, None, None
+        return _check_samples(array,array.shape[1]), None, None
+
+    param_names = [n for n in array.dtype.names if n != LNPROB_FIELD]
+
+    # The parameter fields all have the same dtype and are evenly spaced, so
+    # they can be viewed as a (num_samples,num_params) array without copying
+    if mmap_mode is not None:
+        samples = recfunctions.structured_to_unstructured(array[param_names],
+                                                          copy=False)
+    else:
+        samples = recfunctions.structured_to_unstructured(array[param_names],
+                                                          dtype=float)
+
+    lnprob = None
+    if LNPROB_FIELD in array.dtype.names:
+        lnprob = np.array(array[LNPROB_FIELD],dtype=float)
+
+    return samples, param_names, lnprob
@@ -0,0 +1,220 @@
+"""
+Class for accumulating parameter samples in memory or in a .npy file on disk.
+"""
+
+from dataprob.util.npy_file import create_npy
+from dataprob.util.npy_file import append_npy
+
+import numpy as np
+
+import os
+
+# Number of rows written to an on-disk store at once
+_WRITE_CHUNK = 65536
+
+# Allowed dtypes for stored samples
+_SAMPLE_DTYPES = [np.dtype(np.float64),np.dtype(np.float32)]
+
+def check_sample_dtype(dtype):
+    """
+    Make sure dtype is a valid dtype for stored samples (float64 or float32).
+
+    Parameters
+    ----------
+    dtype : numpy.dtype or str or type
+        dtype to check
+
+    Returns
+    -------
+    dtype : numpy.dtype
+        validated dtype
+    """
+
+    try:
+        dtype = np.dtype(dtype)
+    except TypeError as e:
+        err = "dtype should be float64 or float32\n"
+        raise ValueError(err) from e
+
+    if dtype not in _SAMPLE_DTYPES:
+        err = "dtype should be float64 or float32\n"
+        raise ValueError(err)
+
+    return dtype
+
+class SampleStore:
+    """
+    Growable (num_samples,num_params) array of parameter samples.
+
+    In memory, samples are held in a buffer that grows in chunks (doubling
+    its capacity when full), so appending copies only the new samples rather
+    than the whole array. If ``filename`` is set, samples are appended to a
+    .npy file on disk instead and ``array`` is a read-only memory map of that
+    file, so the samples do not need to fit in memory.
+    """
+
+    def __init__(self,
+                 num_params,
+                 dtype=np.float64,
+                 filename=None,
+                 chunk_size=1024):
+        """
+        Parameters
+        ----------
+        num_params : int
+            number of columns (parameters) in each sample
+        dtype : numpy.dtype, default=numpy.float64
+            dtype used to store the samples. float64 or float32.
+        filename : str, optional
+            .npy file to store the samples in. The file must not already
+            exist. If None, samples are stored in memory.
+        chunk_size : int, default=1024
+            minimum number of rows to allocate when growing the in-memory
+            buffer
+        """
+
+        self._num_params = int(num_params)
+        self._chunk_size = int(chunk_size)
+        self._dtype = check_sample_dtype(dtype)
+
+        if filename is not None:
+            filename = str(filename)
+            if os.path.exists(filename):
+                err = f"{filename} exists.\n"
+                raise FileExistsError(err)
+
+        self._filename = filename
+
+        self.clear()
+
+    def clear(self,num_params=None):
+        """
+        Remove all samples.
+
+        Parameters
+        ----------
+        num_params : int, optional
+            new number of parameters in each sample. If None, keep the 
+            current number.
+        """
+
+        if num_params is not None:
+            self._num_params = int(num_params)
+
+        self._num_samples = 0
+        self._array = None
+
+        if self._filename is None:
+            self._buffer = np.empty((0,self._num_params),dtype=self._dtype)
+        else:
+            create_npy(self._filename,
+                       row_shape=(self._num_params,),
+                       dtype=self._dtype)
+
+    def append(self,new_samples):
+        """
+        Append samples to the store.
+
+        Parameters
+        ----------
+        new_samples : numpy.ndarray
+            float array with shape (num_new_samples,num_params)
+
+        Returns
+        -------
+        array : numpy.ndarray
+            all samples in the store (see the ``array`` property)
+        """
+
+        new_samples = np.asarray(new_samples)
+        if len(new_samples.shape) != 2 or new_samples.shape[1] != self._num_params:
+            err = f"new_samples should have dimensions (num_samples,{self._num_params})\n"
+            raise ValueError(err)
+
+        num_new = new_samples.shape[0]
+
+        # Write in chunks so a large new_samples (e.g. a memory-mapped view
+        # of another file) is not copied all at once
+        if self._filename is not None:
+            for i in range(0,num_new,_WRITE_CHUNK):
+                self._num_samples = append_npy(self._filename,
+                                               new_samples[i:i+_WRITE_CHUNK])
+
+        else:
+
+            # Grow the buffer if needed. Earlier arrays returned by the store
+            # are views of the old buffer and remain valid.
+            needed = self._num_samples + num_new
+            if needed > self._buffer.shape[0]:
+                capacity = max(needed,
+                               2*self._buffer.shape[0],
+                               self._chunk_size)
+                buffer = np.empty((capacity,self._num_params),dtype=self._dtype)
+                buffer[:self._num_samples] = self._buffer[:self._num_samples]
+                self._buffer = buffer
+
+            self._buffer[self._num_samples:needed] = new_samples
+            self._num_samples = needed
+
+        self._array = None
+
+        return self.array
+
+    def holds(self,array):
+        """
+        Whether array is the current ``array`` of this store (rather than an
+        array built elsewhere).
+        """
+
+        return self._array is not None and array is self._array
+
+    @property
+    def array(self):
+        """
+        All samples in the store with shape (num_samples,num_params). For
+        in-memory storage, this is a view of the buffer; for on-disk storage,
+        this is a read-only numpy.memmap of the file. The same object is
+        returned until samples are appended or cleared.
+        """
+
+        if self._array is None:
+            if self._filename is None:
+                self._array = self._buffer[:self._num_samples]
+            elif self._num_samples == 0:
+                self._array = np.empty((0,self._num_params),dtype=self._dtype)
+            else:
+                self._array = np.load(self._filename,mmap_mode="r")
+
+        return self._array
+
+    @property
+    def num_samples(self):
+        """
+        Number of samples in the store.
+        """
+
+        return self._num_samples
+
+    @property
+    def num_params(self):
+        """
+        Number of parameters in each sample.
+        """
+
+        return self._num_params
+
+    @property
+    def dtype(self):
+        """
+        dtype of the stored samples.
+        """
+
+        return self._dtype
+
+    @property
+    def filename(self):
+        """
+        .npy file holding the samples, or None if samples are in memory.
+        """
+
+        return self._filename
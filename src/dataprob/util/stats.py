@@ -1,6 +1,8 @@
 
+from dataprob.util.check import check_int
+from dataprob.util.check import check_float
+
 import numpy as np
-from scipy import stats
 from scipy import optimize
 
 def durbin_watson(residuals,
@@ -50,7 +52,7 @@ def durbin_watson(residuals,
 
     return d, w
 
-def ljung_box(residuals,num_param=0):
+def ljung_box(residuals,num_param=0,max_lag=None):
     """
     Run a Ljung-Box test for residual autocorrelation. 
 
@@ -60,6 +62,9 @@ def ljung_box(residuals,num_param=0):
         fit residuals as a numpy array
     num_param : int, default=0
         number of fit parameters
+    max_lag : int, optional
+        largest lag to include in the test statistic. must be >= 2. If not
+        specified, use all lags (2 -> n - 2). 
 
     Returns
     -------
@@ -75,6 +80,9 @@ def ljung_box(residuals,num_param=0):
     -----
     If the test statistic is higher than chi^2 for a given alpha and number of
     degrees of freedom, we reject the null hypothesis of uncorrelated residuals. 
+
+    The autocorrelations at all lags are calculated at once with an FFT, so
+    the test scales as n*log(n) rather than n^2. 
     """
 
     # de-mean the residuals
@@ -88,20 +96,28 @@ def ljung_box(residuals,num_param=0):
     # and bring in front of sum
     n = len(residuals)
     prefactor = n*(n + 2)/(np.sum(residuals**2))**2
+
+    # Lags to include (k = 2 -> n-2, or k = 2 -> max_lag)
+    last_lag = n - 2
+    if max_lag is not None:
+        max_lag = check_int(value=max_lag,
+                            variable_name="max_lag",
+                            minimum_allowed=2)
+        last_lag = min(last_lag,max_lag)
     
-    # Go through lags (k = 2 -> n-1)
-    Q = 0 
-    total = 0
-    for k in range(2,n-1):
-    
-        at_atk = np.sum(residuals[k:]*residuals[:-k])
-        
-        Q += (at_atk**2)/(n - k)
-    
-        total+= 1
-    
-    Q = prefactor*Q
-    df = (n - 3) + num_param
+    # Un-normalized autocorrelation sum(r[k:]*r[:-k]) for all lags. Zero-pad
+    # to at least 2n to avoid circular correlation. 
+    fft_size = 1 << int(2*n - 1).bit_length()
+    f = np.fft.rfft(residuals,n=fft_size)
+    at_atk = np.fft.irfft(f*np.conjugate(f),n=fft_size)[2:last_lag + 1]
+
+    k = np.arange(2,last_lag + 1)
+    Q = prefactor*np.sum((at_atk**2)/(n - k))
+
+    # One degree of freedom per lag (plus parameters)
+    df = (last_lag - 1) + num_param
+    # scipy.stats is slow to import; only load it when needed
+    from scipy import stats
     p = 1 - stats.chi2.cdf(Q,df)
     
     return p, Q, df
@@ -129,6 +145,7 @@ def chi2(residuals,num_param):
     num_obs = len(residuals)
     df = num_obs - num_param - 1
 
+    from scipy import stats
     return 1 - stats.chi2.cdf(chi2,df)
 
 def chi2_reduced(residuals,num_param):
@@ -158,7 +175,7 @@ def chi2_reduced(residuals,num_param):
     return chi2/df
 
 
-def get_kde_max(samples):
+def get_kde_max(samples,lnprob=None,max_samples=20000):
     """
     Use a kernel density estimator to find the parameter estimates with the
     highest probability given a set of samples from the distribution.
@@ -167,6 +184,16 @@ def get_kde_max(samples):
     ----------
     samples : numpy.ndarray
         samples array of samples with dimensions (num_samples,num_parameters)
+    lnprob : numpy.ndarray, optional
+        log probability of each sample (num_samples,). if specified, the 
+        search for the maximum starts from the sample with the highest log
+        probability rather than the mean of the samples. 
+    max_samples : int or None, default=20000
+        build the kernel density estimator from at most this many samples,
+        taken at evenly spaced intervals through the samples array. Each 
+        evaluation of the estimator scales with the number of samples used, 
+        so lower values are faster but less precise. If None, use all 
+        samples. 
     
     Returns
     -------
@@ -185,14 +212,102 @@ def get_kde_max(samples):
     # Take only good samples
     samples = samples[good_mask,:]
 
+    # Start from the sample with the highest log probability if we have them;
+    # otherwise, from the mean of the samples
+    x0 = np.mean(samples,axis=0)
+    if lnprob is not None:
+
+        lnprob = np.asarray(lnprob,dtype=float)
+        if lnprob.shape != good_mask.shape:
+            err = "lnprob must be an array with one entry per sample\n"
+            raise ValueError(err)
+        
+        lnprob = lnprob[good_mask]
+        if np.any(np.isfinite(lnprob)):
+            lnprob = np.where(np.isfinite(lnprob),lnprob,-np.inf)
+            x0 = samples[np.argmax(lnprob),:]
+
+    # Take evenly spaced samples if we have more than max_samples
+    if max_samples is not None:
+        max_samples = check_int(value=max_samples,
+                                variable_name="max_samples",
+                                minimum_allowed=2)
+    if max_samples is not None and samples.shape[0] > max_samples:
+        idx = np.linspace(0,samples.shape[0] - 1,max_samples).astype(int)
+        samples = samples[idx,:]
+
     # Build a gaussian kernel density estimator from the samples
+    from scipy import stats
     kde = stats.gaussian_kde(samples.T)
 
-    # Find the kde maximum (minimize -kde)
-    def to_optimize(x): return -kde(x)
-    fit_result = optimize.minimize(to_optimize,x0=np.mean(samples,axis=0))
+    # Find the kde maximum (minimize -log(kde)). We use the log so the 
+    # gradient does not become vanishingly small for broad distributions. 
+    def to_optimize(x): return -kde.logpdf(x)[0]
+    fit_result = optimize.minimize(to_optimize,x0=x0)
 
     # Get fit params
     return fit_result.x.copy()
 
 
+def get_sample_intervals(samples,levels=(95,)):
+    """
+    Get central credibility intervals for each parameter from a set of
+    samples. Each parameter column is sorted once and all interval edges are
+    read from the sorted column, interpolating linearly between samples (the
+    same as ``np.quantile`` with its default method).
+
+    Parameters
+    ----------
+    samples : numpy.ndarray
+        samples array with dimensions (num_samples,num_parameters)
+    levels : list-like, default=(95,)
+        interval levels as percentages (0 < level < 100)
+
+    Returns
+    -------
+    intervals : dict
+        dictionary keying column names to float arrays with shape 
+        (num_parameters,). For each level, this holds "low_{level}" and
+        "high_{level}" (e.g. "low_95" and "high_95" for level 95). 
+    
+    Notes
+    -----
+    Sorting contiguous copies of each column is faster than a single 
+    ``np.quantile`` or ``np.partition`` call along axis 0 of the samples 
+    array, which must walk the array with a large stride. 
+    """
+
+    levels = [check_float(value=level,
+                          variable_name="interval level",
+                          minimum_allowed=0,
+                          maximum_allowed=100,
+                          minimum_inclusive=False,
+                          maximum_inclusive=False)
+              for level in levels]
+
+    # Columns are cast to float one at a time so a large (e.g. memory-mapped
+    # or float32) samples array is never copied as a whole
+    samples = np.asarray(samples)
+    num_samples, num_params = samples.shape
+
+    # Quantiles for the lower and upper edges of all intervals
+    low_q = np.array([(1 - level/100)/2 for level in levels])
+    q = np.concatenate((low_q,1 - low_q))
+
+    # Positions of the quantiles in the sorted columns
+    position = q*(num_samples - 1)
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1,num_samples - 1)
+    frac = position - below
+
+    quantiles = np.empty((len(q),num_params),dtype=float)
+    for i in range(num_params):
+        sorted_samples = np.sort(np.asarray(samples[:,i],dtype=float))
+        quantiles[:,i] = sorted_samples[below] + frac*(sorted_samples[above] - sorted_samples[below])
+
+    intervals = {}
+    for i, level in enumerate(levels):
+        intervals[f"low_{level:g}"] = quantiles[i]
+        intervals[f"high_{level:g}"] = quantiles[i + len(levels)]
+
+    return intervals
@@ -0,0 +1,247 @@
+"""
+Process pool helpers shared by the fitters. Arguments that are the same for
+every task (e.g. the model) are sent to each worker process once when it
+starts rather than pickled and sent with every task.
+"""
+
+from dataprob.util.check import check_int
+
+import multiprocessing
+import pickle
+import sys
+import os
+
+# Pickled (function,shared_kwargs,star) for the tasks run by this worker
+# process. Set once per worker by _worker_initializer and loaded by the first
+# call to call_in_worker.
+_worker_payload = None
+_worker_function = None
+_worker_kwargs = None
+_worker_star = False
+
+def _worker_initializer(payload):
+    """
+    Store the pickled task function and its shared arguments in a worker 
+    process of a multiprocessing pool. They are unpickled by the first task
+    rather than here: an error in the pool initializer makes the pool 
+    restart the worker forever, while an error in a task is raised in the
+    parent process.
+
+    Parameters
+    ----------
+    payload : bytes
+        pickled (function,shared_kwargs,star) tuple. function is run for
+        each task, shared_kwargs are keyword arguments passed to every call
+        of function, and star indicates whether each task item is unpacked 
+        as positional arguments to function. 
+    """
+
+    global _worker_payload
+    global _worker_function
+
+    _worker_payload = payload
+    _worker_function = None
+
+def _load_payload():
+    """
+    Unpickle the payload stored by _worker_initializer.
+    """
+
+    global _worker_function
+    global _worker_kwargs
+    global _worker_star
+
+    try:
+        function, shared_kwargs, star = pickle.loads(_worker_payload)
+    except Exception as e:
+        err = "The worker process could not load the function and arguments\n"
+        err += f"sent to it ({e.__class__.__name__}: {e}). Anything run with\n"
+        err += "more than one worker, including the model, must be defined at\n"
+        err += "the top level of an importable module.\n"
+        raise RuntimeError(err) from e
+
+    _worker_kwargs = shared_kwargs
+    _worker_star = star
+    _worker_function = function
+
+def call_in_worker(item):
+    """
+    Run the task function stored in this worker process by create_pool on
+    one task item: function(item,**shared_kwargs), or
+    function(*item,**shared_kwargs) if the pool was created with star=True.
+
+    Parameters
+    ----------
+    item : object
+        task item
+
+    Returns
+    -------
+    out : object
+        output of the task function
+    """
+
+    if _worker_function is None:
+        _load_payload()
+
+    if _worker_star:
+        return _worker_function(*item,**_worker_kwargs)
+
+    return _worker_function(item,**_worker_kwargs)
+
+def get_num_workers(num_workers,variable_name="num_workers"):
+    """
+    Validate a number of worker processes.
+
+    Parameters
+    ----------
+    num_workers : int
+        number of worker processes. 0 means use all cpus.
+    variable_name : str, default="num_workers"
+        name of the variable for error messages
+
+    Returns
+    -------
+    num_workers : int
+        validated number of worker processes (>= 1)
+    """
+
+    num_workers = check_int(value=num_workers,
+                            variable_name=variable_name,
+                            minimum_allowed=0)
+    if num_workers == 0:
+        num_workers = multiprocessing.cpu_count()
+
+    return num_workers
+
+def _check_main_importable():
+    """
+    Make sure worker processes can start. Under the spawn and forkserver
+    start methods, each worker re-runs the __main__ script. If that script
+    is not a file (e.g. code piped to python on stdin), every worker dies 
+    as it starts and the pool restarts them forever. 
+    """
+
+    if multiprocessing.get_start_method() == "fork":
+        return
+
+    main_module = sys.modules.get("__main__")
+    if getattr(main_module,"__spec__",None) is not None:
+        return
+
+    main_path = getattr(main_module,"__file__",None)
+    if main_path is not None and not os.path.isfile(main_path):
+        err = f"Worker processes cannot be started because the main script\n"
+        err += f"'{main_path}' is not a file they can import. Run from a\n"
+        err += "script file or use a single worker.\n"
+        raise ValueError(err)
+
+def create_pool(num_workers,function,shared_kwargs=None,star=False):
+    """
+    Create a pool of worker processes that run function with shared_kwargs.
+    Map call_in_worker over task items to run them in the pool. The caller
+    is responsible for closing the pool. function and shared_kwargs are 
+    pickled and sent to each worker once; a ValueError is raised if they
+    cannot be pickled or if worker processes cannot be started.
+
+    Parameters
+    ----------
+    num_workers : int
+        number of worker processes
+    function : callable
+        module-level function run for each task item
+    shared_kwargs : dict, optional
+        keyword arguments passed to every call of function
+    star : bool, default=False
+        if True, each task item is unpacked as positional arguments to
+        function
+
+    Returns
+    -------
+    pool : multiprocessing.pool.Pool
+        pool of worker processes
+    """
+
+    if shared_kwargs is None:
+        shared_kwargs = {}
+
+    # Pickle here so an object that cannot be sent to the workers raises a 
+    # clear error before any worker starts
+    try:
+        payload = pickle.dumps((function,shared_kwargs,star))
+    except Exception as e:
+        err = "Could not send the function and arguments to the worker\n"
+        err += f"processes ({e.__class__.__name__}: {e}). Anything run with\n"
+        err += "more than one worker, including the model, must be picklable:\n"
+        err += "defined at the top level of an importable module rather than\n"
+        err += "inside a function or as a lambda.\n"
+        raise ValueError(err) from e
+
+    _check_main_importable()
+
+    return multiprocessing.Pool(processes=num_workers,
+                                initializer=_worker_initializer,
+                                initargs=(payload,))
+
+def map_in_pool(function,
+                items,
+                num_workers,
+                shared_kwargs=None,
+                star=False,
+                progress=False):
+    """
+    Run function on each task item, in this process if num_workers is 1 or
+    in a pool of worker processes otherwise. Results are returned in the
+    order of items.
+
+    Parameters
+    ----------
+    function : callable
+        module-level function run for each task item
+    items : list-like
+        task items
+    num_workers : int
+        number of worker processes
+    shared_kwargs : dict, optional
+        keyword arguments passed to every call of function
+    star : bool, default=False
+        if True, each task item is unpacked as positional arguments to
+        function
+    progress : bool, default=False
+        show a progress bar
+
+    Returns
+    -------
+    results : list
+        output of function for each task item
+    """
+
+    if shared_kwargs is None:
+        shared_kwargs = {}
+
+    items = list(items)
+
+    # tqdm is only loaded if a progress bar is requested
+    if progress:
+        from tqdm.auto import tqdm
+
+    if num_workers <= 1:
+        if progress:
+            items = tqdm(items)
+        if star:
+            return [function(*item,**shared_kwargs) for item in items]
+        return [function(item,**shared_kwargs) for item in items]
+
+    # Send tasks in chunks so each worker gets several at a time, while
+    # still balancing the load across workers
+    chunksize = max(1,len(items)//(4*num_workers))
+    with create_pool(num_workers=num_workers,
+                     function=function,
+                     shared_kwargs=shared_kwargs,
+                     star=star) as pool:
+        results = pool.imap(call_in_worker,items,chunksize=chunksize)
+        if progress:
+            results = tqdm(results,total=len(items))
+        results = list(results)
+
+    return results
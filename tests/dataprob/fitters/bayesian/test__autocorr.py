@@ -0,0 +1,117 @@
+import pytest
+
+from dataprob.fitters.bayesian._autocorr import get_autocorr_time
+from dataprob.fitters.bayesian._autocorr import check_autocorr_convergence
+from dataprob.fitters.bayesian._autocorr import AutocorrMonitor
+
+import numpy as np
+import emcee
+
+def test_get_autocorr_time():
+
+    # AR(1) chains with a known correlation structure
+    rng = np.random.default_rng(0)
+    chain = np.zeros((2000,10,3))
+    for i in range(1,chain.shape[0]):
+        chain[i] = 0.9*chain[i-1] + rng.normal(size=(10,3))
+
+    # Should match emcee's estimator, for long and short chains
+    tau = get_autocorr_time(chain)
+    assert tau.shape == (3,)
+    assert np.allclose(tau,emcee.autocorr.integrated_time(chain,quiet=True))
+
+    tau = get_autocorr_time(chain[:40])
+    emcee_tau = emcee.autocorr.integrated_time(chain[:40],quiet=True)
+    assert np.allclose(tau,emcee_tau)
+
+    # AR(1) with phi = 0.9 has tau = (1 + phi)/(1 - phi) = 19
+    assert np.all(np.abs(get_autocorr_time(chain) - 19) < 4)
+
+    # Stuck walkers do not give nan
+    chain[:,0,:] = 1.0
+    tau = get_autocorr_time(chain)
+    assert np.all(np.isfinite(tau))
+
+    # Single step
+    tau = get_autocorr_time(np.ones((1,10,2)))
+    assert np.array_equal(tau,[1,1])
+
+
+def test_check_autocorr_convergence():
+
+    tau = np.array([1.0,2.0])
+
+    # No previous estimate
+    assert check_autocorr_convergence(tau,None,num_steps=1000) is False
+
+    # Stable and long enough
+    assert check_autocorr_convergence(tau,tau*1.001,num_steps=1000) is True
+
+    # Not long enough
+    assert check_autocorr_convergence(tau,tau,num_steps=100) is False
+    assert check_autocorr_convergence(tau,tau,num_steps=100,
+                                      tau_multiplier=10) is True
+
+    # Not stable
+    assert check_autocorr_convergence(tau,tau*1.1,num_steps=1000) is False
+    assert check_autocorr_convergence(tau,tau*1.1,num_steps=1000,
+                                      tau_rtol=0.2) is True
+
+    # Non-finite tau
+    assert check_autocorr_convergence(np.array([np.nan,1]),tau,
+                                      num_steps=1000) is False
+
+
+def test_AutocorrMonitor():
+
+    rng = np.random.default_rng(0)
+    chain = np.zeros((20000,10,2))
+    for i in range(1,chain.shape[0]):
+        chain[i] = 0.9*chain[i-1] + rng.normal(size=(10,2))
+
+    # Short chain: no thinning, matches the estimator on the whole chain
+    monitor = AutocorrMonitor(check_interval=100,max_length=1000)
+    assert monitor.check_due is False
+    monitor.add_chain(chain[:99])
+    assert monitor.check_due is False
+    monitor.add(chain[99])
+    assert monitor.check_due is True
+    assert monitor.num_steps == 100
+    assert np.allclose(monitor.estimate(),get_autocorr_time(chain[:100]))
+
+    # Next check is at least check_interval steps later
+    assert monitor.check_due is False
+    monitor.add_chain(chain[100:199])
+    assert monitor.check_due is False
+    monitor.add(chain[199])
+    assert monitor.check_due is True
+    monitor.estimate()
+
+    # Checks are then spaced geometrically
+    monitor.add_chain(chain[200:1000])
+    monitor.estimate()
+    monitor.add_chain(chain[1000:1249])
+    assert monitor.check_due is False
+    monitor.add(chain[1249])
+    assert monitor.check_due is True
+
+    # Long chain: memory is bounded and the thinned estimate is still close
+    # to the true value (tau = 19 for this AR(1) process)
+    monitor.add_chain(chain[1250:])
+    assert monitor.num_steps == 20000
+    assert monitor._length <= 1000
+    assert monitor._thin == 32
+    assert np.allclose(monitor._buffer[:monitor._length],
+                       chain[monitor._thin-1::monitor._thin])
+
+    # Heavy thinning (thin > tau) overestimates tau; it never underestimates
+    tau = monitor.estimate()
+    assert np.all(tau >= get_autocorr_time(chain))
+
+    # With the default buffer, the thinned estimate is close to the estimate
+    # from the whole chain
+    monitor = AutocorrMonitor()
+    monitor.add_chain(chain)
+    assert monitor._thin == 8
+    assert np.allclose(monitor.estimate(),get_autocorr_time(chain),rtol=0.1)
+
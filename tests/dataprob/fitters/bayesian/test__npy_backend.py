@@ -0,0 +1,91 @@
+import pytest
+
+from dataprob.fitters.bayesian._npy_backend import NpyBackend
+
+import numpy as np
+import emcee
+
+import os
+
+def test_NpyBackend(tmpdir):
+
+    filename = os.path.join(tmpdir,"chain.npy")
+
+    # New file -- not initialized until reset
+    backend = NpyBackend(filename)
+    assert backend.initialized is False
+    assert not os.path.isfile(filename)
+
+    backend.reset(nwalkers=4,ndim=2)
+    assert backend.initialized is True
+    assert backend.iteration == 0
+    assert backend.chain.shape == (0,4,2)
+    assert backend.log_prob.shape == (0,4)
+    assert np.load(filename).shape == (0,4,4)
+
+    # Save some steps
+    coords = []
+    log_probs = []
+    for i in range(3):
+        coords.append(np.random.normal(size=(4,2)))
+        log_probs.append(np.random.normal(size=4))
+        state = emcee.State(coords[-1],log_prob=log_probs[-1])
+        backend.grow(1,None)
+        backend.save_step(state,np.array([True,False,True,True]))
+
+    assert backend.iteration == 3
+    assert np.array_equal(backend.get_chain(),coords)
+    assert np.array_equal(backend.get_log_prob(),log_probs)
+    assert np.array_equal(backend.accepted,[3,0,3,3])
+    assert np.array_equal(backend.get_last_sample().coords,coords[-1])
+
+    out = np.load(filename)
+    assert out.shape == (3,4,4)
+    assert np.array_equal(out[:,:,:2],coords)
+    assert np.array_equal(out[:,:,2],log_probs)
+    assert np.array_equal(out[0,:,3],[1,0,1,1])
+
+    # Load existing file
+    backend = NpyBackend(filename)
+    assert backend.initialized is True
+    assert backend.shape == (4,2)
+    assert backend.iteration == 3
+    assert np.array_equal(backend.accepted,[3,0,3,3])
+    assert np.array_equal(backend.get_chain(),coords)
+    assert np.array_equal(backend.get_last_sample().coords,coords[-1])
+
+    # blobs not supported
+    with pytest.raises(ValueError):
+        backend.grow(1,np.ones(4))
+
+    # File that is not a chain
+    np.save(filename,np.ones((2,2)))
+    with pytest.raises(ValueError):
+        NpyBackend(filename)
+
+def test_NpyBackend_emcee(tmpdir):
+
+    filename = os.path.join(tmpdir,"chain.npy")
+
+    def ln_prob(x): return -0.5*np.sum(x**2)
+
+    # Run with backend
+    backend = NpyBackend(filename)
+    sampler = emcee.EnsembleSampler(nwalkers=6,
+                                    ndim=2,
+                                    log_prob_fn=ln_prob,
+                                    backend=backend)
+    sampler.run_mcmc(np.random.normal(size=(6,2)),nsteps=10)
+    chain = sampler.get_chain()
+    assert chain.shape == (10,6,2)
+
+    # Resume from file with a new sampler
+    backend = NpyBackend(filename)
+    sampler = emcee.EnsembleSampler(nwalkers=6,
+                                    ndim=2,
+                                    log_prob_fn=ln_prob,
+                                    backend=backend)
+    sampler.run_mcmc(None,nsteps=5)
+    new_chain = sampler.get_chain()
+    assert new_chain.shape == (15,6,2)
+    assert np.array_equal(new_chain[:10],chain)
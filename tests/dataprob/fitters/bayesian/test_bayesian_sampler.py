@@ -7,11 +7,70 @@ from scipy import stats
 import emcee
 
 from dataprob.fitters.bayesian.bayesian_sampler import BayesianSampler
+from dataprob.fitters.bayesian._autocorr import get_autocorr_time
+from dataprob.fitters.bayesian.bayesian_sampler import _calc_ln_prior
+from dataprob.fitters.bayesian.bayesian_sampler import _WorkerLnProb
 from dataprob.fitters.bayesian._prior_processing import find_normalization
 from dataprob.fitters.bayesian._prior_processing import reconcile_bounds_and_priors
 from dataprob.fitters.bayesian._prior_processing import find_uniform_value
 
+import multiprocessing
 import warnings
+import pickle
+import os
+
+def _linear_fcn(m,b,x):
+    """
+    Module-level model so it can be sent to worker processes under any
+    multiprocessing start method.
+    """
+    return m*x + b
+
+def test__calc_ln_prior():
+
+    kwargs = {"lower_bounds":np.array([-10.0,-np.inf]),
+              "upper_bounds":np.array([10.0,np.inf]),
+              "gauss_prior_mask":np.array([False,True]),
+              "gauss_prior_means":np.array([1.0]),
+              "gauss_prior_inv_stds":np.array([0.5]),
+              "ln_prior_offset":-3.0}
+
+    # Single parameter set
+    assert np.isclose(_calc_ln_prior(np.array([0.0,1.0]),**kwargs),-3.0)
+    assert np.isclose(_calc_ln_prior(np.array([0.0,3.0]),**kwargs),-3.5)
+    assert _calc_ln_prior(np.array([11.0,3.0]),**kwargs) == -np.inf
+
+    # Many parameter sets
+    params = np.array([[0.0,1.0],[0.0,3.0],[11.0,3.0]])
+    out = _calc_ln_prior(params,**kwargs)
+    assert np.allclose(out,[-3.0,-3.5,-np.inf])
+
+def test__WorkerLnProb():
+
+    f = BayesianSampler(some_function=_linear_fcn,
+                        non_fit_kwargs={"x":np.arange(10)})
+    f.data_df = pd.DataFrame({"y_obs":np.arange(10)*1.0 + 2,
+                              "y_std":np.ones(10)})
+    f.param_df.loc["m","prior_mean"] = 1
+    f.param_df.loc["m","prior_std"] = 2
+    f.param_df.loc["b","lower_bound"] = -5
+    f._setup_priors()
+
+    ln_prob = _WorkerLnProb(f)
+    for param in [[1.0,2.0],[5.0,-2.0],[1.0,-10.0]]:
+        param = np.array(param)
+        assert ln_prob(param) == f._ln_prob(param)
+
+    # Survives pickling (how it is sent to workers)
+    ln_prob = pickle.loads(pickle.dumps(ln_prob))
+    param = np.array([1.0,2.0])
+    assert ln_prob(param) == f._ln_prob(param)
+
+    # Only the model and constants are sent, not the fitter
+    assert not hasattr(ln_prob,"_samples")
+    assert not hasattr(ln_prob,"_fit_result")
+    for value in ln_prob.__dict__.values():
+        assert not isinstance(value,BayesianSampler)
 
 def test_BayesianSampler__init__():
 
@@ -36,6 +95,8 @@ def test__setup_priors():
     assert not hasattr(f,"_gauss_prior_stds")
     assert not hasattr(f,"_gauss_prior_offsets")
     assert not hasattr(f,"_gauss_prior_mask")
+    assert not hasattr(f,"_gauss_prior_inv_stds")
+    assert not hasattr(f,"_ln_prior_offset")
     assert not hasattr(f,"_lower_bounds")
     assert not hasattr(f,"_upper_bounds")
 
@@ -156,6 +217,9 @@ def test__setup_priors():
     # for fast prior calcs).
     assert np.array_equal(f._lower_bounds,f.param_df["lower_bound"])
     assert np.array_equal(f._upper_bounds,f.param_df["upper_bound"])
+    assert np.array_equal(f._gauss_prior_inv_stds,[1/5])
+    assert np.isclose(f._ln_prior_offset,
+                      f._uniform_priors + f._gauss_prior_offsets[0] + stats.norm.logpdf(0))
 
 def test_BayesianSampler__ln_prior():
 
@@ -231,6 +295,32 @@ def test_BayesianSampler__ln_prior():
     value = f._ln_prior(np.array([-1,2]))
     assert np.isclose(-np.inf,value)
 
+def test_BayesianSampler__ln_prior_2d():
+
+    def two_parameter(a=1,b=2): return a*b
+    f = BayesianSampler(some_function=two_parameter)
+    f.param_df["guess"] = [-5,-5]
+    f.param_df["prior_mean"] = [2,np.nan]
+    f.param_df["prior_std"] = [10,np.nan]
+    f.param_df["lower_bound"] = [-np.inf,-np.inf]
+    f.param_df["upper_bound"] = [10,0]
+    f._model.finalize_params()
+    f._setup_priors()
+
+    params = np.array([[-1e6,-5],
+                       [-1,-5],
+                       [0,-1],
+                       [8,-5],
+                       [-1,2],
+                       [11,-5]],dtype=float)
+    
+    expected = np.array([f._ln_prior(p) for p in params])
+    assert issubclass(type(expected[0]),float)
+    value = f._ln_prior(params)
+    assert value.shape == (6,)
+    assert np.allclose(value,expected)
+    assert np.array_equal(np.isinf(value),[False,False,False,False,True,True])
+
 def test_BayesianSampler_ln_prior():
     
     # test error checking. __ln_prior test checks numerical results 
@@ -284,6 +374,34 @@ def test_BayesianSampler__ln_prob():
     assert f._ln_prob(expected_result) == ln_like + ln_prob
     assert np.isinf(f._ln_prob(np.array([np.nan,1])))
     
+def test_BayesianSampler__ln_prob_batch():
+
+    def linear_fcn(m,b,x): return m*x + b
+    x = np.linspace(-5,5,10)
+    y_obs = linear_fcn(2,-1,x)
+
+    f = BayesianSampler(some_function=linear_fcn,
+                        non_fit_kwargs={"x":x},
+                        vectorized=True)
+    f.param_df.loc["m","upper_bound"] = 10
+    f.param_df.loc["b","prior_mean"] = 0
+    f.param_df.loc["b","prior_std"] = 2
+    f.data_df = pd.DataFrame({"y_obs":y_obs,
+                              "y_std":np.ones(10)})
+    f._model.finalize_params()
+    f._setup_priors()
+
+    params = np.array([[2,-1],
+                       [0,0],
+                       [20,0],
+                       [np.nan,0]],dtype=float)
+    
+    expected = np.array([f._ln_prob(p) for p in params])
+    value = f._ln_prob_batch(params)
+    assert value.shape == (4,)
+    assert np.allclose(value[:2],expected[:2])
+    assert np.array_equal(value[2:],[-np.inf,-np.inf])
+
 def test_BayesianSampler_ln_prob():
     
     # test error checking. __ln_prob test checks numerical results 
@@ -344,6 +462,7 @@ def test_BayesianSampler__sample_to_convergence():
 
     # Cannot converge -- check for warning and setting success to False
     f._max_convergence_cycles = 1
+    f._convergence_check_interval = 100
     with pytest.warns():
         f._sample_to_convergence()
     assert f._success is False
@@ -371,11 +490,26 @@ def test_BayesianSampler__sample_to_convergence():
 
     # converges -- no warning, set to False
     f._max_convergence_cycles = 10
+    f._convergence_check_interval = 100
     with warnings.catch_warnings():
         warnings.simplefilter("error")
         f._sample_to_convergence()
     assert f._success is True
 
+    # Chain should be longer than 50x the autocorrelation time
+    num_steps = f._fit_result.iteration
+    tau = get_autocorr_time(f._fit_result.get_chain())
+    assert num_steps > 50*np.max(tau)
+
+    # Always runs at least num_steps, even if converged
+    f._num_steps = 2*num_steps
+    f._initial_state = None
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        f._sample_to_convergence()
+    assert f._success is True
+    assert f._fit_result.iteration >= 3*num_steps
+
 
 
 
@@ -383,7 +517,9 @@ def test_BayesianSampler_fit():
 
     def test_fcn(m,b,x): return m*x + b
 
-    f = BayesianSampler(some_function=test_fcn,
+    # Module-level model so the num_threads > 1 fits below work under any
+    # multiprocessing start method
+    f = BayesianSampler(some_function=_linear_fcn,
                         non_fit_kwargs={"x":np.arange(10)})
     y_obs = np.arange(10)*1 + 2
     y_std = 1.0
@@ -405,23 +541,102 @@ def test_BayesianSampler_fit():
     assert f._max_convergence_cycles == 10
     
     # check num threads passing
-    with pytest.raises(NotImplementedError):
+    f.fit(y_obs=y_obs,
+          y_std=y_std,
+          num_walkers=10,
+          use_ml_guess=True,
+          num_steps=10,
+          max_convergence_cycles=1,
+          burn_in=0.1,
+          num_threads=0)
+    assert f._num_threads == multiprocessing.cpu_count()
+
+    f.fit(y_obs=y_obs,
+          y_std=y_std,
+          num_walkers=10,
+          use_ml_guess=True,
+          num_steps=10,
+          max_convergence_cycles=1,
+          burn_in=0.1,
+          num_threads=2)
+    assert f._num_threads == 2
+    assert f._fit_result.pool is None
+    assert f.samples.shape[1] == 2
+    assert np.sum(np.isnan(f.samples)) == 0
+
+    # A model defined inside a function cannot be sent to worker processes
+    g = BayesianSampler(some_function=test_fcn,
+                        non_fit_kwargs={"x":np.arange(10)})
+    with pytest.raises(ValueError):
+        g.fit(y_obs=y_obs,
+              y_std=y_std,
+              num_walkers=10,
+              num_steps=10,
+              max_convergence_cycles=1,
+              num_threads=2)
+    
+    # vectorized model
+    f = BayesianSampler(some_function=test_fcn,
+                        non_fit_kwargs={"x":np.arange(10)},
+                        vectorized=True)
+    f.fit(y_obs=y_obs,
+          y_std=y_std,
+          num_walkers=10,
+          use_ml_guess=True,
+          num_steps=10,
+          max_convergence_cycles=1,
+          burn_in=0.1)
+    assert f._fit_result.vectorize is True
+    assert f.samples.shape[1] == 2
+
+    # vectorized model cannot use multiple threads
+    with pytest.raises(ValueError):
         f.fit(y_obs=y_obs,
               y_std=y_std,
               num_walkers=10,
-              use_ml_guess=True,
               num_steps=10,
-              burn_in=0.1,
-              num_threads=0)
-        
-    with pytest.raises(NotImplementedError):
+              max_convergence_cycles=1,
+              num_threads=2)
+
+    # estimator passing
+    f = BayesianSampler(some_function=test_fcn,
+                        non_fit_kwargs={"x":np.arange(10)})
+    for estimator in ["kde","max_lnprob","median","mean"]:
         f.fit(y_obs=y_obs,
               y_std=y_std,
               num_walkers=10,
-              use_ml_guess=True,
               num_steps=10,
-              burn_in=0.1,
-              num_threads=10)
+              max_convergence_cycles=1,
+              estimator=estimator)
+        assert f._estimator == estimator
+
+    with pytest.raises(ValueError):
+        f.fit(y_obs=y_obs,
+              y_std=y_std,
+              num_walkers=10,
+              num_steps=10,
+              max_convergence_cycles=1,
+              estimator="not_an_estimator")
+
+    # extra_intervals passing
+    f.fit(y_obs=y_obs,
+          y_std=y_std,
+          num_walkers=10,
+          num_steps=10,
+          max_convergence_cycles=1,
+          extra_intervals=[68,99])
+    assert f._extra_intervals == [68,99]
+    assert f.fit_info["Extra intervals"] == [68,99]
+    assert np.all(f.fit_df["low_68"] >= f.fit_df["low_95"])
+    assert np.all(f.fit_df["low_99"] <= f.fit_df["low_95"])
+
+    with pytest.raises(ValueError):
+        f.fit(y_obs=y_obs,
+              y_std=y_std,
+              num_walkers=10,
+              num_steps=10,
+              max_convergence_cycles=1,
+              extra_intervals=[0])
     
     # Pass bad value into each kwarg to make sure checker is running
     with pytest.raises(ValueError):
@@ -457,6 +672,63 @@ def test_BayesianSampler_fit():
               not_an_emcee_kwarg="five")
 
 
+def test_BayesianSampler__fit_chain_file(tmpdir):
+
+    def linear_fcn(m,b,x): return m*x + b
+    x = np.linspace(-5,5,10)
+    data_df = pd.DataFrame({"y_obs":linear_fcn(m=2,b=-1,x=x),
+                            "y_std":0.1*np.ones(10)})
+    
+    chain_file = os.path.join(tmpdir,"chain.npy")
+
+    # New chain file
+    f = BayesianSampler(some_function=linear_fcn,
+                        non_fit_kwargs={"x":x})
+    f.data_df = data_df
+    with pytest.warns():
+        f.fit(num_walkers=10,
+              num_steps=20,
+              max_convergence_cycles=1,
+              chain_file=chain_file)
+    assert f.fit_info["Chain file"] == chain_file
+
+    chain = np.load(chain_file)
+    assert chain.shape == (20,10,4)
+    assert np.array_equal(f.samples,chain[2:,:,:2].reshape((-1,2)))
+    assert np.array_equal(f._lnprob,chain[2:,:,2].reshape(-1))
+
+    # Continue the chain with the same fitter -- only new steps are added
+    with pytest.warns():
+        f.fit(num_walkers=10,
+              num_steps=10,
+              max_convergence_cycles=1,
+              chain_file=chain_file)
+    chain = np.load(chain_file)
+    assert chain.shape == (30,10,4)
+    assert f.samples.shape == (280,2)
+    assert np.array_equal(f.samples[180:],chain[20:,:,:2].reshape((-1,2)))
+
+    # Resume the chain with a new fitter. Should load the whole chain, 
+    # discarding the burn in
+    f = BayesianSampler(some_function=linear_fcn,
+                        non_fit_kwargs={"x":x})
+    f.data_df = data_df
+    with pytest.warns():
+        f.fit(num_walkers=10,
+              num_steps=10,
+              max_convergence_cycles=1,
+              chain_file=chain_file)
+    chain = np.load(chain_file)
+    assert chain.shape == (40,10,4)
+    assert np.array_equal(f.samples,chain[4:,:,:2].reshape((-1,2)))
+
+    # Wrong number of walkers for existing file
+    with pytest.raises(ValueError):
+        f.fit(num_walkers=12,
+              num_steps=10,
+              max_convergence_cycles=1,
+              chain_file=chain_file)
+
 def test_BayesianSampler__fit():
     
     def linear_fcn(m,b,x): return m*x + b
@@ -743,6 +1015,54 @@ def test_BayesianSampler__fit():
             f.fit(use_ml_guess=True)
 
 
+def test_BayesianSampler__get_estimate():
+
+    def test_fcn(a=1,b=2): return a*b
+    f = BayesianSampler(some_function=test_fcn)
+
+    # Skewed samples so the estimators give different answers
+    f._samples = np.random.gamma(shape=2,scale=1,size=(10000,2))
+    f._lnprob = stats.gamma(a=2).logpdf(f._samples[:,0])
+    f._lnprob += stats.gamma(a=2).logpdf(f._samples[:,1])
+
+    # default is kde. mode of gamma(2,1) is 1
+    assert not hasattr(f,"_estimator")
+    estimate = f._get_estimate()
+    assert np.all(np.abs(estimate - 1) < 0.3)
+
+    f._estimator = "kde"
+    assert np.all(np.abs(f._get_estimate() - 1) < 0.3)
+
+    f._estimator = "max_lnprob"
+    estimate = f._get_estimate()
+    assert np.array_equal(estimate,f._samples[np.argmax(f._lnprob)])
+
+    f._estimator = "median"
+    estimate = f._get_estimate()
+    assert np.array_equal(estimate,np.median(f._samples,axis=0))
+
+    f._estimator = "mean"
+    estimate = f._get_estimate()
+    assert np.array_equal(estimate,np.mean(f._samples,axis=0))
+
+    # max_lnprob ignores non-finite log probabilities
+    f._estimator = "max_lnprob"
+    best = np.argmax(f._lnprob)
+    f._lnprob[best] = np.nan
+    estimate = f._get_estimate()
+    assert np.array_equal(estimate,f._samples[np.nanargmax(f._lnprob)])
+
+    # max_lnprob without usable lnprob falls back to kde with a warning
+    f._lnprob[:] = np.nan
+    with pytest.warns():
+        estimate = f._get_estimate()
+    assert np.all(np.abs(estimate - 1) < 0.3)
+
+    f._lnprob = f._lnprob[:10]
+    with pytest.warns():
+        estimate = f._get_estimate()
+    assert np.all(np.abs(estimate - 1) < 0.3)
+
 def test_BayesianSampler__update_fit_df():
     
     # Create a BayesianSampler with a model loaded (and _fit_df implicitly 
@@ -875,6 +1195,8 @@ def test_BayesianSampler_fit_info():
     assert f.fit_info["Burn in"] == f._burn_in
     assert f.fit_info["Num threads"] == f._num_threads
     assert f.fit_info["Max convergence cycles"] == 10
+    assert f.fit_info["Convergence check interval"] == 100
+    assert f.fit_info["Estimator"] == "kde"
 
     # This will be some kind of big number after running to convergence
     assert f.fit_info["Final sample number"] > 100 
@@ -895,13 +1217,13 @@ def test_BayesianSampler___repr__():
           max_convergence_cycles=10)
 
     out = f.__repr__().split("\n")
-    assert len(out) == 24
+    assert len(out) == 26
 
     # hack, run _fit_has_been_run, _fit_failed branch
     f._success = False
 
     out = f.__repr__().split("\n")
-    assert len(out) == 19 
+    assert len(out) == 21 
 
     # Run not _fit_has_been_run
     f = BayesianSampler(some_function=model_to_wrap)
@@ -0,0 +1,243 @@
+import pytest
+
+from dataprob.fitters._numba_engine import is_numba_function
+from dataprob.fitters._numba_engine import build_numba_likelihood
+from dataprob.fitters._numba_engine import NumbaLikelihood
+from dataprob.fitters._numba_engine import get_call_spec
+from dataprob.model_wrapper.model_wrapper import ModelWrapper
+from dataprob.model_wrapper.vector_model_wrapper import VectorModelWrapper
+from dataprob.fitters.ml import MLFitter
+from dataprob.fitters.bootstrap import BootstrapFitter
+from dataprob.fitters.bootstrap import _bootstrap_replicate
+
+import numpy as np
+
+import pickle
+import sys
+
+def test_is_numba_function():
+
+    def test_fcn(a=1): return a
+    assert is_numba_function(test_fcn) is False
+    assert is_numba_function(None) is False
+
+    numba = pytest.importorskip("numba")
+    assert is_numba_function(numba.njit(test_fcn)) is True
+
+def test_get_call_spec():
+
+    x = np.arange(5.0)
+
+    def test_fcn(a,b,x): return a*b*x
+    mw = ModelWrapper(test_fcn,non_fit_kwargs={"x":x})
+    spec = get_call_spec(mw)
+    assert spec[0] == ("param",0)
+    assert spec[1] == ("param",1)
+    assert spec[2][0] == "const"
+    assert spec[2][1] is x
+
+    # Fixed parameter becomes a constant
+    mw.param_df.loc["a","fixed"] = True
+    mw.param_df.loc["a","guess"] = 3
+    mw.finalize_params()
+    spec = get_call_spec(mw)
+    assert spec[0] == ("const",3)
+    assert spec[1] == ("param",0)
+
+    # Keyword-only argument cannot go by position
+    def test_fcn(a,*,x): return a*x
+    mw = ModelWrapper(test_fcn,non_fit_kwargs={"x":x})
+    assert get_call_spec(mw) is None
+
+    # Vector model: parameter vector first, then the non-fit arguments
+    def test_fcn(theta,x): return theta[0] + theta[1]*x
+    mw = VectorModelWrapper(test_fcn,
+                            fit_parameters=["p0","p1"],
+                            non_fit_kwargs={"x":x})
+    spec = get_call_spec(mw)
+    assert spec[0][0] == "vector"
+    assert np.array_equal(spec[0][2],[0,1])
+    assert spec[1][0] == "const"
+
+def test_build_numba_likelihood():
+
+    def test_fcn(a=1,x=np.arange(5.0)): return a*x
+    mw = ModelWrapper(test_fcn)
+    y_obs = np.arange(5.0)
+    y_std = np.ones(5)
+
+    # Not a numba function; should warn and fall back
+    with pytest.warns():
+        out = build_numba_likelihood(model=mw,y_obs=y_obs,y_std=y_std)
+    assert out is None
+
+    numba = pytest.importorskip("numba")
+    mw = ModelWrapper(numba.njit(test_fcn))
+    out = build_numba_likelihood(model=mw,y_obs=y_obs,y_std=y_std)
+    assert issubclass(type(out),NumbaLikelihood)
+
+    # Argument that cannot be passed by position
+    def test_fcn(a=1,*,x=np.arange(5.0)): return a*x
+    mw = ModelWrapper(numba.njit(test_fcn))
+    with pytest.warns():
+        out = build_numba_likelihood(model=mw,y_obs=y_obs,y_std=y_std)
+    assert out is None
+
+    # Non-fit argument numba cannot compile against
+    def test_fcn(a,x): return a*np.ones(5)
+    mw = ModelWrapper(numba.njit(test_fcn),non_fit_kwargs={"x":{"a":1}})
+    with pytest.warns():
+        out = build_numba_likelihood(model=mw,y_obs=y_obs,y_std=y_std)
+    assert out is None
+
+def test_build_numba_likelihood_no_numba(monkeypatch):
+
+    if "numba" in sys.modules:
+        pytest.skip("numba is installed")
+
+    # Block the import so we hit the fallback
+    monkeypatch.setitem(sys.modules,"numba",None)
+
+    def test_fcn(a=1,x=np.arange(5.0)): return a*x
+    mw = ModelWrapper(test_fcn)
+    with pytest.warns():
+        out = build_numba_likelihood(model=mw,
+                                     y_obs=np.arange(5.0),
+                                     y_std=np.ones(5))
+    assert out is None
+
+def test_NumbaLikelihood():
+
+    numba = pytest.importorskip("numba")
+
+    @numba.njit
+    def test_fcn(a,b,x): return a*x + b
+
+    x = np.array([1.0,2.0,3.0,4.0])
+    y_obs = np.array([1.0,2.0,3.0,4.0])
+    y_std = np.array([0.1,0.2,0.3,0.4])
+    sigma2 = y_std**2
+
+    mw = ModelWrapper(test_fcn,non_fit_kwargs={"x":x})
+    nl = NumbaLikelihood(y_obs=y_obs,y_std=y_std,model=mw)
+
+    param = np.array([1.1,-0.2])
+    y_calc = 1.1*x - 0.2
+    assert np.allclose(nl.model_call(param),y_calc)
+    assert np.allclose(nl.unweighted_residuals(param),y_calc - y_obs)
+    assert np.allclose(nl.unweighted_residuals_obs(param,y_obs + 1),
+                       y_calc - y_obs - 1)
+    assert np.allclose(nl.weighted_residuals(param),(y_calc - y_obs)/y_std)
+
+    expected = -0.5*np.sum((y_calc - y_obs)**2/sigma2 + np.log(2*np.pi*sigma2))
+    assert np.isclose(nl.ln_like(param),expected)
+    assert np.isclose(nl.calc_ln_like(y_calc),expected)
+
+    batch = np.array([param,[1.0,0.0]])
+    out = nl.ln_like_batch(batch)
+    assert np.isclose(out[0],expected)
+    assert np.isclose(out[1],-0.5*np.sum(np.log(2*np.pi*sigma2)))
+
+    # Wrong number of observations
+    nl_short = NumbaLikelihood(y_obs=y_obs[:2],y_std=y_std[:2],model=mw)
+    with pytest.raises(ValueError):
+        nl_short.weighted_residuals(param)
+
+    assert nl.matches(y_obs,y_std,mw)
+    assert not nl.matches(y_obs + 1,y_std,mw)
+
+    # Fixing a parameter changes the compiled call
+    mw.param_df.loc["b","fixed"] = True
+    mw.param_df.loc["b","guess"] = 5.0
+    mw.finalize_params()
+    assert not nl.matches(y_obs,y_std,mw)
+    nl = NumbaLikelihood(y_obs=y_obs,y_std=y_std,model=mw)
+    assert np.allclose(nl.model_call(np.array([2.0])),2*x + 5)
+
+    # Kernels are recompiled after unpickling
+    nl2 = pickle.loads(pickle.dumps(nl))
+    assert np.allclose(nl2.model_call(np.array([2.0])),2*x + 5)
+
+    # Vector model with a fixed parameter
+    @numba.njit
+    def vector_fcn(theta,x): return theta[0] + theta[1]*x
+    mw = VectorModelWrapper(vector_fcn,
+                            fit_parameters=["p0","p1"],
+                            non_fit_kwargs={"x":x})
+    mw.param_df.loc["p0","fixed"] = True
+    mw.param_df.loc["p0","guess"] = 3.0
+    mw.finalize_params()
+    nl = NumbaLikelihood(y_obs=y_obs,y_std=y_std,model=mw)
+    assert np.allclose(nl.model_call(np.array([2.0])),3 + 2*x)
+
+def test_NumbaLikelihood_fit():
+
+    numba = pytest.importorskip("numba")
+
+    @numba.njit
+    def linear(m,b,x):
+        return m*x + b
+
+    x = np.linspace(-5,5,20)
+    y_obs = 2*x - 1 + np.random.normal(0,0.1,len(x))
+
+    f_numpy = MLFitter(some_function=linear,non_fit_kwargs={"x":x})
+    f_numpy.fit(y_obs=y_obs,y_std=0.1)
+
+    f_numba = MLFitter(some_function=linear,
+                       non_fit_kwargs={"x":x},
+                       engine="numba")
+    f_numba.fit(y_obs=y_obs,y_std=0.1)
+    assert f_numba._numba_likelihood is not None
+
+    assert np.allclose(f_numba.fit_df["estimate"],f_numpy.fit_df["estimate"])
+    assert np.allclose(f_numba.fit_df["std"],f_numpy.fit_df["std"])
+
+    param = np.array([2.0,-1.0])
+    assert np.isclose(f_numba._ln_like(param),f_numpy._ln_like(param))
+
+def test_NumbaLikelihood_bootstrap():
+
+    numba = pytest.importorskip("numba")
+
+    @numba.njit
+    def linear(m,b,x):
+        return m*x + b
+
+    x = np.linspace(-5,5,20)
+    y_obs = 2*x - 1 + np.random.normal(0,0.1,len(x))
+
+    # Replicate with the kernel gives the same result as with the model
+    mw = ModelWrapper(linear,non_fit_kwargs={"x":x})
+    nl = NumbaLikelihood(y_obs=y_obs,y_std=0.1*np.ones(20),model=mw)
+    kwargs = {"model":mw,
+              "y_obs":y_obs,
+              "y_std":0.1*np.ones(20),
+              "guesses":np.array([0.0,0.0]),
+              "bounds":np.array([[-np.inf,-np.inf],[np.inf,np.inf]]),
+              "least_squares_kwargs":{}}
+    param, _ = _bootstrap_replicate(seed=np.random.SeedSequence(1),**kwargs)
+    param_nl, _ = _bootstrap_replicate(seed=np.random.SeedSequence(1),
+                                       numba_likelihood=nl,
+                                       **kwargs)
+    assert np.allclose(param,param_nl)
+
+    # Bootstrap fit uses the kernel for every replicate
+    f = BootstrapFitter(some_function=linear,
+                        non_fit_kwargs={"x":x},
+                        engine="numba")
+    f.fit(y_obs=y_obs,y_std=0.1,num_bootstrap=5)
+    assert f._numba_likelihood is not None
+
+    calls = []
+    kernel = f._numba_likelihood.unweighted_residuals_obs
+    def counting_kernel(param,obs):
+        calls.append(1)
+        return kernel(param,obs)
+    f._numba_likelihood.unweighted_residuals_obs = counting_kernel
+
+    f.fit(num_bootstrap=5)
+    assert f._numba_likelihood.unweighted_residuals_obs is counting_kernel
+    assert len(calls) >= 5
+    assert np.allclose(f.fit_df["estimate"],[2,-1],atol=0.2)
+
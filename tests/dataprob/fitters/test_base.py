@@ -5,12 +5,16 @@ from dataprob.fitters.base import Fitter
 from dataprob.model_wrapper.model_wrapper import ModelWrapper
 from dataprob.model_wrapper.vector_model_wrapper import VectorModelWrapper
 from dataprob.fitters.base import _pretty_zeropad_str
+from dataprob.fitters.base import _get_least_squares_kwargs
+from dataprob.model_wrapper.wrap_function import wrap_function
+from dataprob.util.sample_file import write_sample_file
+from dataprob.util.sample_file import read_sample_file
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 import os
-import pickle
 import copy
 
 def test__pretty_zeropad_str():
@@ -33,6 +37,70 @@ def test__pretty_zeropad_str():
     x = _pretty_zeropad_str(100)
     assert x == "s{:04d}"
 
+def test__get_least_squares_kwargs():
+
+    x = np.linspace(-5,5,10)
+    def linear_fcn(m,b,x): return m*x + b
+    def linear_jac(m,b,x): return np.array([x,np.ones(len(x))]).T
+
+    inv_std = np.arange(1,11,dtype=float)
+    param = np.array([2.0,1.0])
+    expected = np.array([x,np.ones(len(x))]).T
+
+    # No Jacobian or sparsity --> kwargs copied unchanged
+    model = wrap_function(linear_fcn,non_fit_kwargs={"x":x})
+    model.finalize_params()
+    user_kwargs = {"method":"trf"}
+    kwargs = _get_least_squares_kwargs(model,user_kwargs,inv_std=inv_std)
+    assert kwargs == {"method":"trf"}
+    assert kwargs is not user_kwargs
+
+    # Analytic Jacobian, unweighted and weighted
+    model = wrap_function(linear_fcn,
+                          non_fit_kwargs={"x":x},
+                          jacobian_function=linear_jac)
+    model.finalize_params()
+    kwargs = _get_least_squares_kwargs(model,user_kwargs)
+    assert np.allclose(kwargs["jac"](param),-expected)
+    assert "jac" not in user_kwargs
+
+    kwargs = _get_least_squares_kwargs(model,user_kwargs,inv_std=inv_std)
+    assert np.allclose(kwargs["jac"](param),-expected*inv_std[:,None])
+    assert "jac_sparsity" not in kwargs
+
+    # Sparse analytic Jacobian stays sparse
+    model.fast_jacobian = lambda param: sparse.csr_matrix(expected)
+    kwargs = _get_least_squares_kwargs(model,{},inv_std=inv_std)
+    J = kwargs["jac"](param)
+    assert sparse.issparse(J)
+    assert np.allclose(J.toarray(),-expected*inv_std[:,None])
+
+    # User jac wins
+    def user_jac(param): return None
+    kwargs = _get_least_squares_kwargs(model,{"jac":user_jac},inv_std=inv_std)
+    assert kwargs == {"jac":user_jac}
+
+    # Declared sparsity --> jac_sparsity and lsmr solver
+    structure = np.ones((10,2),dtype=int)
+    model = wrap_function(linear_fcn,
+                          non_fit_kwargs={"x":x},
+                          jac_sparsity=structure)
+    model.finalize_params()
+    kwargs = _get_least_squares_kwargs(model,{},inv_std=inv_std)
+    assert np.array_equal(kwargs["jac_sparsity"].toarray(),structure)
+    assert kwargs["tr_solver"] == "lsmr"
+    assert "jac" not in kwargs
+
+    # User can override or turn off
+    kwargs = _get_least_squares_kwargs(model,{"tr_solver":"exact"})
+    assert kwargs["tr_solver"] == "exact"
+
+    kwargs = _get_least_squares_kwargs(model,{"jac_sparsity":None})
+    assert kwargs == {"jac_sparsity":None}
+
+    kwargs = _get_least_squares_kwargs(model,{"jac":"3-point"})
+    assert kwargs == {"jac":"3-point"}
+
 def test_Fitter__init__():
     """
     Test model initialization.
@@ -80,6 +148,23 @@ def test_Fitter__init__():
     assert np.array_equal(f._model.non_fit_kwargs["x"],np.arange(10))
     assert f._fit_has_been_run is False
 
+    # make sure vectorized is being passed
+    kwargs = copy.deepcopy(base_kwargs)
+    f = Fitter(**kwargs)
+    assert f._model.vectorized is False
+    kwargs["vectorized"] = True
+    f = Fitter(**kwargs)
+    assert f._model.vectorized is True
+
+    # make sure jacobian_function is being passed
+    def test_jac(m,b,x): return np.array([x,np.ones(len(x))]).T
+    kwargs = copy.deepcopy(base_kwargs)
+    f = Fitter(**kwargs)
+    assert f._model.jacobian is None
+    kwargs["jacobian_function"] = test_jac
+    f = Fitter(**kwargs)
+    assert f._model.jacobian is test_jac
+
     # Send in pre-wrapped model
     def test_model(m=10,b=1,x=[]): return m*x + b
     mw = ModelWrapper(test_model,
@@ -370,6 +455,45 @@ def test_Fitter_weighted_residuals():
     with pytest.raises(ValueError):
         f.weighted_residuals([1,2,3,4])
 
+def test_Fitter__get_obs_constants():
+
+    def linear_fcn(m,b,x): return m*x + b
+    x = np.linspace(-5,5,15)
+    y_obs = linear_fcn(m=2,b=-1,x=x)
+    y_std = np.linspace(0.1,1,15)
+
+    f = Fitter(some_function=linear_fcn,
+               non_fit_kwargs={"x":x})
+    assert f._obs_constants is None
+
+    # Calculated when data_df is set
+    f.data_df = pd.DataFrame({"y_obs":y_obs,
+                              "y_std":y_std})
+    assert f._obs_constants is not None
+
+    inv_std, inv_sigma2, ln_norm = f._get_obs_constants()
+    assert np.allclose(inv_std,1/y_std)
+    assert np.allclose(inv_sigma2,1/y_std**2)
+    assert np.isclose(ln_norm,np.sum(np.log(2*np.pi*y_std**2)))
+
+    # Not recalculated if nothing changed
+    assert f._get_obs_constants()[0] is inv_std
+
+    # Recalculated if y_std is replaced directly; a single value is applied
+    # to every observation
+    f._y_std = 2.0
+    inv_std, inv_sigma2, ln_norm = f._get_obs_constants()
+    assert np.allclose(inv_std,0.5*np.ones(15))
+    assert np.isclose(ln_norm,15*np.log(2*np.pi*4))
+
+    # y_std not set
+    f = Fitter(some_function=linear_fcn,
+               non_fit_kwargs={"x":x})
+    f._y_obs = y_obs
+    f._y_std = None
+    with pytest.raises(TypeError):
+        f._get_obs_constants()
+
 def test_Fitter__ln_like():
     """
     Test internal function -- no error checking. 
@@ -392,6 +516,32 @@ def test_Fitter__ln_like():
 
     assert np.isclose(f._ln_like(test_params),ln_like)
 
+def test_Fitter__ln_like_batch():
+    """
+    Test internal function -- no error checking. 
+    """
+
+    def linear_fcn(m,b,x): return m*x + b
+    x = np.linspace(-5,5,15)
+    y_obs = linear_fcn(m=2,b=-1,x=x)
+    y_std = 0.1*np.ones(15)
+    test_params = np.array([[10,20],
+                            [2,-1],
+                            [0,0]],dtype=float)
+
+    for vectorized in [False,True]:
+
+        f = Fitter(some_function=linear_fcn,
+                   non_fit_kwargs={"x":x},
+                   vectorized=vectorized)
+        f.data_df = pd.DataFrame({"y_obs":y_obs,
+                                  "y_std":y_std})
+
+        expected = [f._ln_like(p) for p in test_params]
+        value = f._ln_like_batch(test_params)
+        assert value.shape == (3,)
+        assert np.allclose(value,expected)
+
 def test_Fitter_ln_like():
     """
     Test ln_like like _ln_like, but test error checking. 
@@ -429,6 +579,19 @@ def test_Fitter_ln_like():
 # Test setters, getters, and internal sanity checks
 # ---------------------------------------------------------------------------- #
 
+def test_Fitter_model_batch():
+
+    def linear_fcn(m,b,x): return m*x + b
+    x = np.linspace(-5,5,10)
+    params = np.array([[1,2],[3,4]],dtype=float)
+
+    f = Fitter(some_function=linear_fcn,
+               non_fit_kwargs={"x":x})
+    out = f.model_batch(params)
+    assert out.shape == (2,10)
+    assert np.allclose(out[0],linear_fcn(1,2,x))
+    assert np.allclose(out[1],linear_fcn(3,4,x))
+
 def test_Fitter_y_obs():
     """
     Test the y_obs setter.
@@ -495,6 +658,34 @@ def test_Fitter_non_fit_kwargs():
     f._model.finalize_params()
 
 
+def test_Fitter_engine():
+
+    def linear_fcn(m=1,b=0,x=np.linspace(-5,5,10)): return m*x + b
+
+    f = Fitter(some_function=linear_fcn)
+    assert f.engine == "numpy"
+    assert f._numba_likelihood is None
+
+    f.engine = "numba"
+    assert f.engine == "numba"
+
+    with pytest.raises(ValueError):
+        f.engine = "not_an_engine"
+    with pytest.raises(ValueError):
+        f.engine = ["numpy"]
+    with pytest.raises(ValueError):
+        Fitter(some_function=linear_fcn,engine="not_an_engine")
+
+    # Model is not compiled by numba (and numba may not be installed). Should
+    # warn and fall back to numpy.
+    f = Fitter(some_function=linear_fcn,engine="numba")
+    f._fit = lambda **kwargs: None
+    y_obs = linear_fcn(m=2,b=-1)
+    with pytest.warns():
+        f.fit(y_obs=y_obs,y_std=0.1)
+    assert f._numba_likelihood is None
+    assert np.allclose(f._weighted_residuals(np.array([2,-1])),0)
+
 def test_Fitter_data_df():
     
     # -------------------------------------------------------------------------
@@ -680,6 +871,66 @@ def test_Fitter__initialize_fit_df():
         assert np.array_equal(tc.param_df[k],tc._fit_df[k],equal_nan=True)
     
 
+def test_Fitter__set_extra_intervals():
+
+    def test_fcn(a=1,b=2): return a*b
+    f = Fitter(some_function=test_fcn)
+    assert not hasattr(f,"_extra_intervals")
+
+    f._set_extra_intervals(None)
+    assert f._extra_intervals == []
+
+    # 95 is always reported, so dropped. Duplicates dropped. 
+    f._set_extra_intervals([68,95,99.5,68])
+    assert f._extra_intervals == [68,99.5]
+
+    with pytest.raises(ValueError):
+        f._set_extra_intervals(68)
+    with pytest.raises(ValueError):
+        f._set_extra_intervals("68")
+    with pytest.raises(ValueError):
+        f._set_extra_intervals([0])
+    with pytest.raises(ValueError):
+        f._set_extra_intervals([100])
+    with pytest.raises(ValueError):
+        f._set_extra_intervals(["a"])
+
+def test_Fitter__update_fit_df_intervals():
+
+    def test_fcn(a=1,b=2,c=3): return a*b*c
+    f = Fitter(some_function=test_fcn)
+    f.param_df.loc["b","fixed"] = True
+    f._initialize_fit_df()
+    unfixed = np.array([True,False,True])
+
+    samples = np.random.normal(loc=0,scale=1,size=(100000,2))
+
+    # Only 95%
+    f._update_fit_df_intervals(samples,unfixed)
+    assert np.allclose(f._fit_df.loc[["a","c"],"low_95"],-1.96,atol=0.05)
+    assert np.allclose(f._fit_df.loc[["a","c"],"high_95"],1.96,atol=0.05)
+    assert np.isnan(f._fit_df.loc["b","low_95"])
+    assert np.isnan(f._fit_df.loc["b","high_95"])
+
+    # Extra intervals go after high_95
+    f._set_extra_intervals([68,99])
+    f._update_fit_df_intervals(samples,unfixed)
+    columns = list(f._fit_df.columns)
+    idx = columns.index("high_95")
+    assert columns[idx-1:idx+5] == ["low_95","high_95","low_68","high_68",
+                                    "low_99","high_99"]
+    assert np.allclose(f._fit_df.loc[["a","c"],"low_68"],-0.99,atol=0.05)
+    assert np.allclose(f._fit_df.loc[["a","c"],"high_99"],2.58,atol=0.05)
+    assert np.isnan(f._fit_df.loc["b","low_68"])
+
+    # Columns no longer requested are removed
+    f._set_extra_intervals([99])
+    f._update_fit_df_intervals(samples,unfixed)
+    assert "low_68" not in f._fit_df.columns
+    assert "high_68" not in f._fit_df.columns
+    assert "low_99" in f._fit_df.columns
+    assert "high_99" in f._fit_df.columns
+
 def test_Fitter__update_fit_df():
 
     def test_fcn(a=1,b=2): return a*b
@@ -716,6 +967,84 @@ def test_Fitter_fit_quality():
     # nothing done yet
     assert f.fit_quality is None
 
+def test_Fitter__result_cache():
+
+    calls = []
+    def test_fcn(a=1,b=2,x=None):
+        calls.append(1)
+        return x*a + b
+    x = np.arange(10)
+    
+    f = Fitter(some_function=test_fcn,
+               non_fit_kwargs={"x":x})
+    assert f._result_cache == {}
+    f.data_df = pd.DataFrame({"y_obs":x*2 + 1,"y_std":np.ones(10)})
+
+    # Hack in a successful fit
+    f._fit_df.loc[["a","b"],"estimate"] = [2,1]
+    f._success = True
+    f._fit_has_been_run = True
+
+    # First access calls the model; later accesses do not
+    data_df = f.data_df
+    quality = f.fit_quality
+    num_calls = len(calls)
+    assert num_calls > 0
+    for _ in range(3):
+        assert f.data_df.equals(data_df)
+        assert f.fit_quality.equals(quality)
+    assert len(calls) == num_calls
+
+    # Editing the returned dataframe does not alter the cache
+    data_df["y_calc"] = 0
+    assert np.array_equal(f.data_df["y_calc"],x*2 + 1)
+    assert len(calls) == num_calls
+
+    # Editing param_df in place invalidates the cache
+    f.param_df.loc["a","guess"] = 5
+    f.data_df
+    assert len(calls) > num_calls
+    num_calls = len(calls)
+    f.data_df
+    assert len(calls) == num_calls
+
+    # Setting param_df invalidates the cache
+    f.param_df = f.param_df.copy()
+    assert f._result_cache == {}
+    f.data_df
+    assert len(calls) > num_calls
+    num_calls = len(calls)
+
+    # Changing non_fit_kwargs invalidates the cache
+    f.non_fit_kwargs["x"] = np.arange(10) + 1
+    assert np.array_equal(f.data_df["y_calc"],(x + 1)*2 + 1)
+    assert len(calls) > num_calls
+    num_calls = len(calls)
+
+    # Changing success invalidates the cache
+    f.data_df
+    assert len(calls) == num_calls
+    f._success = False
+    f.data_df
+    assert len(calls) > num_calls
+    num_calls = len(calls)
+
+    # Setting data_df invalidates the cache
+    f._success = True
+    f.data_df
+    assert len(calls) > num_calls
+    f.data_df = pd.DataFrame({"y_obs":x*3,"y_std":np.ones(10)})
+    assert f._result_cache == {}
+    assert np.array_equal(f.data_df["y_obs"],x*3)
+
+    # Invalid param_df: not cached, but does not crash
+    f._success = False
+    f.param_df.loc["a","upper_bound"] = -10
+    assert "y_calc" not in f.data_df.columns
+    assert "y_calc" not in f.data_df.columns
+    f.param_df.loc["a","upper_bound"] = np.inf
+    assert "y_calc" in f.data_df.columns
+
 
 
 def test_Fitter_samples():
@@ -814,13 +1143,116 @@ def test_Fitter_get_sample_df():
     sample_df = f.get_sample_df(num_samples=100)
     assert len(sample_df.columns) == 53
 
+    # Sample columns should match calling the model on each sample
+    f._samples = np.random.normal(loc=[10,20],scale=1,size=(1000,2))
+    sample_df = f.get_sample_df(num_samples=10)
+    for c in sample_df.columns[3:]:
+        i = int(c[1:])
+        assert np.allclose(sample_df[c],f.model(f._samples[i]))
+
+    # No samples or one sample
+    sample_df = f.get_sample_df(num_samples=0)
+    assert np.array_equal(sample_df.columns,["y_obs","y_std","y_calc"])
+    sample_df = f.get_sample_df(num_samples=1)
+    assert np.array_equal(sample_df.columns,["y_obs","y_std","y_calc","s00000"])
+
+    # Array mode returns the sample columns as an array
+    sample_array = f.get_sample_df(num_samples=10,as_array=True)
+    assert issubclass(type(sample_array),np.ndarray)
+    assert sample_array.shape == (10,10)
+    sample_df = f.get_sample_df(num_samples=10)
+    assert np.array_equal(sample_array,np.array(sample_df.iloc[:,3:]))
+
+    sample_array = f.get_sample_df(num_samples=0,as_array=True)
+    assert sample_array.shape == (10,0)
+
+    f._samples = None
+    sample_array = f.get_sample_df(as_array=True)
+    assert sample_array.shape == (10,0)
+
+    with pytest.raises(ValueError):
+        f.get_sample_df(as_array="not a bool")
+
+
+def test_Fitter_set_sample_storage(tmpdir):
+
+    def test_fcn(a,b,c): return a*b*c
+
+    # defaults
+    f = Fitter(some_function=test_fcn)
+    assert f._sample_file is None
+    assert f._sample_dtype == np.float64
+    assert f._sample_store is None
+
+    # bad dtype
+    with pytest.raises(ValueError):
+        f.set_sample_storage(dtype=int)
+
+    # existing file
+    filename = os.path.join(tmpdir,"exists.npy")
+    np.save(filename,np.ones((1,3)))
+    with pytest.raises(FileExistsError):
+        f.set_sample_storage(sample_file=filename)
+
+    # float32 in memory; nothing to copy yet
+    f.set_sample_storage(dtype=np.float32)
+    assert f._sample_dtype == np.float32
+    assert f._sample_store is None
+    assert f.samples is None
+
+    f._add_samples(np.ones((10,3)))
+    assert f.samples.dtype == np.float32
+    assert f.samples.shape == (10,3)
+
+    # move existing samples to disk
+    filename = os.path.join(tmpdir,"samples.npy")
+    f.set_sample_storage(sample_file=filename)
+    assert isinstance(f.samples,np.memmap)
+    assert f.samples.dtype == np.float64
+    assert np.array_equal(f.samples,np.ones((10,3)))
+    assert np.array_equal(np.load(filename),np.ones((10,3)))
+
+    f._add_samples(np.zeros((5,3)))
+    assert f.samples.shape == (15,3)
+    assert np.array_equal(np.load(filename)[10:],np.zeros((5,3)))
+
+def test_Fitter__add_samples(tmpdir):
+
+    def test_fcn(a,b,c): return a*b*c
+
+    f = Fitter(some_function=test_fcn)
+    assert f.samples is None
+
+    a = np.random.normal(size=(10,3))
+    f._add_samples(a)
+    assert np.array_equal(f.samples,a)
+    assert f._sample_store.holds(f._samples)
+
+    b = np.random.normal(size=(5,3))
+    f._add_samples(b)
+    assert np.array_equal(f.samples,np.concatenate((a,b)))
+
+    # Samples set directly are copied into the store before adding
+    f._samples = a.copy()
+    f._add_samples(b)
+    assert np.array_equal(f.samples,np.concatenate((a,b)))
+
+    # No samples --> start over, even with a different width
+    f._samples = None
+    c = np.random.normal(size=(4,2))
+    f._add_samples(c)
+    assert np.array_equal(f.samples,c)
+
+    # Width mismatch with existing samples
+    with pytest.raises(ValueError):
+        f._add_samples(a)
 
 def test_Fitter_write_samples(tmpdir):
     
     cwd = os.getcwd()
     os.chdir(tmpdir)
 
-    test_file = "test-out.pickle"
+    test_file = "test-out.npy"
 
     def test_fcn(a,b,c,d,e): return a*b
 
@@ -838,17 +1270,28 @@ def test_Fitter_write_samples(tmpdir):
     f.write_samples(test_file)
     assert os.path.exists(test_file)
 
-    # read samples back in to make sure they wrote as a pickle
-    with open(test_file,"rb") as handle:
-        read_back = pickle.load(handle)
-    assert np.array_equal(read_back,f._samples)
-
-    # Try and fail to write samples to an existing pickle files
-    with open("existing-file.pickle","w") as g:
+    # read samples back in to make sure they wrote as a sample file
+    read_back = np.load(test_file,mmap_mode="r")
+    assert read_back.dtype.names == ("a","b","c","d","e")
+    assert np.array_equal(read_back["a"],f._samples[:,0])
+    samples, param_names, lnprob = read_sample_file(test_file)
+    assert np.array_equal(samples,f._samples)
+    assert param_names == ["a","b","c","d","e"]
+    assert lnprob is None
+
+    # lnprob is written if recorded
+    f._lnprob = np.arange(100,dtype=float)
+    f.write_samples("with-lnprob.npy")
+    samples, param_names, lnprob = read_sample_file("with-lnprob.npy")
+    assert np.array_equal(samples,f._samples)
+    assert np.array_equal(lnprob,f._lnprob)
+
+    # Try and fail to write samples to an existing file
+    with open("existing-file.npy","w") as g:
         g.write("yo")
     
     with pytest.raises(FileExistsError):
-        f.write_samples("existing-file.pickle")
+        f.write_samples("existing-file.npy")
 
     os.chdir(cwd)
 
@@ -861,8 +1304,11 @@ def test_Fitter_append_samples(tmpdir):
     # make some files and arrays for testing
 
     sample_array = np.ones((100,3),dtype=float)
-    with open("test.pickle","wb") as p:
-        pickle.dump(sample_array,p)
+    write_sample_file("test.npy",sample_array,param_names=["a","b","c"])
+    np.save("plain.npy",sample_array)
+    write_sample_file("wrong_names.npy",sample_array,param_names=["x","y","z"])
+    write_sample_file("with_lnprob.npy",sample_array,param_names=["a","b","c"],
+                      lnprob=np.ones(100))
     with open("bad_file.txt","w") as g:
         g.write("yo")
 
@@ -903,27 +1349,57 @@ def test_Fitter_append_samples(tmpdir):
 
     # Too many inputs
     with pytest.raises(ValueError):
-        f.append_samples(sample_file="test.pickle",
+        f.append_samples(sample_file="test.npy",
                          sample_array=sample_array)
 
     f = copy.deepcopy(base_f)
     assert np.array_equal(f.samples.shape,(100,3))
     
-    f.append_samples(sample_file="test.pickle")
+    f.append_samples(sample_file="test.npy")
     assert np.array_equal(f.samples.shape,(200,3))
 
-    f.append_samples(sample_file="test.pickle")
+    f.append_samples(sample_file="plain.npy")
     assert np.array_equal(f.samples.shape,(300,3))
 
     f.append_samples(sample_array=sample_array)
     assert np.array_equal(f.samples.shape,(400,3))
 
+    # Samples from a file go to the sample storage as a memory-mapped view,
+    # without an intermediate copy
+    f = copy.deepcopy(base_f)
+    added = []
+    add_samples = f._add_samples
+    def recording_add_samples(new_samples):
+        added.append(new_samples)
+        add_samples(new_samples)
+    f._add_samples = recording_add_samples
+    f.append_samples(sample_file="test.npy")
+    assert not added[0].flags.owndata
+    assert not added[0].flags.writeable
+    assert np.array_equal(f.samples,np.ones((200,3)))
+    del added
+
+    # Recorded log probabilities should stay aligned with the samples
+    f = copy.deepcopy(base_f)
+    f._lnprob = np.zeros(100)
+    f.append_samples(sample_array=sample_array)
+    assert f._lnprob.shape == (200,)
+    assert np.array_equal(f._lnprob[:100],np.zeros(100))
+    assert np.all(np.isnan(f._lnprob[100:]))
+
+    # log probabilities in the file are kept
+    f.append_samples(sample_file="with_lnprob.npy")
+    assert f._lnprob.shape == (300,)
+    assert np.array_equal(f._lnprob[200:],np.ones(100))
+
     # Bad files
     f = copy.deepcopy(base_f)
     with pytest.raises(FileNotFoundError):
         f.append_samples(sample_file="not_real_file")
-    with pytest.raises(pickle.UnpicklingError):
+    with pytest.raises(ValueError):
         f.append_samples(sample_file="bad_file.txt")
+    with pytest.raises(ValueError):
+        f.append_samples(sample_file="wrong_names.npy")
 
     # not coercable to floats
     f = copy.deepcopy(base_f)
@@ -0,0 +1,185 @@
+import pytest
+
+from dataprob.fitters.batch import batch_fit
+from dataprob.fitters.batch import _fit_dataset
+from dataprob.fitters.batch import _process_batch_obs
+from dataprob.fitters.ml import MLFitter
+from dataprob.model_wrapper.wrap_function import wrap_function
+
+import numpy as np
+import pandas as pd
+
+def _linear(m=1.0,b=0.0,x=np.linspace(-5,5,20)):
+    return m*x + b
+
+def _linear_jac(m=1.0,b=0.0,x=np.linspace(-5,5,20)):
+    return np.stack([x,np.ones(len(x))],axis=1)
+
+def _make_batch(num_datasets=5,seed=0):
+
+    rng = np.random.default_rng(seed)
+    ms = np.linspace(-2,2,num_datasets)
+    bs = np.linspace(1,3,num_datasets)
+    y_obs = np.array([_linear(m,b) for m, b in zip(ms,bs)])
+    y_obs = y_obs + rng.normal(0,0.1,y_obs.shape)
+
+    return ms, bs, y_obs
+
+def test__process_batch_obs():
+
+    y_obs = np.ones((3,4))
+
+    # Scalar y_std is broadcast
+    ids, yo, ys = _process_batch_obs(y_obs,0.5,"dataset")
+    assert np.array_equal(ids,[0,1,2])
+    assert yo.shape == (3,4)
+    assert ys.shape == (3,4)
+    assert np.all(ys == 0.5)
+
+    # Per-observation y_std is broadcast
+    ids, yo, ys = _process_batch_obs(y_obs,np.arange(1,5),"dataset")
+    assert np.array_equal(ys[2],[1,2,3,4])
+
+    # Long dataframe; datasets in order of first appearance
+    df = pd.DataFrame({"dataset":["b","b","a","a"],
+                       "y_obs":[1,2,3,4],
+                       "y_std":[0.1,0.2,0.3,0.4]})
+    ids, yo, ys = _process_batch_obs(df,None,"dataset")
+    assert np.array_equal(ids,["b","a"])
+    assert np.array_equal(yo,[[1,2],[3,4]])
+    assert np.array_equal(ys,[[0.1,0.2],[0.3,0.4]])
+
+    # Custom column name
+    df = df.rename(columns={"dataset":"well"})
+    ids, yo, ys = _process_batch_obs(df,None,"well")
+    assert np.array_equal(ids,["b","a"])
+
+    # Bad inputs
+    with pytest.raises(ValueError):
+        _process_batch_obs(df,None,"dataset")
+    with pytest.raises(ValueError):
+        _process_batch_obs(df,1.0,"well")
+    with pytest.raises(ValueError):
+        _process_batch_obs(df.iloc[:3],None,"well")
+    with pytest.raises(ValueError):
+        _process_batch_obs(np.ones(4),1.0,"dataset")
+    with pytest.raises(ValueError):
+        _process_batch_obs(y_obs,None,"dataset")
+    with pytest.raises(ValueError):
+        _process_batch_obs(y_obs,np.ones(3),"dataset")
+    with pytest.raises(ValueError):
+        _process_batch_obs(y_obs,0,"dataset")
+    with pytest.raises(ValueError):
+        _process_batch_obs(y_obs,np.nan,"dataset")
+    y_obs[0,0] = np.inf
+    with pytest.raises(ValueError):
+        _process_batch_obs(y_obs,1.0,"dataset")
+    with pytest.raises(ValueError):
+        _process_batch_obs([["a"]],1.0,"dataset")
+
+def test__fit_dataset():
+
+    mw = wrap_function(_linear)
+    mw.finalize_params()
+    y_obs = _linear(2,1)
+    y_std = 0.1*np.ones(len(y_obs))
+    bounds = np.array([[-np.inf,-np.inf],[np.inf,np.inf]])
+
+    x, std, success, problem = _fit_dataset(model=mw,
+                                            y_obs=y_obs,
+                                            y_std=y_std,
+                                            guesses=np.zeros(2),
+                                            bounds=bounds,
+                                            least_squares_kwargs={})
+    assert np.allclose(x,[2,1])
+    assert np.all(std > 0)
+    assert success
+    assert problem is None
+
+    # least_squares error is caught
+    x, std, success, problem = _fit_dataset(model=mw,
+                                            y_obs=y_obs,
+                                            y_std=y_std,
+                                            guesses=np.zeros(2),
+                                            bounds=bounds,
+                                            least_squares_kwargs={"not_a_kwarg":1})
+    assert np.all(np.isnan(x))
+    assert np.all(np.isnan(std))
+    assert not success
+    assert problem is not None
+
+def test_batch_fit():
+
+    ms, bs, y_obs = _make_batch()
+
+    fit_df = batch_fit(_linear,y_obs=y_obs,y_std=0.1)
+    assert list(fit_df.columns) == ["dataset","name","estimate","std",
+                                    "low_95","high_95","guess","fixed",
+                                    "lower_bound","upper_bound","prior_mean",
+                                    "prior_std","success"]
+    assert len(fit_df) == 10
+    assert np.array_equal(fit_df["dataset"],np.repeat(np.arange(5),2))
+    assert np.array_equal(fit_df["name"],["m","b"]*5)
+    assert np.all(fit_df["success"])
+
+    est = np.array(fit_df["estimate"]).reshape(5,2)
+    assert np.allclose(est[:,0],ms,atol=0.1)
+    assert np.allclose(est[:,1],bs,atol=0.1)
+    assert np.all(fit_df["low_95"] < fit_df["estimate"])
+    assert np.all(fit_df["high_95"] > fit_df["estimate"])
+
+    # Same answers as fitting each dataset with MLFitter
+    for i in range(5):
+        f = MLFitter(some_function=_linear)
+        f.fit(y_obs=y_obs[i],y_std=0.1)
+        this_df = fit_df[fit_df["dataset"] == i].set_index("name")
+        for col in ["estimate","std","low_95","high_95"]:
+            assert np.allclose(this_df.loc[["m","b"],col],
+                               f.fit_df.loc[["m","b"],col])
+
+    # Long dataframe input
+    df = pd.DataFrame({"well":np.repeat([f"w{i}" for i in range(5)],20),
+                       "y_obs":y_obs.ravel(),
+                       "y_std":0.1})
+    long_df = batch_fit(_linear,y_obs=df,dataset_column="well")
+    assert np.array_equal(long_df["well"],np.repeat([f"w{i}" for i in range(5)],2))
+    assert np.allclose(long_df["estimate"],fit_df["estimate"])
+
+    # Fixed parameter and a model wrapper as input
+    mw = wrap_function(_linear)
+    mw.param_df.loc["b","fixed"] = True
+    mw.param_df.loc["b","guess"] = 2
+    fixed_df = batch_fit(mw,y_obs=y_obs,y_std=0.1)
+    b_rows = fixed_df[fixed_df["name"] == "b"]
+    assert np.all(b_rows["estimate"] == 2)
+    assert np.all(b_rows["fixed"])
+    assert np.all(np.isnan(b_rows["std"]))
+
+    # Input wrapper is not modified
+    assert mw.param_df.loc["b","guess"] == 2
+
+    # Analytic jacobian gives the same answer
+    jac_df = batch_fit(_linear,
+                       y_obs=y_obs,
+                       y_std=0.1,
+                       jacobian_function=_linear_jac)
+    assert np.allclose(jac_df["estimate"],fit_df["estimate"])
+
+    # Pool of workers gives the same answer
+    pool_df = batch_fit(_linear,y_obs=y_obs,y_std=0.1,num_workers=2)
+    assert np.allclose(pool_df["estimate"],fit_df["estimate"])
+    assert np.allclose(pool_df["std"],fit_df["std"])
+
+    # least_squares kwargs are passed in
+    with pytest.warns():
+        bad_df = batch_fit(_linear,y_obs=y_obs,y_std=0.1,not_a_kwarg=1)
+    assert not np.any(bad_df["success"])
+    assert np.all(np.isnan(bad_df["estimate"]))
+
+    # Bad inputs
+    with pytest.raises(ValueError):
+        batch_fit(_linear,y_obs=y_obs,y_std=0.1,num_workers=-1)
+    with pytest.raises(ValueError):
+        batch_fit(_linear,y_obs=y_obs,y_std=0.1,dataset_column=1)
+    with pytest.raises(ValueError):
+        batch_fit(_linear,y_obs=y_obs[0],y_std=0.1)
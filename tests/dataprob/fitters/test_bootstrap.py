@@ -2,11 +2,70 @@
 import pytest
 
 from dataprob.fitters.bootstrap import BootstrapFitter
+from dataprob.fitters.bootstrap import _bootstrap_replicate
 from dataprob.model_wrapper.model_wrapper import ModelWrapper
 
 import numpy as np
 import pandas as pd
 
+def _linear_fcn(m,b,x):
+    """
+    Module-level model so it can be sent to worker processes under any
+    multiprocessing start method.
+    """
+    return m*x + b
+
+def test__bootstrap_replicate():
+
+    def linear_fcn(m,b,x): return m*x + b
+    x = np.linspace(-5,5,10)
+    mw = ModelWrapper(linear_fcn,non_fit_kwargs={"x":x})
+
+    kwargs = {"model":mw,
+              "y_obs":linear_fcn(m=2,b=-1,x=x),
+              "y_std":0.1*np.ones(10),
+              "guesses":np.array([0.0,0.0]),
+              "bounds":np.array([[-np.inf,-np.inf],[np.inf,np.inf]]),
+              "least_squares_kwargs":{}}
+
+    # Should fit close to true values
+    param, problem = _bootstrap_replicate(seed=np.random.SeedSequence(1),
+                                          **kwargs)
+    assert problem is None
+    assert np.allclose(param,[2,-1],atol=0.2)
+
+    # Same seed, same result; different seed, different result
+    param2, _ = _bootstrap_replicate(seed=np.random.SeedSequence(1),**kwargs)
+    assert np.array_equal(param,param2)
+    param3, _ = _bootstrap_replicate(seed=np.random.SeedSequence(2),**kwargs)
+    assert not np.array_equal(param,param3)
+
+    # Analytic jacobian should be used if present
+    jac_calls = []
+    def linear_jac(m,b,x): 
+        jac_calls.append(1)
+        return np.array([x,np.ones(len(x))]).T
+    mw.jacobian = linear_jac
+    param_jac, problem = _bootstrap_replicate(seed=np.random.SeedSequence(1),
+                                              **kwargs)
+    assert problem is None
+    assert len(jac_calls) > 0
+    assert np.allclose(param_jac,param)
+    mw.jacobian = None
+
+    # Fit fails to converge -- nan, no problem
+    kwargs["least_squares_kwargs"] = {"max_nfev":1}
+    param, problem = _bootstrap_replicate(seed=np.random.SeedSequence(1),
+                                          **kwargs)
+    assert np.sum(np.isnan(param)) == 2
+    assert problem is None
+
+    # Fit throws error -- nan, problem recorded
+    kwargs["least_squares_kwargs"] = {"not_a_kwarg":1}
+    param, problem = _bootstrap_replicate(seed=np.random.SeedSequence(1),
+                                          **kwargs)
+    assert np.sum(np.isnan(param)) == 2
+    assert issubclass(type(problem),str)
 
 def test_BootstrapFitter__init():
 
@@ -30,6 +89,27 @@ def test_BootstrapFitter_fit():
           num_bootstrap=3)
 
     assert f._num_bootstrap == 3
+    assert f._extra_intervals == []
+    assert "Extra intervals" not in f.fit_info
+
+
+    # extra_intervals passing
+    g = BootstrapFitter(some_function=test_fcn,
+                        non_fit_kwargs={"x":np.arange(10)})
+    g.fit(y_obs=y_obs,
+          y_std=y_std,
+          num_bootstrap=10,
+          extra_intervals=[68])
+    assert g._extra_intervals == [68]
+    assert g.fit_info["Extra intervals"] == [68]
+    assert np.all(g.fit_df["low_68"] > g.fit_df["low_95"])
+    assert np.all(g.fit_df["high_68"] < g.fit_df["high_95"])
+
+    with pytest.raises(ValueError):
+        g.fit(y_obs=y_obs,
+              y_std=y_std,
+              num_bootstrap=3,
+              extra_intervals=[101])
 
     # This will only warn because the fitter will catch the failure and record
     # it as a failure. It will stick 3 nan values into the samples array
@@ -61,6 +141,58 @@ def test_BootstrapFitter_fit():
               y_std=y_std,
               num_bootstrap=2)
 
+    with pytest.raises(ValueError):
+        f.fit(y_obs=y_obs,
+              y_std=y_std,
+              num_workers=-1)
+
+    # Results should be reproducible and independent of number of workers
+    samples = []
+    for num_workers in [1,2]:
+        f = BootstrapFitter(some_function=_linear_fcn,
+                            non_fit_kwargs={"x":np.arange(10)})
+        np.random.seed(0)
+        f.fit(y_obs=y_obs,
+              y_std=y_std,
+              num_bootstrap=10,
+              num_workers=num_workers)
+        assert f._num_workers == num_workers
+        assert f.fit_info["Num workers"] == num_workers
+        samples.append(f.samples)
+    
+    assert samples[0].shape == (10,2)
+    assert np.sum(np.isnan(samples[0])) == 0
+    assert np.array_equal(samples[0],samples[1])
+
+    # A model defined inside a function cannot be sent to worker processes
+    f = BootstrapFitter(some_function=test_fcn,
+                        non_fit_kwargs={"x":np.arange(10)})
+    with pytest.raises(ValueError):
+        f.fit(y_obs=y_obs,
+              y_std=y_std,
+              num_bootstrap=10,
+              num_workers=2)
+
+    # y_obs not altered by fit
+    assert np.array_equal(f.y_obs,y_obs)
+
+    # warm_start
+    f = BootstrapFitter(some_function=test_fcn,
+                        non_fit_kwargs={"x":np.arange(10)})
+    f.fit(y_obs=y_obs,
+          y_std=y_std,
+          num_bootstrap=10,
+          warm_start=True)
+    assert f._warm_start is True
+    assert f.fit_info["Warm start"] is True
+    assert f.success is True
+    assert np.allclose(f.fit_df["estimate"],[1,2],atol=1)
+
+    with pytest.raises(ValueError):
+        f.fit(y_obs=y_obs,
+              y_std=y_std,
+              warm_start="not a bool")
+
 
 
 def test_BootstrapFitter__fit():
@@ -172,6 +304,51 @@ def test_BootstrapFitter__fit():
     assert f._success is True
     assert np.sum(np.isnan(f.fit_df["estimate"])) == 0
 
+def test_BootstrapFitter__warm_start_fit():
+
+    def linear_fcn(m,b,x): return m*x + b
+    x = np.linspace(-5,5,10)
+    data_df = pd.DataFrame({"y_obs":linear_fcn(m=2,b=-1,x=x),
+                            "y_std":0.1*np.ones(10)})
+
+    f = BootstrapFitter(some_function=linear_fcn,
+                        non_fit_kwargs={"x":x})
+    f.data_df = data_df
+
+    guesses = np.array([0.0,0.0])
+    bounds = np.array([[-np.inf,-np.inf],[np.inf,np.inf]])
+
+    # Starts from ML solution; x_scale from jacobian column norms
+    new_guesses, kwargs = f._warm_start_fit(guesses=guesses,
+                                            bounds=bounds,
+                                            least_squares_kwargs={})
+    assert np.allclose(new_guesses,[2,-1])
+    expected_scale = 1/np.linalg.norm(np.array([x,np.ones(10)]).T,axis=0)
+    assert np.allclose(kwargs["x_scale"],expected_scale)
+
+    # User x_scale is not overwritten; input kwargs are not modified
+    input_kwargs = {"x_scale":1.0}
+    new_guesses, kwargs = f._warm_start_fit(guesses=guesses,
+                                            bounds=bounds,
+                                            least_squares_kwargs=input_kwargs)
+    assert kwargs["x_scale"] == 1.0
+    assert input_kwargs == {"x_scale":1.0}
+
+    # Fit fails; warn and return original guesses and kwargs
+    with pytest.warns():
+        new_guesses, kwargs = f._warm_start_fit(guesses=guesses,
+                                                bounds=bounds,
+                                                least_squares_kwargs={"max_nfev":1})
+    assert np.array_equal(new_guesses,guesses)
+    assert kwargs == {"max_nfev":1}
+
+    # Fit throws error; warn and return original guesses and kwargs
+    with pytest.warns():
+        new_guesses, kwargs = f._warm_start_fit(guesses=guesses,
+                                                bounds=bounds,
+                                                least_squares_kwargs={"not_a_kwarg":1})
+    assert np.array_equal(new_guesses,guesses)
+
 def test_BootstrapFitter__update_fit_df():
     
     # Create a BootstrapFitter with a model loaded (and _fit_df implicitly 
@@ -195,6 +372,12 @@ def test_BootstrapFitter__update_fit_df():
     assert np.allclose(np.round(f._fit_df["low_95"],0),[-2,-2])
     assert np.allclose(np.round(f._fit_df["high_95"],0),[2,2])
 
+    # Extra intervals
+    f._extra_intervals = [68]
+    f._update_fit_df()
+    assert np.allclose(np.round(f._fit_df["low_68"],0),[-1,-1])
+    assert np.allclose(np.round(f._fit_df["high_68"],0),[1,1])
+
     # --------------------------------------------------------------------------
     # Send in np.nan and make sure it handles gracefully -- up to a point
 
@@ -322,13 +505,13 @@ def test_BootstrapFitter___repr__():
           y_std=[0.1,0.1,0.1])
 
     out = f.__repr__().split("\n")
-    assert len(out) == 18
+    assert len(out) == 20
 
     # hack, run _fit_has_been_run, _fit_failed branch
     f._success = False
 
     out = f.__repr__().split("\n")
-    assert len(out) == 13
+    assert len(out) == 15
 
     # Run not _fit_has_been_run
     f = BootstrapFitter(some_function=model_to_wrap)
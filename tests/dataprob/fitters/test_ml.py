@@ -5,6 +5,7 @@ from dataprob.model_wrapper.model_wrapper import ModelWrapper
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 def test_MLFitter___init__():
 
@@ -112,6 +113,33 @@ def test_MLFitter__fit():
     assert np.array_equal(f.param_df["fixed"],[False,True])
     f.fit()
 
+    # --------------------------------------------------------------------------
+    # Analytic jacobian. Should give same result as finite difference and 
+    # should be called by least_squares
+
+    jac_calls = []
+    def linear_jac(m,b,x): 
+        jac_calls.append(1)
+        return np.array([x,np.ones(len(x))]).T
+    
+    f = MLFitter(some_function=linear_fcn,
+                 fit_parameters=["m","b"],
+                 non_fit_kwargs={"x":x},
+                 jacobian_function=linear_jac)
+    f.data_df = data_df
+    f.fit()
+    assert len(jac_calls) > 0
+    assert np.allclose(f._fit_result["x"],expected_result)
+    assert np.allclose(f._fit_result["jac"],
+                       -np.array([x,np.ones(len(x))]).T/0.1)
+    
+    # With fixed parameter
+    f.param_df.loc["b","guess"] = -1
+    f.param_df.loc["b","fixed"] = True
+    f.fit()
+    assert np.allclose(f._fit_result["x"],[2])
+    assert f._fit_result["jac"].shape == (10,1)
+
 
 def test_MLFitter__update_fit_df():
     
@@ -200,6 +228,75 @@ def test_MLFitter__update_fit_df():
     assert np.array_equal(f.fit_df["lower_bound"],[-10,-np.inf])
     assert np.array_equal(f.fit_df["upper_bound"],[10,np.inf])
 
+def test_MLFitter__fit_jac_sparsity():
+
+    # Independent lines that share no parameters, so each observation depends
+    # on only two of the parameters
+    num_lines = 20
+    x = np.linspace(-5,5,10)
+    def many_lines(params,x): 
+        return (params[0::2,None]*x + params[1::2,None]).ravel()
+
+    param_names = []
+    for i in range(num_lines):
+        param_names.extend([f"m{i}",f"b{i}"])
+
+    true_params = np.random.normal(0,2,2*num_lines)
+    y_obs = many_lines(true_params,x) + np.random.normal(0,0.1,10*num_lines)
+
+    structure = np.zeros((10*num_lines,2*num_lines),dtype=int)
+    for i in range(num_lines):
+        structure[10*i:10*(i+1),2*i:2*(i+1)] = 1
+
+    f_dense = MLFitter(some_function=many_lines,
+                       fit_parameters=param_names,
+                       vector_first_arg=True,
+                       non_fit_kwargs={"x":x})
+    f_dense.fit(y_obs=y_obs,y_std=0.1)
+
+    f = MLFitter(some_function=many_lines,
+                 fit_parameters=param_names,
+                 vector_first_arg=True,
+                 non_fit_kwargs={"x":x},
+                 jac_sparsity=structure)
+    f.fit(y_obs=y_obs,y_std=0.1)
+    assert f.success
+
+    # Sparse Jacobian from the lsmr solver
+    assert sparse.issparse(f._fit_result.jac)
+
+    assert np.allclose(f.fit_df["estimate"],f_dense.fit_df["estimate"],atol=1e-4)
+    assert np.allclose(f.fit_df["std"],f_dense.fit_df["std"],rtol=1e-3)
+
+    # Users can turn it off
+    f.fit(y_obs=y_obs,y_std=0.1,jac_sparsity=None)
+    assert not sparse.issparse(f._fit_result.jac)
+
+def test_MLFitter__get_covariance():
+
+    def linear_fcn(m,b,x): return m*x + b
+    x = np.linspace(-5,5,10)
+    f = MLFitter(some_function=linear_fcn,
+                 non_fit_kwargs={"x":x})
+    f.fit(y_obs=linear_fcn(m=2,b=-1,x=x) + np.random.normal(0,0.1,10),
+          y_std=0.1)
+
+    J = f._fit_result.jac
+    expected = np.linalg.inv(2*np.dot(J.T,J))
+    assert np.allclose(f._get_covariance(),expected)
+
+    # Sparse Jacobian gives the same answer
+    f._fit_result.jac = sparse.csr_matrix(J)
+    assert np.allclose(f._get_covariance(),expected)
+
+    # Singular matrices raise LinAlgError
+    f._fit_result.jac = np.zeros(J.shape)
+    with pytest.raises(np.linalg.LinAlgError):
+        f._get_covariance()
+    f._fit_result.jac = sparse.csr_matrix(np.zeros(J.shape))
+    with pytest.raises(np.linalg.LinAlgError):
+        f._get_covariance()
+
 def test_MLFitter_fit_quality():
 
     def linear_fcn(m,b,x): return m*x + b
@@ -78,5 +78,40 @@ def test_setup():
     assert issubclass(type(f._model),VectorModelWrapper)
     assert np.array_equal(f.param_df["name"],["x","y","z"])
 
+    # test vectorized passing
+    f = setup(some_function=test_fcn)
+    assert f._model.vectorized is False
+
+    f = setup(some_function=test_fcn,
+              vectorized=True)
+    assert f._model.vectorized is True
+
+    # test jacobian_function passing
+    def test_jac(a,b=2): return np.array([[b,a]])
+    f = setup(some_function=test_fcn)
+    assert f._model.jacobian is None
+
+    f = setup(some_function=test_fcn,
+              jacobian_function=test_jac)
+    assert f._model.jacobian is test_jac
+
 
     
+
+    # test jac_sparsity passing
+    f = setup(some_function=test_fcn)
+    assert f._model.jac_sparsity is None
+
+    f = setup(some_function=test_fcn,
+              jac_sparsity=[[1,0]])
+    assert np.array_equal(f._model.jac_sparsity.toarray(),[[1,0]])
+
+    # test engine passing
+    f = setup(some_function=test_fcn)
+    assert f.engine == "numpy"
+
+    f = setup(some_function=test_fcn,engine="numba")
+    assert f.engine == "numba"
+
+    with pytest.raises(ValueError):
+        setup(some_function=test_fcn,engine="not_an_engine")
@@ -4,6 +4,7 @@ import pytest
 from dataprob.model_wrapper._function_processing import analyze_fcn_sig
 from dataprob.model_wrapper._function_processing import reconcile_fittable
 from dataprob.model_wrapper._function_processing import analyze_vector_input_fcn
+from dataprob.model_wrapper._function_processing import get_positional_args
 
 import numpy as np
 
@@ -126,6 +127,23 @@ def test_analyze_fcn_sig():
     assert can_be_fit["a"] == 1.0
     assert cannot_be_fit["b"] is False
 
+def test_get_positional_args():
+
+    def test_fcn(a,b=1,c="test"): pass
+    assert get_positional_args(test_fcn) == ["a","b","c"]
+
+    def test_fcn(a,b=1,*args,c=2,**kwargs): pass
+    assert get_positional_args(test_fcn) == ["a","b"]
+
+    def test_fcn(a,/,b,*,c=2): pass
+    assert get_positional_args(test_fcn) == ["a","b"]
+
+    def test_fcn(*,a=1,b=2): pass
+    assert get_positional_args(test_fcn) == []
+
+    def test_fcn(**kwargs): pass
+    assert get_positional_args(test_fcn) == []
+
 def test_reconcile_fittable():
 
     base_kwargs = {"fit_parameters":None,
@@ -0,0 +1,234 @@
+import pytest
+
+from dataprob.model_wrapper.global_model_wrapper import GlobalModelWrapper
+from dataprob.model_wrapper.model_wrapper import ModelWrapper
+from dataprob.model_wrapper.wrap_function import wrap_function
+from dataprob.fitters.ml import MLFitter
+from dataprob.fitters.bootstrap import BootstrapFitter
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+def _binding(K=1.0,offset=0.0,x=np.linspace(0,10,20)):
+    return x/(K + x) + offset
+
+def _binding_jac(K=1.0,offset=0.0,x=np.linspace(0,10,20)):
+    return np.stack([-x/(K + x)**2,np.ones(len(x))],axis=1)
+
+def _line(m=1.0,b=0.0,x=np.arange(5)):
+    return m*x + b
+
+def test_GlobalModelWrapper__init__():
+
+    mw = wrap_function(_binding)
+    g = GlobalModelWrapper(models=[mw,_binding,_line],
+                           shared_parameters=["offset"])
+
+    assert issubclass(type(g),ModelWrapper)
+    assert list(g.param_df["name"]) == ["K_0","offset","K_1","m_2","b_2"]
+    assert len(g.models) == 3
+
+    # Component models are copies, not the originals
+    assert g.models[0] is not mw
+
+    # Parameter features come from the component models (the first one for
+    # shared parameters)
+    mw.param_df.loc["K","guess"] = 5
+    mw.param_df.loc["K","lower_bound"] = 0
+    mw.param_df.loc["offset","guess"] = 2
+    mw.param_df.loc["offset","fixed"] = True
+    g = GlobalModelWrapper(models=[mw,_binding],
+                           shared_parameters=["offset"])
+    assert g.param_df.loc["K_0","guess"] == 5
+    assert g.param_df.loc["K_0","lower_bound"] == 0
+    assert g.param_df.loc["K_1","guess"] == 1
+    assert g.param_df.loc["offset","guess"] == 2
+    assert g.param_df.loc["offset","fixed"] == True
+    assert np.array_equal(g.unfixed_mask,[True,False,True])
+
+    # Component models have all parameters unfixed; fixing is done globally
+    for m in g.models:
+        assert np.sum(m.param_df["fixed"]) == 0
+
+    # No shared parameters
+    g = GlobalModelWrapper(models=[_binding,_binding])
+    assert list(g.param_df["name"]) == ["K_0","offset_0","K_1","offset_1"]
+
+    # Bad inputs
+    with pytest.raises(ValueError):
+        GlobalModelWrapper(models=_binding)
+    with pytest.raises(ValueError):
+        GlobalModelWrapper(models=[])
+    with pytest.raises(ValueError):
+        GlobalModelWrapper(models=["not_callable"])
+    with pytest.raises(ValueError):
+        GlobalModelWrapper(models=[_binding],shared_parameters="offset")
+    with pytest.raises(ValueError):
+        GlobalModelWrapper(models=[_binding],shared_parameters=["not_a_param"])
+
+    # Renamed local parameter collides with a shared parameter
+    def collide(K_1=1.0,K=1.0): return np.ones(3)*(K_1 + K)
+    with pytest.raises(ValueError):
+        GlobalModelWrapper(models=[_binding,collide],shared_parameters=["K_1"])
+
+def test_GlobalModelWrapper_model():
+
+    x0 = np.linspace(0,10,20)
+    x1 = np.linspace(0,5,7)
+    mw0 = wrap_function(_binding,non_fit_kwargs={"x":x0})
+    mw1 = wrap_function(_binding,non_fit_kwargs={"x":x1})
+    g = GlobalModelWrapper(models=[mw0,mw1],shared_parameters=["offset"])
+
+    # Parameters in order K_0, offset, K_1
+    out = g.model([2,0.5,3])
+    expected = np.concatenate([_binding(2,0.5,x0),_binding(3,0.5,x1)])
+    assert np.allclose(out,expected)
+
+    # Guesses
+    out = g.model()
+    expected = np.concatenate([_binding(1,0,x0),_binding(1,0,x1)])
+    assert np.allclose(out,expected)
+
+    # Fix a parameter; can pass either unfixed or all parameters
+    g.param_df.loc["offset","fixed"] = True
+    g.param_df.loc["offset","guess"] = 1
+    expected = np.concatenate([_binding(2,1,x0),_binding(3,1,x1)])
+    assert np.allclose(g.model([2,3]),expected)
+    assert np.allclose(g.model([2,100,3]),expected)
+    assert np.allclose(g.fast_model(np.array([2,3])),expected)
+
+    with pytest.raises(ValueError):
+        g.model([1,2,3,4])
+
+    # Batch
+    params = np.array([[2,3],[4,5]])
+    out = g.model_batch(params)
+    assert out.shape == (2,27)
+    assert np.allclose(out[0],g.model(params[0]))
+    assert np.allclose(out[1],g.model(params[1]))
+
+    # Model error is wrapped
+    def bad_model(a=1): raise ValueError
+    g = GlobalModelWrapper(models=[_binding,bad_model])
+    with pytest.raises(RuntimeError):
+        g.model()
+
+def test_GlobalModelWrapper_obs_slices():
+
+    x0 = np.linspace(0,10,20)
+    x1 = np.linspace(0,5,7)
+    mw0 = wrap_function(_binding,non_fit_kwargs={"x":x0})
+    mw1 = wrap_function(_binding,non_fit_kwargs={"x":x1})
+    g = GlobalModelWrapper(models=[mw0,mw1],shared_parameters=["offset"])
+
+    slices = g.obs_slices
+    assert slices == [slice(0,20),slice(20,27)]
+
+    out = g.model([2,0.5,3])
+    assert np.allclose(out[slices[1]],_binding(3,0.5,x1))
+
+def test_GlobalModelWrapper_jac_sparsity():
+
+    x0 = np.linspace(0,10,20)
+    x1 = np.linspace(0,5,7)
+    mw0 = wrap_function(_binding,non_fit_kwargs={"x":x0})
+    mw1 = wrap_function(_binding,non_fit_kwargs={"x":x1})
+    g = GlobalModelWrapper(models=[mw0,mw1],shared_parameters=["offset"])
+
+    # Regular model wrappers do not have a sparsity structure
+    assert mw0.jac_sparsity is None
+
+    # Parameters K_0, offset, K_1
+    structure = g.jac_sparsity
+    assert sparse.issparse(structure)
+    structure = structure.toarray()
+    assert structure.shape == (27,3)
+    assert np.all(structure[:20,:] == [1,1,0])
+    assert np.all(structure[20:,:] == [0,1,1])
+
+    # Fixed parameters are dropped
+    g.param_df.loc["K_0","fixed"] = True
+    structure = g.jac_sparsity.toarray()
+    assert structure.shape == (27,2)
+    assert np.all(structure[:20,:] == [1,0])
+    assert np.all(structure[20:,:] == [1,1])
+
+def test_GlobalModelWrapper_fast_jacobian():
+
+    x0 = np.linspace(0,10,20)
+    x1 = np.linspace(0,5,7)
+
+    # No jacobians on the components
+    g = GlobalModelWrapper(models=[_binding,_binding],
+                           shared_parameters=["offset"])
+    assert g.jacobian is None
+
+    mw0 = wrap_function(_binding,
+                        non_fit_kwargs={"x":x0},
+                        jacobian_function=_binding_jac)
+    mw1 = wrap_function(_binding,
+                        non_fit_kwargs={"x":x1},
+                        jacobian_function=_binding_jac)
+    g = GlobalModelWrapper(models=[mw0,mw1],shared_parameters=["offset"])
+    assert g.jacobian is not None
+
+    # Parameters K_0, offset, K_1
+    jac = g.fast_jacobian(np.array([2,0.5,3]))
+    assert sparse.issparse(jac)
+    jac = jac.toarray()
+    assert jac.shape == (27,3)
+    assert np.allclose(jac[:20,:2],_binding_jac(2,0.5,x0))
+    assert np.allclose(jac[20:,[2,1]],_binding_jac(3,0.5,x1))
+    assert np.all(jac[:20,2] == 0)
+    assert np.all(jac[20:,0] == 0)
+
+    # Fixed parameters are dropped
+    g.param_df.loc["offset","fixed"] = True
+    g.finalize_params()
+    jac = g.fast_jacobian(np.array([2,3])).toarray()
+    assert jac.shape == (27,2)
+    assert np.allclose(jac[:20,0],_binding_jac(2,0,x0)[:,0])
+    assert np.allclose(jac[20:,1],_binding_jac(3,0,x1)[:,0])
+
+def test_GlobalModelWrapper_fit():
+
+    np.random.seed(0)
+
+    x = np.linspace(0,10,20)
+    Ks = [0.5,1.0,2.0,4.0]
+    offset = 0.3
+
+    y_obs = np.concatenate([_binding(K,offset,x) for K in Ks])
+    y_obs = y_obs + np.random.normal(0,0.001,len(y_obs))
+
+    for jacobian_function in [None,_binding_jac]:
+
+        models = [wrap_function(_binding,
+                                non_fit_kwargs={"x":x},
+                                jacobian_function=jacobian_function)
+                  for _ in Ks]
+        g = GlobalModelWrapper(models=models,shared_parameters=["offset"])
+
+        f = MLFitter(some_function=g)
+        f.fit(y_obs=y_obs,y_std=0.001)
+        assert f.success
+        for i, K in enumerate(Ks):
+            assert np.isclose(f.fit_df.loc[f"K_{i}","estimate"],K,rtol=0.05)
+        assert np.isclose(f.fit_df.loc["offset","estimate"],offset,atol=0.01)
+        assert np.all(np.isfinite(f.fit_df["std"]))
+
+        f = BootstrapFitter(some_function=g)
+        f.fit(y_obs=y_obs,y_std=0.001,num_bootstrap=10)
+        assert f.success
+        assert np.isclose(f.fit_df.loc["offset","estimate"],offset,atol=0.01)
+
+def test_GlobalModelWrapper___repr__():
+
+    g = GlobalModelWrapper(models=[_binding,_line],
+                           shared_parameters=["offset"])
+    out = repr(g)
+    assert "GlobalModelWrapper" in out
+    assert "_binding" in out
+    assert "_line" in out
+    assert "K_0" in out
@@ -4,6 +4,7 @@ from dataprob.model_wrapper.model_wrapper import ModelWrapper
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 
 def test_ModelWrapper___init__():
 
@@ -396,6 +397,67 @@ def test_ModelWrapper_finalize_params():
     # remove offending parameter
     mw.non_fit_kwargs.pop("f")
     mw.finalize_params()
+
+    # Changing the value of a non_fit_kwarg should propagate to _mw_kwargs
+    mw.non_fit_kwargs["d"] = "new"
+    mw.finalize_params()
+    assert mw._mw_kwargs["d"] == "new"
+
+def test_ModelWrapper__params_unchanged():
+
+    def model_to_test_wrap(a=1,b=2,c=3,d="test",e=3): return a*b*c
+    mw = ModelWrapper(model_to_test_wrap)
+    assert mw._params_unchanged() is True
+
+    # Nothing changed -- validation should be skipped
+    mw._mw_kwargs["a"] = 5
+    mw.finalize_params()
+    assert mw._mw_kwargs["a"] == 5
+
+    # Edit param_df in place
+    mw.param_df.loc["b","guess"] = 10
+    assert mw._params_unchanged() is False
+    mw.finalize_params()
+    assert mw._params_unchanged() is True
+    assert mw._mw_kwargs["a"] == 1
+    assert mw._mw_kwargs["b"] == 10
+
+    # Set param_df with the setter
+    new_df = mw.param_df.copy()
+    new_df.loc["c","fixed"] = True
+    mw.param_df = new_df
+    assert mw._params_unchanged() is False
+    mw.finalize_params()
+    assert mw._params_unchanged() is True
+    assert np.array_equal(mw._unfixed_param_names,["a","b"])
+
+    # Replace a value in non_fit_kwargs
+    mw.non_fit_kwargs["e"] = 4
+    assert mw._params_unchanged() is False
+    mw.finalize_params()
+    assert mw._params_unchanged() is True
+    assert mw._mw_kwargs["e"] == 4
+
+    # Add and remove keys in non_fit_kwargs
+    mw.non_fit_kwargs["f"] = 4
+    assert mw._params_unchanged() is False
+    with pytest.raises(ValueError):
+        mw.finalize_params()
+    mw.non_fit_kwargs.pop("f")
+    mw.non_fit_kwargs.pop("e")
+    assert mw._params_unchanged() is False
+    with pytest.raises(ValueError):
+        mw.finalize_params()
+
+    # Failed validation should not be recorded
+    mw = ModelWrapper(model_to_test_wrap)
+    mw.param_df.loc["a","guess"] = np.nan
+    mw.param_df.loc["a","upper_bound"] = -1
+    with pytest.raises(ValueError):
+        mw.finalize_params()
+    assert mw._params_unchanged() is False
+    with pytest.raises(ValueError):
+        mw.finalize_params()
     
 
 def test_ModelWrapper_update_params(spreadsheets):
@@ -527,6 +589,189 @@ def test_ModelWrapper_fast_model():
     # but now fast_model is because we finalized parameters
     assert mw.fast_model([2,3]) == 10*2*3
 
+    # float64 arrays come back without a copy; other outputs are converted
+    # to arrays
+    out = np.arange(5,dtype=float)
+    def model_to_test_wrap(a=1,x=None): return x
+    mw = ModelWrapper(model_to_test_wrap,non_fit_kwargs={"x":out})
+    assert mw.fast_model(np.array([1.0])) is out
+
+    mw.non_fit_kwargs["x"] = [1,2,3]
+    mw.finalize_params()
+    result = mw.fast_model(np.array([1.0]))
+    assert issubclass(type(result),np.ndarray)
+    assert np.array_equal(result,[1,2,3])
+
+    # model() copies the output rather than handing out the model's array
+    mw.non_fit_kwargs["x"] = out
+    mw.finalize_params()
+    result = mw.model(np.array([1.0]))
+    assert result is not out
+    assert np.array_equal(result,out)
+
+    # Parameters come in as numpy scalars so the model does numpy math: 
+    # divide by zero gives inf and a negative square root gives nan rather
+    # than ZeroDivisionError and a complex number
+    types_seen = []
+    def model_to_test_wrap(a=1,b=1): 
+        types_seen.append(type(a))
+        return np.array([a/b])
+    mw = ModelWrapper(model_to_test_wrap)
+    with np.errstate(divide="ignore"):
+        result = mw.fast_model(np.array([1.0,0.0]))
+    assert np.isinf(result[0])
+    assert types_seen[-1] is np.float64
+
+    def model_to_test_wrap(a=1,x=None): return np.array([a**0.5])
+    mw = ModelWrapper(model_to_test_wrap)
+    with np.errstate(invalid="ignore"):
+        result = mw.fast_model(np.array([-4.0]))
+    assert result.dtype == np.float64
+    assert np.isnan(result[0])
+
+
+def test_ModelWrapper__build_call_plan():
+
+    def model_to_test_wrap(a=1,b=2,c=3,x=None): return a + 10*b + 100*c + 0*x
+    x = np.zeros(4)
+
+    # Parameters in consecutive slots are filled with a slice
+    mw = ModelWrapper(model_to_test_wrap,non_fit_kwargs={"x":x})
+    assert mw._call_args[:3] == [1,2,3]
+    assert mw._call_args[3] is x
+    assert len(mw._call_kwargs) == 0
+    assert mw._call_slice == slice(0,3)
+    assert mw._call_getter is None
+    assert np.allclose(mw.fast_model(np.array([4,5,6])),654)
+
+    # Fixing the first parameter keeps consecutive slots
+    mw.param_df.loc["a","fixed"] = True
+    mw.param_df.loc["a","guess"] = 7
+    mw.finalize_params()
+    assert mw._call_slice == slice(1,3)
+    assert mw._call_getter is None
+    assert np.allclose(mw.fast_model(np.array([5,6])),657)
+
+    # Fixing a middle parameter requires a gather
+    mw = ModelWrapper(model_to_test_wrap,non_fit_kwargs={"x":x})
+    mw.param_df.loc["b","fixed"] = True
+    mw.param_df.loc["b","guess"] = 8
+    mw.finalize_params()
+    assert mw._call_slice is None
+    assert mw._call_getter is not None
+    assert np.allclose(mw.fast_model(np.array([4,6])),684)
+
+    # Parameters out of signature order
+    mw = ModelWrapper(model_to_test_wrap,
+                      fit_parameters=["c","a"],
+                      non_fit_kwargs={"x":x})
+    assert np.allclose(mw.fast_model(np.array([6,4])),624)
+    assert np.allclose(mw.model([6,4]),624)
+
+    # Keyword-only and **kwargs parameters are passed by keyword
+    def model_to_test_wrap(a=1,*,b=2,**kwargs): return a + 10*b + 100*kwargs["c"]
+    mw = ModelWrapper(model_to_test_wrap,fit_parameters=["c","a","b"])
+    assert mw._call_args == [1]
+    assert set(mw._call_kwargs) == {"b","c"}
+    assert np.isclose(mw.fast_model(np.array([6,4,5])),654)
+
+def test_ModelWrapper_model_batch():
+
+    def model_to_test_wrap(a=1,b=2,c=3,x=None): return a*b*c*x
+    params = np.array([[1,2,3],
+                       [4,5,6],
+                       [7,8,9]],dtype=float)
+    expected = np.array([np.prod(p)*np.arange(5) for p in params])
+
+    for vectorized in [False,True]:
+
+        mw = ModelWrapper(model_to_test_wrap,
+                          non_fit_kwargs={"x":np.arange(5)},
+                          vectorized=vectorized)
+        
+        out = mw.model_batch(params)
+        assert out.shape == (3,5)
+        assert np.allclose(out,expected)
+
+        # Takes lists
+        out = mw.model_batch([[1,2,3]])
+        assert np.allclose(out,[6*np.arange(5)])
+
+        # Bad shapes
+        with pytest.raises(ValueError):
+            mw.model_batch(params[0])
+        with pytest.raises(ValueError):
+            mw.model_batch(params[:,:1])
+        with pytest.raises(ValueError):
+            mw.model_batch([["a","b","c"]])
+
+        # Make sure it calls finalize; fixed parameters come from guesses
+        # even if sent in
+        mw.param_df.loc["a","fixed"] = True
+        mw.param_df.loc["a","guess"] = 10
+        out = mw.model_batch(params)
+        assert np.allclose(out,10*expected/params[:,:1])
+        out = mw.model_batch(params[:,1:])
+        assert np.allclose(out,10*expected/params[:,:1])
+
+    # Model that fails
+    def model_to_test_wrap(a=1,b=2): raise ValueError
+    mw = ModelWrapper(model_to_test_wrap)
+    with pytest.raises(RuntimeError):
+        mw.model_batch(np.ones((2,2)))
+
+def test_ModelWrapper_fast_model_batch():
+
+    def model_to_test_wrap(a=1,b=2,c=3,x=None): return a*b*c*x
+    params = np.array([[1,2,3],
+                       [4,5,6],
+                       [7,8,9],
+                       [1,1,1]],dtype=float)
+    expected = np.array([np.prod(p)*np.arange(5) for p in params])
+
+    # Not vectorized -- loop over rows
+    mw = ModelWrapper(model_to_test_wrap,
+                      non_fit_kwargs={"x":np.arange(5)})
+    assert mw.vectorized is False
+    out = mw.fast_model_batch(params)
+    assert out.shape == (4,5)
+    assert np.allclose(out,expected)
+
+    # A model that reuses its output array should still give one row per
+    # parameter set
+    buffer = np.zeros(5)
+    def model_to_test_wrap(a=1,b=2,c=3,x=None): 
+        buffer[:] = a*b*c*x
+        return buffer
+    mw = ModelWrapper(model_to_test_wrap,
+                      non_fit_kwargs={"x":np.arange(5)})
+    out = mw.fast_model_batch(params)
+    assert np.allclose(out,expected)
+
+    # Vectorized -- one call. Each parameter should come in as a column.
+    shapes = []
+    def model_to_test_wrap(a=1,b=2,c=3,x=None): 
+        shapes.append((np.shape(a),np.shape(b),np.shape(c)))
+        return a*b*c*x
+    
+    mw = ModelWrapper(model_to_test_wrap,
+                      non_fit_kwargs={"x":np.arange(5)},
+                      vectorized=True)
+    assert mw.vectorized is True
+    out = mw.fast_model_batch(params)
+    assert out.shape == (4,5)
+    assert np.allclose(out,expected)
+    assert shapes == [((4,1),(4,1),(4,1))]
+
+    # _mw_kwargs should not be altered by the batch call
+    assert mw.fast_model(np.array([1,2,3])).shape == (5,)
+
+    # fix "a" 
+    mw.param_df.loc["a","fixed"] = True
+    mw.param_df.loc["a","guess"] = 10
+    mw.finalize_params()
+    out = mw.fast_model_batch(params[:,1:])
+    assert np.allclose(out,10*expected/params[:,:1])
 
 def test_ModelWrapper_param_df():
 
@@ -574,6 +819,139 @@ def test_ModelWrapper_unfixed_mask():
     assert np.array_equal(mw.unfixed_mask,[False,True,True])
 
 
+def test_ModelWrapper_fast_jacobian():
+
+    def model_to_test_wrap(a=1,b=2,c=3,x=None): return a*b*c*x
+    def jac_to_test_wrap(a=1,b=2,c=3,x=None): 
+        return np.array([b*c*x,a*c*x,a*b*x]).T
+    
+    mw = ModelWrapper(model_to_test_wrap,
+                      non_fit_kwargs={"x":np.arange(5)},
+                      jacobian=jac_to_test_wrap)
+    
+    out = mw.fast_jacobian(np.array([1,2,3]))
+    assert out.shape == (5,3)
+    assert np.allclose(out,jac_to_test_wrap(1,2,3,np.arange(5)))
+
+    # fix "b" -- should drop that column and use the guess
+    mw.param_df.loc["b","fixed"] = True
+    mw.param_df.loc["b","guess"] = 10
+    mw.finalize_params()
+
+    out = mw.fast_jacobian(np.array([1,3]))
+    assert out.shape == (5,2)
+    expected = jac_to_test_wrap(1,10,3,np.arange(5))[:,[0,2]]
+    assert np.allclose(out,expected)
+
+    # Arguments come from the call plan; _mw_kwargs (used to build the plan)
+    # is not changed
+    mw_kwargs = dict(mw._mw_kwargs)
+    mw.fast_jacobian(np.array([7,8]))
+    assert mw._mw_kwargs.keys() == mw_kwargs.keys()
+    for k in mw_kwargs:
+        assert mw._mw_kwargs[k] is mw_kwargs[k]
+    assert mw._jacobian_by_position is True
+
+    # Parameters are passed as numpy scalars, like fast_model
+    seen = []
+    def jac_types(a=1,b=2,c=3,x=None):
+        seen.extend([type(a),type(c)])
+        return jac_to_test_wrap(a,b,c,x)
+    mw.jacobian = jac_types
+    mw.fast_jacobian(np.array([1,3]))
+    assert seen == [np.float64,np.float64]
+
+    # Jacobian with arguments in a different order is called by keyword
+    def jac_reordered(x=None,c=3,b=2,a=1): 
+        return jac_to_test_wrap(a,b,c,x)
+    mw.jacobian = jac_reordered
+    assert mw._jacobian_by_position is False
+    out = mw.fast_jacobian(np.array([1,3]))
+    assert np.allclose(out,expected)
+
+    # Model with a keyword-only argument
+    def kw_model(a,b,*,x): return a*b*x
+    def kw_jac(a,b,*,x): return np.array([b*x,a*x]).T
+    mw = ModelWrapper(kw_model,
+                      non_fit_kwargs={"x":np.arange(5)},
+                      jacobian=kw_jac)
+    out = mw.fast_jacobian(np.array([2,3]))
+    assert np.allclose(out,kw_jac(2,3,x=np.arange(5)))
+
+def test_ModelWrapper_jacobian():
+
+    def model_to_test_wrap(a=1,b=2): return a*b
+    def jac_to_test_wrap(a=1,b=2): return np.array([[b,a]])
+
+    mw = ModelWrapper(model_to_test_wrap)
+    assert mw.jacobian is None
+
+    mw = ModelWrapper(model_to_test_wrap,jacobian=jac_to_test_wrap)
+    assert mw.jacobian is jac_to_test_wrap
+
+    mw.jacobian = None
+    assert mw.jacobian is None
+
+    mw.jacobian = jac_to_test_wrap
+    assert mw.jacobian is jac_to_test_wrap
+
+    with pytest.raises(ValueError):
+        mw.jacobian = "not_callable"
+
+    with pytest.raises(ValueError):
+        ModelWrapper(model_to_test_wrap,jacobian="not_callable")
+
+def test_ModelWrapper_jac_sparsity():
+
+    def model_to_test_wrap(a=1,b=2,c=3): return np.array([a,b + c])
+
+    mw = ModelWrapper(model_to_test_wrap)
+    assert mw.jac_sparsity is None
+
+    structure = np.array([[1,0,0],[0,1,1]])
+    mw = ModelWrapper(model_to_test_wrap,jac_sparsity=structure)
+    assert sparse.issparse(mw.jac_sparsity)
+    assert np.array_equal(mw.jac_sparsity.toarray(),structure)
+
+    # Fixed parameters are dropped
+    mw.param_df.loc["b","fixed"] = True
+    assert np.array_equal(mw.jac_sparsity.toarray(),[[1,0],[0,1]])
+
+    # Sparse input; values are converted to 0/1
+    mw.jac_sparsity = sparse.csr_matrix(np.array([[0.5,0,0],[0,0,2]]))
+    assert np.array_equal(mw.jac_sparsity.toarray(),[[1,0],[0,1]])
+
+    mw.jac_sparsity = None
+    assert mw.jac_sparsity is None
+
+    with pytest.raises(ValueError):
+        mw.jac_sparsity = np.ones(3)
+    with pytest.raises(ValueError):
+        mw.jac_sparsity = np.ones((2,2))
+    with pytest.raises(ValueError):
+        mw.jac_sparsity = "not_an_array"
+    with pytest.raises(ValueError):
+        ModelWrapper(model_to_test_wrap,jac_sparsity=np.ones((2,4)))
+
+def test_ModelWrapper_vectorized():
+
+    def model_to_test_wrap(a=1,b=2,c=3,d="test",e=3): return a*b*c
+    mw = ModelWrapper(model_to_test_wrap)
+    assert mw.vectorized is False
+
+    mw.vectorized = True
+    assert mw.vectorized is True
+
+    mw = ModelWrapper(model_to_test_wrap,vectorized=True)
+    assert mw.vectorized is True
+
+    with pytest.raises(ValueError):
+        mw.vectorized = "not a bool"
+
+    with pytest.raises(ValueError):
+        ModelWrapper(model_to_test_wrap,vectorized="not a bool")
+
+
 def test_ModelWrapper___repr__():
 
     def model_to_test_wrap(a=1,b=1,c="test",d=3): return a*b
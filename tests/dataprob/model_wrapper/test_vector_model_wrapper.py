@@ -201,6 +201,18 @@ def test_VectorModelWrapper__finalize_params():
     assert mw._non_fit_kwargs["b"] is None
     assert mw._non_fit_kwargs["c"] == 3
 
+    # Nothing changed -- validation should be skipped
+    assert mw._params_unchanged() is True
+    mw._all_param_vector[1] = 100
+    mw.finalize_params()
+    assert mw._all_param_vector[1] == 100
+
+    # Change value; should be picked up
+    mw.param_df.loc["y","guess"] = 5
+    assert mw._params_unchanged() is False
+    mw.finalize_params()
+    assert np.array_equal(mw._all_param_vector,[10,5])
+
     # send in bad edit -- finalize should catch it
     mw.param_df.loc["a","fixed"] = True
     np.array_equal(mw.param_df.index,["x","y","a"])
@@ -301,3 +313,93 @@ def test_VectorModelWrapper_fast_model():
 
     # and now fast_model should be too if finalized
     assert mw.fast_model(np.array([2,3])) == 10 + 2 + 3
+
+def test_VectorModelWrapper_model_batch():
+
+    def test_fcn(x,z): return (x[0] + x[1]*x[2])*z
+    params = np.array([[1,2,3],
+                       [4,5,6],
+                       [7,8,9]],dtype=float)
+    expected = np.array([(p[0] + p[1]*p[2])*np.arange(5) for p in params])
+
+    for vectorized in [False,True]:
+
+        mw = VectorModelWrapper(model_to_fit=test_fcn,
+                                fit_parameters={"a":20,"b":30,"c":50},
+                                non_fit_kwargs={"z":np.arange(5)},
+                                vectorized=vectorized)
+        out = mw.model_batch(params)
+        assert out.shape == (3,5)
+        assert np.allclose(out,expected)
+
+        with pytest.raises(ValueError):
+            mw.model_batch(params[0])
+        with pytest.raises(ValueError):
+            mw.model_batch(params[:,:1])
+
+        # Make sure it calls finalize
+        mw.param_df.loc["a","fixed"] = True
+        mw.param_df.loc["a","guess"] = 10
+        fixed_expected = np.array([(10 + p[1]*p[2])*np.arange(5) for p in params])
+        assert np.allclose(mw.model_batch(params),fixed_expected)
+        assert np.allclose(mw.model_batch(params[:,1:]),fixed_expected)
+
+def test_VectorModelWrapper_fast_model_batch():
+
+    def test_fcn(x,z): return (x[0] + x[1]*x[2])*z
+    params = np.array([[1,2,3],
+                       [4,5,6],
+                       [7,8,9]],dtype=float)
+    expected = np.array([(p[0] + p[1]*p[2])*np.arange(5) for p in params])
+
+    # Not vectorized -- loop over rows
+    mw = VectorModelWrapper(model_to_fit=test_fcn,
+                            fit_parameters={"a":20,"b":30,"c":50},
+                            non_fit_kwargs={"z":np.arange(5)}) 
+    out = mw.fast_model_batch(params)
+    assert out.shape == (3,5)
+    assert np.allclose(out,expected)
+
+    # Vectorized -- one call with (num_param,num_samples,1) array
+    shapes = []
+    def test_fcn(x,z): 
+        shapes.append(x.shape)
+        return (x[0] + x[1]*x[2])*z
+    mw = VectorModelWrapper(model_to_fit=test_fcn,
+                            fit_parameters={"a":20,"b":30,"c":50},
+                            non_fit_kwargs={"z":np.arange(5)},
+                            vectorized=True) 
+    out = mw.fast_model_batch(params)
+    assert out.shape == (3,5)
+    assert np.allclose(out,expected)
+    assert shapes == [(3,3,1)]
+
+    # fix "a"; make sure fixed value is used for all samples
+    mw.param_df.loc["a","fixed"] = True
+    mw.param_df.loc["a","guess"] = 10
+    mw.finalize_params()
+    out = mw.fast_model_batch(params[:,1:])
+    expected = np.array([(10 + p[1]*p[2])*np.arange(5) for p in params])
+    assert np.allclose(out,expected)
+
+def test_VectorModelWrapper_fast_jacobian():
+
+    def test_fcn(x,z): return (x[0] + x[1]*x[2])*z
+    def test_jac(x,z): return np.array([z,x[2]*z,x[1]*z]).T
+
+    mw = VectorModelWrapper(model_to_fit=test_fcn,
+                            fit_parameters={"a":20,"b":30,"c":50},
+                            non_fit_kwargs={"z":np.arange(5)},
+                            jacobian=test_jac)
+    
+    out = mw.fast_jacobian(np.array([1,2,3]))
+    assert out.shape == (5,3)
+    assert np.allclose(out,test_jac(np.array([1,2,3]),np.arange(5)))
+
+    # fix "a"
+    mw.param_df.loc["a","fixed"] = True
+    mw.param_df.loc["a","guess"] = 10
+    mw.finalize_params()
+    out = mw.fast_jacobian(np.array([2,3]))
+    assert out.shape == (5,2)
+    assert np.allclose(out,test_jac(np.array([10,2,3]),np.arange(5))[:,1:])
@@ -307,4 +307,78 @@ def test_wrap_function(tmpdir):
                            non_fit_kwargs=None,
                            vector_first_arg="stupid")
 
-    os.chdir(cwd)
\ No newline at end of file
+    # --------------------------------------------------------------
+    # vectorized passing
+
+    def model_to_test_wrap(a,b=2,c=3,d="test",e=3): return a*b*c
+    mw = wrap_function(some_function=model_to_test_wrap)
+    assert mw.vectorized is False
+
+    mw = wrap_function(some_function=model_to_test_wrap,
+                       vectorized=True)
+    assert mw.vectorized is True
+
+    def model_to_test_wrap(some_vector,q=3): return np.sum(some_vector)
+    mw = wrap_function(some_function=model_to_test_wrap,
+                       fit_parameters=["a"],
+                       vector_first_arg=True,
+                       vectorized=True)
+    assert issubclass(type(mw),VectorModelWrapper)
+    assert mw.vectorized is True
+
+    with pytest.raises(ValueError):
+        mw = wrap_function(some_function=model_to_test_wrap,
+                           fit_parameters=["a"],
+                           vector_first_arg=True,
+                           vectorized="stupid")
+
+    # --------------------------------------------------------------
+    # jacobian_function passing
+
+    def model_to_test_wrap(a,b=2,c=3,d="test",e=3): return a*b*c
+    def jac_to_test_wrap(a,b=2,c=3,d="test",e=3): return np.array([[b*c,a*c,a*b]])
+    mw = wrap_function(some_function=model_to_test_wrap)
+    assert mw.jacobian is None
+
+    mw = wrap_function(some_function=model_to_test_wrap,
+                       jacobian_function=jac_to_test_wrap)
+    assert mw.jacobian is jac_to_test_wrap
+
+    with pytest.raises(ValueError):
+        mw = wrap_function(some_function=model_to_test_wrap,
+                           jacobian_function="not_callable")
+
+    os.chdir(cwd)
+
+def test_wrap_function_reused_output_buffer():
+
+    # Models that write into and return the same output array. Each row of
+    # the batch output should still correspond to its own parameter set. 
+    z = np.arange(5,dtype=float)
+    params = np.array([[1,2],[3,4],[5,6]],dtype=float)
+    expected = np.array([(p[0] + p[1])*z for p in params])
+
+    buffer = np.zeros(5)
+    def scalar_model(a=1,b=2,z=None):
+        buffer[:] = (a + b)*z
+        return buffer
+
+    vector_buffer = np.zeros(5)
+    def vector_model(theta,z):
+        vector_buffer[:] = (theta[0] + theta[1])*z
+        return vector_buffer
+
+    scalar_mw = wrap_function(scalar_model,non_fit_kwargs={"z":z})
+    vector_mw = wrap_function(vector_model,
+                              fit_parameters=["a","b"],
+                              non_fit_kwargs={"z":z},
+                              vector_first_arg=True)
+    assert type(scalar_mw) is ModelWrapper
+    assert type(vector_mw) is VectorModelWrapper
+
+    for mw in [scalar_mw,vector_mw]:
+        out = mw.fast_model_batch(params)
+        assert np.allclose(out,expected)
+        out = mw.model_batch(params)
+        assert np.allclose(out,expected)
+
@@ -1,6 +1,72 @@
+import pytest
 
 import dataprob
 
+import subprocess
+import sys
+import time
+
 def test_generic_stuff():
 
     print(dataprob.__version__)
+
+def _run_import(code):
+    """
+    Run python code in a fresh interpreter and return its stdout.
+    """
+
+    result = subprocess.run([sys.executable,"-c",code],
+                            capture_output=True,
+                            text=True,
+                            check=True)
+    return result.stdout
+
+def test_lazy_imports():
+
+    # Heavy backends should not be loaded by import dataprob
+    code = "import sys, dataprob\n"
+    code += "heavy = ['emcee','corner','matplotlib','tqdm','scipy.stats']\n"
+    code += "print(','.join([m for m in heavy if m in sys.modules]))\n"
+    assert _run_import(code).strip() == ""
+
+    # corner loads on first use of a plot function. emcee is not loaded when
+    # a sampler is created, only when it is run. 
+    code = "import sys, dataprob\n"
+    code += "dataprob.plot_corner\n"
+    code += "dataprob.setup(lambda a=1: a*1.0,method='mcmc')\n"
+    code += "print('corner' in sys.modules, 'emcee' in sys.modules)\n"
+    assert _run_import(code).strip() == "True False"
+
+    # Lazy attributes behave like normal attributes
+    from dataprob.plot.plot_corner import plot_corner
+    from dataprob.plot.plot_summary import plot_summary
+    assert dataprob.plot_corner is plot_corner
+    assert dataprob.plot_summary is plot_summary
+    assert "plot_corner" in dir(dataprob)
+    with pytest.raises(AttributeError):
+        dataprob.not_an_attribute
+
+@pytest.mark.slow
+def test_import_time_benchmark():
+    """
+    Compare the time to import dataprob with the time to import dataprob and
+    all of its heavy backends. 
+    """
+
+    def _time_import(code,num_repeats=5):
+        times = []
+        for _ in range(num_repeats):
+            start = time.perf_counter()
+            _run_import(code)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    time_lazy = _time_import("import dataprob")
+    time_eager = _time_import("import dataprob; import emcee; import corner; "
+                              "import matplotlib.pyplot; import tqdm.auto; "
+                              "import scipy.stats")
+
+    print(f"import dataprob:             {time_lazy:.3f} s")
+    print(f"import dataprob + backends:  {time_eager:.3f} s")
+
+    assert time_lazy < time_eager
@@ -0,0 +1,109 @@
+import pytest
+
+from dataprob.util.npy_file import create_npy
+from dataprob.util.npy_file import append_npy
+from dataprob.util.npy_file import read_npy_shape
+
+import numpy as np
+
+import os
+
+def test_create_npy(tmpdir):
+
+    filename = os.path.join(tmpdir,"test.npy")
+
+    create_npy(filename,row_shape=(3,4))
+    out = np.load(filename)
+    assert out.shape == (0,3,4)
+    assert out.dtype == np.float64
+
+    create_npy(filename,row_shape=(2,),dtype=np.float32)
+    out = np.load(filename)
+    assert out.shape == (0,2)
+    assert out.dtype == np.float32
+
+def test_append_npy(tmpdir):
+
+    filename = os.path.join(tmpdir,"test.npy")
+    create_npy(filename,row_shape=(3,4))
+
+    a = np.random.normal(size=(5,3,4))
+    assert append_npy(filename,a) == 5
+    assert np.array_equal(np.load(filename),a)
+
+    b = np.random.normal(size=(1,3,4))
+    assert append_npy(filename,b) == 6
+    assert np.array_equal(np.load(filename),np.concatenate((a,b)))
+
+    # memory mapped read
+    out = np.load(filename,mmap_mode="r")
+    assert out.shape == (6,3,4)
+    assert np.array_equal(out[-1],b[0])
+    del out
+
+    # lots of appends -- header grows past single digit row count
+    for i in range(200):
+        append_npy(filename,b)
+    assert np.load(filename).shape == (206,3,4)
+
+    # ints are coerced to file dtype
+    append_npy(filename,np.ones((1,3,4),dtype=int))
+    out = np.load(filename)
+    assert out.dtype == np.float64
+    assert np.array_equal(out[-1],np.ones((3,4)))
+
+    # bad row shape
+    with pytest.raises(ValueError):
+        append_npy(filename,np.ones((1,3,5)))
+
+    # Works on a file written by np.save
+    np.save(filename,a)
+    append_npy(filename,b)
+    assert np.array_equal(np.load(filename),np.concatenate((a,b)))
+
+    # Partial data left after last complete row is overwritten
+    create_npy(filename,row_shape=(2,))
+    append_npy(filename,np.array([[1.0,2.0]]))
+    with open(filename,"ab") as fp:
+        fp.write(b"\x00\x01\x02")
+    append_npy(filename,np.array([[3.0,4.0]]))
+    assert np.array_equal(np.load(filename),[[1,2],[3,4]])
+
+    # Header written without room to grow (e.g. by an old numpy). Cannot be
+    # updated in place, so the file should be left untouched.
+    text = "{'descr': '<f8', 'fortran_order': False, 'shape': (9,), }"
+    text = text + " "*(64 - 10 - len(text) - 1) + "\n"
+    with open(filename,"wb") as fp:
+        fp.write(b"\x93NUMPY\x01\x00")
+        fp.write(np.uint16(len(text)).tobytes())
+        fp.write(text.encode("latin1"))
+        fp.write(np.arange(9,dtype=np.float64).tobytes())
+    with open(filename,"rb") as fp:
+        before = fp.read()
+    assert np.array_equal(np.load(filename),np.arange(9))
+
+    with pytest.raises(RuntimeError):
+        append_npy(filename,np.array([9.0]))
+    with open(filename,"rb") as fp:
+        assert fp.read() == before
+
+def test_read_npy_shape(tmpdir):
+
+    filename = os.path.join(tmpdir,"test.npy")
+
+    with pytest.raises(FileNotFoundError):
+        read_npy_shape(filename)
+
+    create_npy(filename,row_shape=(3,4))
+    shape, dtype = read_npy_shape(filename)
+    assert shape == (0,3,4)
+    assert dtype == np.float64
+
+    append_npy(filename,np.ones((7,3,4)))
+    shape, dtype = read_npy_shape(filename)
+    assert shape == (7,3,4)
+
+    np.save(filename,np.ones((2,2),dtype=int))
+    shape, dtype = read_npy_shape(filename)
+    assert shape == (2,2)
+    assert dtype == np.dtype(int)
@@ -0,0 +1,155 @@
+import pytest
+
+from dataprob.util.sample_file import write_sample_file
+from dataprob.util.sample_file import append_sample_file
+from dataprob.util.sample_file import read_sample_file
+
+import numpy as np
+
+import os
+
+def test_write_sample_file(tmpdir):
+
+    samples = np.random.normal(size=(10,2))
+
+    filename = os.path.join(tmpdir,"samples.npy")
+    write_sample_file(filename,samples,param_names=["m","b"])
+    out = np.load(filename,mmap_mode="r")
+    assert out.dtype.names == ("m","b")
+    assert out.dtype["m"] == np.float64
+    assert np.array_equal(out["m"],samples[:,0])
+    assert np.array_equal(out["b"],samples[:,1])
+
+    # exists
+    with pytest.raises(FileExistsError):
+        write_sample_file(filename,samples,param_names=["m","b"])
+
+    # lnprob
+    filename = os.path.join(tmpdir,"lnprob.npy")
+    write_sample_file(filename,samples,param_names=["m","b"],
+                      lnprob=np.arange(10))
+    out = np.load(filename)
+    assert out.dtype.names == ("m","b","lnprob")
+    assert np.array_equal(out["lnprob"],np.arange(10))
+
+    # float32 kept
+    filename = os.path.join(tmpdir,"float32.npy")
+    write_sample_file(filename,samples.astype(np.float32),param_names=["m","b"])
+    out = np.load(filename)
+    assert out.dtype["m"] == np.float32
+
+    # bad inputs
+    filename = os.path.join(tmpdir,"bad.npy")
+    with pytest.raises(ValueError):
+        write_sample_file(filename,samples,param_names=["m","m"])
+    with pytest.raises(ValueError):
+        write_sample_file(filename,samples,param_names=["m","lnprob"])
+    with pytest.raises(ValueError):
+        write_sample_file(filename,samples,param_names=["m"])
+    with pytest.raises(ValueError):
+        write_sample_file(filename,[["a","b"]],param_names=["m","b"])
+
+def test_append_sample_file(tmpdir):
+
+    a = np.random.normal(size=(10,2))
+    b = np.random.normal(size=(5,2))
+
+    filename = os.path.join(tmpdir,"samples.npy")
+    write_sample_file(filename,a,param_names=["m","b"])
+    assert append_sample_file(filename,b) == 15
+    samples, _, lnprob = read_sample_file(filename)
+    assert np.array_equal(samples,np.concatenate((a,b)))
+    assert lnprob is None
+
+    # wrong width
+    with pytest.raises(ValueError):
+        append_sample_file(filename,np.ones((2,3)))
+
+    # no lnprob field
+    with pytest.raises(ValueError):
+        append_sample_file(filename,b,lnprob=np.ones(5))
+
+    # lnprob field; missing lnprob is nan
+    filename = os.path.join(tmpdir,"lnprob.npy")
+    write_sample_file(filename,a,param_names=["m","b"],lnprob=np.zeros(10))
+    append_sample_file(filename,b)
+    append_sample_file(filename,b,lnprob=np.ones(5))
+    _, _, lnprob = read_sample_file(filename)
+    assert np.array_equal(lnprob[:10],np.zeros(10))
+    assert np.all(np.isnan(lnprob[10:15]))
+    assert np.array_equal(lnprob[15:],np.ones(5))
+
+    with pytest.raises(ValueError):
+        append_sample_file(filename,b,lnprob=np.ones(4))
+
+    # not a sample file
+    filename = os.path.join(tmpdir,"plain.npy")
+    np.save(filename,a)
+    with pytest.raises(ValueError):
+        append_sample_file(filename,b)
+
+def test_read_sample_file(tmpdir):
+
+    a = np.random.normal(size=(10,2))
+
+    filename = os.path.join(tmpdir,"samples.npy")
+    write_sample_file(filename,a,param_names=["m","b"],lnprob=np.ones(10))
+    for mmap_mode in [None,"r"]:
+        samples, param_names, lnprob = read_sample_file(filename,
+                                                        mmap_mode=mmap_mode)
+        assert np.array_equal(samples,a)
+        assert param_names == ["m","b"]
+        assert np.array_equal(lnprob,np.ones(10))
+
+    # Memory mapped samples are a read-only view of the file; otherwise a
+    # float64 copy
+    samples, _, _ = read_sample_file(filename,mmap_mode="r")
+    assert not samples.flags.owndata
+    assert not samples.flags.writeable
+    samples, _, _ = read_sample_file(filename)
+    assert samples.flags.writeable
+    assert samples.dtype == np.float64
+
+    # float32 samples keep their dtype when memory mapped
+    filename = os.path.join(tmpdir,"samples32.npy")
+    write_sample_file(filename,a.astype(np.float32),param_names=["m","b"],
+                      lnprob=np.ones(10))
+    samples, _, _ = read_sample_file(filename,mmap_mode="r")
+    assert samples.dtype == np.float32
+    assert not samples.flags.owndata
+    assert np.allclose(samples,a)
+    samples, _, _ = read_sample_file(filename)
+    assert samples.dtype == np.float64
+    assert np.allclose(samples,a)
+
+    # plain 2D array
+    filename = os.path.join(tmpdir,"plain.npy")
+    np.save(filename,a)
+    for mmap_mode in [None,"r"]:
+        samples, param_names, lnprob = read_sample_file(filename,
+                                                        mmap_mode=mmap_mode)
+        assert np.array_equal(samples,a)
+        assert param_names is None
+        assert lnprob is None
+    assert isinstance(samples,np.memmap)
+
+    # plain 1D array
+    filename = os.path.join(tmpdir,"plain_1d.npy")
+    np.save(filename,np.ones(3))
+    with pytest.raises(ValueError):
+        read_sample_file(filename)
+
+    # bad files
+    with pytest.raises(FileNotFoundError):
+        read_sample_file(os.path.join(tmpdir,"not_a_file.npy"))
+
+    filename = os.path.join(tmpdir,"bad.txt")
+    with open(filename,"w") as g:
+        g.write("yo")
+    with pytest.raises(ValueError):
+        read_sample_file(filename)
+
+    filename = os.path.join(tmpdir,"object.npy")
+    np.save(filename,np.array([{}],dtype=object),allow_pickle=True)
+    with pytest.raises(ValueError):
+        read_sample_file(filename)
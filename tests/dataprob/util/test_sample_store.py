@@ -0,0 +1,116 @@
+import pytest
+
+from dataprob.util.sample_store import SampleStore
+from dataprob.util.sample_store import check_sample_dtype
+from dataprob.util import sample_store
+
+import numpy as np
+
+import os
+
+def test_check_sample_dtype():
+
+    assert check_sample_dtype(np.float64) == np.dtype(np.float64)
+    assert check_sample_dtype(float) == np.dtype(np.float64)
+    assert check_sample_dtype("float32") == np.dtype(np.float32)
+
+    with pytest.raises(ValueError):
+        check_sample_dtype(int)
+    with pytest.raises(ValueError):
+        check_sample_dtype("not_a_dtype")
+    with pytest.raises(ValueError):
+        check_sample_dtype({})
+
+def test_SampleStore(tmpdir,monkeypatch):
+
+    # ------------------------------------------------------------------------
+    # in memory
+
+    store = SampleStore(num_params=3,chunk_size=4)
+    assert store.num_samples == 0
+    assert store.num_params == 3
+    assert store.dtype == np.float64
+    assert store.filename is None
+    assert store.array.shape == (0,3)
+
+    a = np.random.normal(size=(3,3))
+    out = store.append(a)
+    assert np.array_equal(out,a)
+    assert store.num_samples == 3
+    assert store.holds(out)
+    assert not store.holds(a)
+    assert store.array is out
+
+    # grows past the first chunk; earlier array still valid
+    b = np.random.normal(size=(10,3))
+    out2 = store.append(b)
+    assert np.array_equal(out2,np.concatenate((a,b)))
+    assert np.array_equal(out,a)
+    assert not store.holds(out)
+    assert store.holds(out2)
+
+    # bad shapes
+    with pytest.raises(ValueError):
+        store.append(np.ones(3))
+    with pytest.raises(ValueError):
+        store.append(np.ones((2,4)))
+
+    # clear and change width
+    store.clear()
+    assert store.num_samples == 0
+    assert store.array.shape == (0,3)
+    store.clear(num_params=2)
+    assert store.num_params == 2
+    out = store.append(np.ones((2,2)))
+    assert np.array_equal(out,np.ones((2,2)))
+
+    # float32
+    store = SampleStore(num_params=2,dtype=np.float32)
+    out = store.append(np.ones((5,2)))
+    assert out.dtype == np.float32
+    assert np.array_equal(out,np.ones((5,2)))
+
+    with pytest.raises(ValueError):
+        SampleStore(num_params=2,dtype=int)
+
+    # ------------------------------------------------------------------------
+    # on disk
+
+    filename = os.path.join(tmpdir,"samples.npy")
+    store = SampleStore(num_params=3,filename=filename)
+    assert os.path.isfile(filename)
+    assert store.filename == filename
+    assert store.array.shape == (0,3)
+
+    out = store.append(a)
+    assert isinstance(out,np.memmap)
+    assert not out.flags.writeable
+    assert np.array_equal(out,a)
+    assert store.holds(out)
+
+    out = store.append(b)
+    assert np.array_equal(out,np.concatenate((a,b)))
+    assert np.array_equal(np.load(filename),np.concatenate((a,b)))
+
+    # Large appends are written in chunks
+    monkeypatch.setattr(sample_store,"_WRITE_CHUNK",2)
+    c = np.random.normal(size=(5,3))
+    out = store.append(c)
+    assert store.num_samples == len(a) + len(b) + 5
+    assert np.array_equal(out,np.concatenate((a,b,c)))
+    monkeypatch.undo()
+
+    store.clear()
+    assert store.num_samples == 0
+    assert np.load(filename).shape == (0,3)
+
+    # file already exists
+    with pytest.raises(FileExistsError):
+        SampleStore(num_params=3,filename=filename)
+
+    # float32 on disk
+    filename = os.path.join(tmpdir,"samples32.npy")
+    store = SampleStore(num_params=3,filename=filename,dtype="float32")
+    out = store.append(a)
+    assert out.dtype == np.float32
+    assert np.allclose(out,a)
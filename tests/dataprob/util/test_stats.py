@@ -3,8 +3,12 @@ import pytest
 from dataprob.util.stats import durbin_watson
 from dataprob.util.stats import ljung_box
 from dataprob.util.stats import get_kde_max
+from dataprob.util.stats import get_sample_intervals
 
 import numpy as np
+from scipy import stats
+
+import time
 
 def test_durbin_watson():
     
@@ -98,6 +102,37 @@ def test_ljung_box():
     assert np.isclose(np.round(p,4),0.0059)
     assert np.isclose(np.round(Q,1),24.7)
 
+    # Compare to direct (slow) calculation of the test statistic
+    r = np.random.normal(0,1,500)
+    for i in range(1,len(r)):
+        r[i] = r[i] + 0.8*r[i-1]
+    centered = r - np.mean(r)
+    n = len(r)
+    prefactor = n*(n + 2)/(np.sum(centered**2))**2
+    terms = []
+    for k in range(2,n-1):
+        terms.append(np.sum(centered[k:]*centered[:-k])**2/(n - k))
+    
+    p, Q, df = ljung_box(residuals=r,num_param=0)
+    assert np.isclose(Q,prefactor*np.sum(terms))
+    assert df == n - 3
+
+    # max_lag
+    p, Q, df = ljung_box(residuals=r,num_param=1,max_lag=20)
+    assert np.isclose(Q,prefactor*np.sum(terms[:19]))
+    assert df == 20
+    assert p < 0.05
+
+    # max_lag larger than the number of lags uses all lags
+    p, Q, df = ljung_box(residuals=r,num_param=0,max_lag=10000)
+    assert np.isclose(Q,prefactor*np.sum(terms))
+    assert df == n - 3
+
+    with pytest.raises(ValueError):
+        ljung_box(residuals=r,max_lag=1)
+    with pytest.raises(ValueError):
+        ljung_box(residuals=r,max_lag="a")
+
 def test_get_kde_max():
     
     # means of 0 1 2
@@ -138,5 +173,96 @@ def test_get_kde_max():
 
     assert np.array_equal(np.round(params,0),[np.nan,1,2],equal_nan=True)
 
+    # Start from highest lnprob sample. Put the best sample right on the mode
+    # and make sure we get there
+    samples = np.random.multivariate_normal(mean=[5,0],
+                                            cov=np.eye(2,dtype=float),
+                                            size=10000)
+    lnprob = stats.multivariate_normal(mean=[5,0]).logpdf(samples)
+    params = get_kde_max(samples=samples,lnprob=lnprob)
+    assert np.array_equal(np.round(params,0),[5,0])
+
+    # non-finite lnprob are ignored
+    lnprob[:5000] = -np.inf
+    lnprob[5000:5010] = np.nan
+    params = get_kde_max(samples=samples,lnprob=lnprob)
+    assert np.array_equal(np.round(params,0),[5,0])
+
+    # all non-finite -- just start from mean
+    lnprob[:] = -np.inf
+    params = get_kde_max(samples=samples,lnprob=lnprob)
+    assert np.array_equal(np.round(params,0),[5,0])
+
+    with pytest.raises(ValueError):
+        get_kde_max(samples=samples,lnprob=lnprob[:10])
+
+    # Using fewer samples should give approximately the same answer. Using 
+    # more samples than we have should give exactly the same answer. 
+    params = get_kde_max(samples=samples,max_samples=1000)
+    assert np.array_equal(np.round(params,0),[5,0])
 
+    params_all = get_kde_max(samples=samples,max_samples=None)
+    params = get_kde_max(samples=samples,max_samples=20000)
+    assert np.array_equal(params,params_all)
+
+    with pytest.raises(ValueError):
+        get_kde_max(samples=samples,max_samples=1)
+
+    with pytest.raises(ValueError):
+        get_kde_max(samples=samples,max_samples="a")
+
+@pytest.mark.slow
+def test_get_kde_max_benchmark():
+    """
+    Compare the speed and accuracy of get_kde_max using all samples with 
+    the default subsampling for a large samples array.
+    """
+
+    mean = np.array([-1,2,8,12,8])
+    samples = np.random.multivariate_normal(mean=mean,
+                                            cov=np.eye(5,dtype=float),
+                                            size=500000)
     
+    start = time.perf_counter()
+    params_all = get_kde_max(samples=samples,max_samples=None)
+    time_all = time.perf_counter() - start
+
+    start = time.perf_counter()
+    params = get_kde_max(samples=samples)
+    time_sub = time.perf_counter() - start
+
+    print(f"all samples: {time_all:.3f} s, {params_all}")
+    print(f"subsampled:  {time_sub:.3f} s, {params}")
+
+    assert time_sub < time_all
+    assert np.all(np.abs(params - mean) < 0.5)
+    assert np.all(np.abs(params_all - mean) < 0.5)
+
+
+    
+
+def test_get_sample_intervals():
+
+    samples = np.random.normal(loc=[0,10],scale=[1,2],size=(100000,2))
+
+    # default 95%
+    intervals = get_sample_intervals(samples)
+    assert list(intervals.keys()) == ["low_95","high_95"]
+    assert np.allclose(intervals["low_95"],[-1.96,10-2*1.96],atol=0.1)
+    assert np.allclose(intervals["high_95"],[1.96,10+2*1.96],atol=0.1)
+
+    # matches np.quantile column by column
+    intervals = get_sample_intervals(samples,levels=[68,99.5])
+    assert list(intervals.keys()) == ["low_68","high_68","low_99.5","high_99.5"]
+    for i in range(2):
+        assert np.isclose(intervals["low_68"][i],np.quantile(samples[:,i],0.16))
+        assert np.isclose(intervals["high_68"][i],np.quantile(samples[:,i],0.84))
+        assert np.isclose(intervals["low_99.5"][i],np.quantile(samples[:,i],0.0025))
+        assert np.isclose(intervals["high_99.5"][i],np.quantile(samples[:,i],0.9975))
+
+    with pytest.raises(ValueError):
+        get_sample_intervals(samples,levels=[0])
+    with pytest.raises(ValueError):
+        get_sample_intervals(samples,levels=[100])
+    with pytest.raises(ValueError):
+        get_sample_intervals(samples,levels=["a"])
@@ -0,0 +1,149 @@
+import pytest
+
+from dataprob.util.worker_pool import _worker_initializer
+from dataprob.util.worker_pool import call_in_worker
+from dataprob.util.worker_pool import get_num_workers
+from dataprob.util.worker_pool import create_pool
+from dataprob.util.worker_pool import map_in_pool
+from dataprob.util.worker_pool import _check_main_importable
+from dataprob.util import worker_pool
+
+import multiprocessing
+import pickle
+import types
+
+def _scale(value,factor=1,offset=0):
+    return value*factor + offset
+
+def _raise_on_load():
+    raise ImportError("cannot import this model")
+
+class _Unloadable:
+    """
+    Pickles fine but raises when unpickled, like a model defined in a 
+    __main__ module the worker processes cannot import.
+    """
+    def __reduce__(self):
+        return (_raise_on_load,())
+
+def _reset_worker():
+    worker_pool._worker_payload = None
+    worker_pool._worker_function = None
+    worker_pool._worker_kwargs = None
+    worker_pool._worker_star = False
+
+def test_call_in_worker():
+
+    _worker_initializer(pickle.dumps((_scale,{"factor":3},False)))
+    assert worker_pool._worker_function is None
+    assert call_in_worker(2) == 6
+    assert worker_pool._worker_function is _scale
+    assert call_in_worker(3) == 9
+
+    _worker_initializer(pickle.dumps((_scale,{"offset":1},True)))
+    assert call_in_worker((2,4)) == 9
+
+    # Payload that cannot be loaded raises in the task
+    _worker_initializer(pickle.dumps((_scale,{"x":_Unloadable()},False)))
+    with pytest.raises(RuntimeError):
+        call_in_worker(2)
+
+    _reset_worker()
+
+def test_get_num_workers():
+
+    assert get_num_workers(1) == 1
+    assert get_num_workers(3) == 3
+    assert get_num_workers(0) == multiprocessing.cpu_count()
+
+    with pytest.raises(ValueError):
+        get_num_workers(-1)
+    with pytest.raises(ValueError):
+        get_num_workers(1.5)
+    with pytest.raises(ValueError) as excinfo:
+        get_num_workers("a",variable_name="num_threads")
+    assert "num_threads" in str(excinfo.value)
+
+def test__check_main_importable(monkeypatch):
+
+    fake_main = types.ModuleType("__main__")
+    fake_main.__file__ = "<stdin>"
+    monkeypatch.setitem(multiprocessing.sys.modules,"__main__",fake_main)
+
+    # fork does not re-run the main script
+    monkeypatch.setattr(multiprocessing,"get_start_method",lambda: "fork")
+    _check_main_importable()
+
+    monkeypatch.setattr(multiprocessing,"get_start_method",lambda: "spawn")
+    with pytest.raises(ValueError):
+        _check_main_importable()
+    with pytest.raises(ValueError):
+        create_pool(num_workers=2,function=_scale)
+
+    # Main script that exists is fine
+    fake_main.__file__ = worker_pool.__file__
+    _check_main_importable()
+
+    # No main script (e.g. interactive session) is fine
+    del fake_main.__file__
+    _check_main_importable()
+
+def test_create_pool():
+
+    with create_pool(num_workers=2,
+                     function=_scale,
+                     shared_kwargs={"factor":2,"offset":1}) as pool:
+        out = pool.map(call_in_worker,[1,2,3])
+    assert out == [3,5,7]
+
+    with create_pool(num_workers=2,function=_scale) as pool:
+        out = pool.map(call_in_worker,[1,2,3])
+    assert out == [1,2,3]
+
+    # Objects that cannot be pickled raise before the pool starts
+    def local_fcn(value): return value
+    with pytest.raises(ValueError):
+        create_pool(num_workers=2,function=local_fcn)
+    with pytest.raises(ValueError):
+        create_pool(num_workers=2,
+                    function=_scale,
+                    shared_kwargs={"factor":lambda x: x})
+
+def test_map_in_pool():
+
+    items = list(range(20))
+    expected = [_scale(i,factor=2) for i in items]
+
+    for num_workers in [1,2]:
+        out = map_in_pool(_scale,
+                          items,
+                          num_workers=num_workers,
+                          shared_kwargs={"factor":2})
+        assert out == expected
+
+        out = map_in_pool(_scale,
+                          iter(items),
+                          num_workers=num_workers,
+                          shared_kwargs={"factor":2},
+                          progress=True)
+        assert out == expected
+
+        out = map_in_pool(_scale,
+                          zip(items,items),
+                          num_workers=num_workers,
+                          star=True)
+        assert out == [i*i for i in items]
+
+    assert map_in_pool(_scale,[],num_workers=2) == []
+
+    # Errors loading the payload in the workers are raised rather than 
+    # restarting the workers forever
+    with pytest.raises(RuntimeError):
+        map_in_pool(_scale,
+                    [1,2,3],
+                    num_workers=2,
+                    shared_kwargs={"offset":_Unloadable()})
+
+    # Unpicklable function
+    with pytest.raises(ValueError):
+        map_in_pool(lambda x: x,[1,2,3],num_workers=2)